@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import yaml
+
+if TYPE_CHECKING:
+    from panflute import Doc
+    from rich.table import Table
+
+KEYS = {
+    "files",
+    "output",
+    "notebook-dir",
+    "defaults",
+    "citeproc",
+    "standalone",
+    "standalone-figure",
+    "write-back",
+    "extra-args",
+}
+
+OUTPUT_FORMATS = {".pdf": "pdf", ".tex": "latex"}
+
+
+@dataclass
+class Document:
+    files: list[Path]
+    output: Path
+    notebook_dir: Path | None = None
+    defaults: Path | None = None
+    citeproc: bool = False
+    standalone: bool = False
+    standalone_figure: bool = False
+    write_back: bool = True
+    extra_args: list[str] = field(default_factory=list)
+    root: Path = Path()
+
+    @property
+    def output_format(self) -> str:
+        return OUTPUT_FORMATS[self.output.suffix]
+
+
+@dataclass
+class Manifest:
+    documents: list[Document]
+    jobs: int | None = None
+
+
+@dataclass
+class Report:
+    output: Path
+    prepare: float = 0
+    convert: float = 0
+    returncode: int | None = None
+    error: str = ""
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.error or self.returncode)
+
+
+def load_manifest(path: Path) -> Manifest:
+    manifest = yaml.safe_load(path.read_text(encoding="utf8")) or {}
+
+    jobs = manifest.pop("jobs", None)
+    entries = manifest.pop("documents", None)
+
+    if not entries or not isinstance(entries, list):
+        msg = f"[panpdf] No documents in manifest: {path}"
+        raise ValueError(msg)
+
+    root = path.parent
+    documents = [create_document({**manifest, **entry}, root) for entry in entries]
+    return Manifest(documents, jobs)
+
+
+def create_document(data: dict[str, Any], root: Path) -> Document:
+    if unknown := sorted(set(data) - KEYS):
+        msg = f"[panpdf] Unknown manifest keys: {', '.join(unknown)}"
+        raise ValueError(msg)
+
+    if not data.get("files") or not data.get("output"):
+        msg = "[panpdf] Each document in manifest requires files and output"
+        raise ValueError(msg)
+
+    output = root / data["output"]
+    if output.suffix not in OUTPUT_FORMATS:
+        msg = f"[panpdf] Unknown output format in manifest: {output.name}"
+        raise ValueError(msg)
+
+    files = data["files"]
+    files = [files] if isinstance(files, str) else files
+    notebook_dir = data.get("notebook-dir")
+
+    return Document(
+        files=[root / file for file in files],
+        output=output,
+        notebook_dir=root / notebook_dir if notebook_dir else None,
+        defaults=resolve_defaults(root, data.get("defaults")),
+        citeproc=data.get("citeproc", False),
+        standalone=data.get("standalone", False),
+        standalone_figure=data.get("standalone-figure", False),
+        write_back=data.get("write-back", True),
+        extra_args=[str(arg) for arg in data.get("extra-args", [])],
+        root=root,
+    )
+
+
+def resolve_defaults(root: Path, defaults: str | None) -> Path | None:
+    if not defaults:
+        return None
+
+    if (path := root / defaults).exists():
+        return path
+
+    return Path(defaults)
+
+
+def build(  # noqa: PLR0913
+    manifest: Manifest,
+    *,
+    jobs: int | None = None,
+    cache_dir: Path | None = None,
+    pandoc_path: Path | None = None,
+    quiet: bool = False,
+    verbose: bool = False,
+) -> list[Report]:
+    from panpdf.tools import get_console
+
+    jobs = jobs or manifest.jobs
+    reports = [Report(document.output) for document in manifest.documents]
+    prepared = []
+
+    for document, report in zip(manifest.documents, reports, strict=True):
+        start = time.perf_counter()
+
+        try:
+            doc, args = prepare(
+                document,
+                jobs=jobs,
+                cache_dir=cache_dir,
+                pandoc_path=pandoc_path,
+                quiet=quiet,
+                verbose=verbose,
+            )
+
+        except Exception as e:  # noqa: BLE001
+            report.error = str(e) or e.__class__.__name__
+            get_console().log(f"[red]{document.output.name}: {report.error}")
+            continue
+
+        finally:
+            report.prepare = time.perf_counter() - start
+
+        prepared.append((doc, args, report))
+
+    if prepared:
+        convert_all(prepared, jobs=jobs, quiet=quiet, verbose=verbose)
+
+    return reports
+
+
+def prepare(  # noqa: PLR0913
+    document: Document,
+    *,
+    jobs: int | None = None,
+    cache_dir: Path | None = None,
+    pandoc_path: Path | None = None,
+    quiet: bool = False,
+    verbose: bool = False,
+) -> tuple[Doc, list[str]]:
+    from panpdf.main import (
+        create_filters,
+        create_zotero,
+        get_pgf_dirs,
+        get_store,
+        parse_files,
+        run_filters,
+    )
+    from panpdf.tools import (
+        create_pdf_args,
+        get_cache_dir,
+        get_defaults_file_path,
+        get_pandoc_path,
+        get_resource_path,
+        iter_extra_args_from_metadata,
+    )
+
+    args = []
+
+    if defaults_path := get_defaults_file_path(document.defaults):
+        args.extend(["--defaults", defaults_path.as_posix()])
+
+    resource_path = [*(get_resource_path(args) or ["."]), document.root.as_posix()]
+    args.extend(["--resource-path", os.pathsep.join(resource_path)])
+
+    doc = parse_files(
+        document.files,
+        args,
+        pandoc_path,
+        defaults_path,
+        jobs=jobs,
+        cache_dir=cache_dir,
+    )
+
+    store = get_store(document.notebook_dir) if document.notebook_dir else None
+    zotero = None
+
+    if document.citeproc:
+        zotero = create_zotero(doc, cache_dir=cache_dir, verbose=verbose)
+
+    cache_dir = cache_dir or get_cache_dir()
+    pgf_dir, pgf_base = get_pgf_dirs(
+        document.output,
+        document.output_format,
+        cache_dir,
+    )
+
+    filters = create_filters(
+        store,
+        zotero,
+        defaults=defaults_path,
+        standalone=document.standalone_figure,
+        pandoc_path=pandoc_path,
+        jobs=jobs,
+        cache_dir=cache_dir,
+        write_back=document.write_back,
+        pgf_dir=pgf_dir,
+        pgf_base=pgf_base,
+    )
+    doc = run_filters(filters, doc)
+
+    args.extend(
+        iter_extra_args_from_metadata(doc, resource_path, defaults=document.defaults),
+    )
+
+    if document.citeproc:
+        args.append("--citeproc")
+
+    args.extend(["--output", document.output.as_posix(), *document.extra_args])
+    document.output.parent.mkdir(parents=True, exist_ok=True)
+
+    if document.output_format == "pdf":
+        args = create_pdf_args(extra_args=args, pandoc_path=pandoc_path, quiet=quiet)
+        return doc, args
+
+    args.extend(["--from", "json", "--to", "latex"])
+
+    if document.standalone:
+        args.append("--standalone")
+
+    return doc, [str(pandoc_path or get_pandoc_path()), *args]
+
+
+def convert_all(
+    prepared: list[tuple[Doc, list[str], Report]],
+    *,
+    jobs: int | None = None,
+    quiet: bool = False,
+    verbose: bool = False,
+) -> None:
+    from panpdf.tools import (
+        create_loggers,
+        create_progress,
+        create_tex_env,
+        get_resource_path,
+        run,
+    )
+
+    with create_progress(transient=quiet) as progress:
+        description = f"[green]Converting {len(prepared)} document(s)"
+        task = progress.add_task(description, total=len(prepared))
+
+        stdout, stderr = create_loggers(progress, verbose=verbose)
+
+        async def run_all() -> None:
+            semaphore = asyncio.Semaphore(jobs or os.cpu_count() or 1)
+
+            async def run_one(doc: Doc, args: list[str], report: Report) -> None:
+                async with semaphore:
+                    start = time.perf_counter()
+                    env = create_tex_env(get_resource_path(args))
+                    report.returncode = await run(args, stdout, stderr, doc, env=env)
+                    report.convert = time.perf_counter() - start
+
+                progress.advance(task)
+
+            await asyncio.gather(*(run_one(*x) for x in prepared))
+
+        asyncio.run(run_all())
+
+        failed = any(report.failed for _, _, report in prepared)
+        description = "[red bold]Fail" if failed else "[green bold]Done"
+        progress.update(task, description=description)
+
+
+def create_table(reports: list[Report]) -> Table:
+    from rich.table import Table
+
+    table = Table(title="Build")
+    table.add_column("Document")
+    table.add_column("Prepare (s)", justify="right")
+    table.add_column("Convert (s)", justify="right")
+    table.add_column("Status")
+
+    for report in reports:
+        if report.error:
+            status = f"[red]Error: {report.error}"
+        elif report.returncode:
+            status = f"[red]Fail ({report.returncode})"
+        else:
+            status = "[green]Done"
+
+        table.add_row(
+            Path(os.path.relpath(report.output)).as_posix(),
+            f"{report.prepare:.3f}",
+            f"{report.convert:.3f}",
+            status,
+        )
+
+    return table
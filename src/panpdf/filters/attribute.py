@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import html
+import re
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, ClassVar
 
@@ -30,6 +32,7 @@ if TYPE_CHECKING:
 @dataclass(repr=False)
 class Attribute(Filter):
     types: ClassVar[Any] = Table | Figure | Para
+    pandoc: bool = False
 
     def action(
         self,
@@ -37,15 +40,15 @@ class Attribute(Filter):
         doc: Doc | None,
     ) -> Table | Figure | Para:
         if isinstance(elem, Table):
-            return set_attributes_table(elem)
+            return set_attributes_table(elem, pandoc=self.pandoc)
 
         if isinstance(elem, Figure):
             return set_attributes_figure(elem)
 
         if isinstance(elem.content[0], Image):
-            return set_attributes_image(elem)
+            return set_attributes_image(elem, pandoc=self.pandoc)
 
-        return set_attributes_math(elem)
+        return set_attributes_math(elem, pandoc=self.pandoc)
 
 
 def iter_attributes(elems: Iterable[Element]) -> Iterator[tuple[Element, bool]]:
@@ -103,28 +106,168 @@ def split_attribute(elems: Iterable[Element]) -> tuple[list[Element], str]:
     return content, pf.stringify(Plain(*attr))
 
 
-def set_attributes(elem: Element, attrs: Iterable[Element]) -> list[Element] | None:
+def set_attributes(
+    elem: Element,
+    attrs: Iterable[Element],
+    *,
+    pandoc: bool = False,
+) -> list[Element] | None:
     keys = ["identifier", "classes", "attributes"]
     if any(getattr(elem, key, None) for key in keys):
         return None
 
     rest, text = split_attribute(attrs)
-    code = pf.convert_text(f"`__panpdf__`{text}")[0].content[0]  # type:ignore
 
-    for key in keys:
-        setattr(elem, key, getattr(code, key))
+    if pandoc or (values := parse_attributes(text)) is None:
+        values = parse_attributes_pandoc(text)
+
+    for key, value in zip(keys, values, strict=True):
+        setattr(elem, key, value)
 
     return rest
 
 
-def set_attributes_table(table: Table) -> Table:
+Attributes = tuple[str, list[str], dict[str, str]]
+
+
+def parse_attributes_pandoc(text: str) -> Attributes:
+    code = pf.convert_text(f"`__panpdf__`{text}")[0].content[0]  # type:ignore
+    return code.identifier, list(code.classes), dict(code.attributes)
+
+
+def parse_attributes(text: str) -> Attributes | None:  # noqa: C901, PLR0911, PLR0912
+    if not text:
+        return "", [], {}
+
+    if not text.startswith("{"):
+        return None
+
+    identifier = ""
+    classes: list[str] = []
+    attributes: dict[str, str] = {}
+
+    pos = 1
+    while True:
+        pos = _skip_spaces(text, pos)
+
+        if pos >= len(text):
+            return None
+
+        c = text[pos]
+
+        if c == "}":
+            return identifier, classes, attributes
+
+        if c == "#":
+            end = _scan_name(text, pos + 1, first=False)
+            if end == pos + 1:
+                return None
+            identifier = text[pos + 1 : end]
+
+        elif c == ".":
+            end = _scan_name(text, pos + 1)
+            if end == pos + 1:
+                return None
+            classes.append(text[pos + 1 : end])
+
+        elif c == "-":
+            end = pos + 1
+            classes.append("unnumbered")
+
+        else:
+            end = _scan_name(text, pos)
+            if end == pos or not text.startswith("=", end):
+                return None
+
+            key = text[pos:end]
+            value, end = _scan_value(text, end + 1)
+
+            if key == "id":
+                identifier = value
+            elif key == "class":
+                classes.extend(value.split())
+            else:
+                attributes[key] = value
+
+        pos = end
+
+
+NAME_CHARS = "-_:."
+SPACES = " \t\n\r"
+ENTITY_PATTERN = re.compile(r"&#?[0-9A-Za-z]+;")
+
+
+def _skip_spaces(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in SPACES:
+        pos += 1
+
+    return pos
+
+
+def _scan_name(text: str, pos: int, *, first: bool = True) -> int:
+    if first:
+        if pos >= len(text) or not text[pos].isalpha():
+            return pos
+        pos += 1
+
+    while pos < len(text) and (text[pos].isalnum() or text[pos] in NAME_CHARS):
+        pos += 1
+
+    return pos
+
+
+def _scan_escape(text: str, pos: int) -> tuple[str, int]:
+    if text[pos] == "\\" and pos + 1 < len(text) and not text[pos + 1].isalnum():
+        return text[pos + 1], pos + 2
+
+    return text[pos], pos + 1
+
+
+def _scan_value(text: str, pos: int) -> tuple[str, int]:
+    if pos < len(text) and (quote := text[pos]) in "\"'":
+        if text.startswith(quote, pos + 1):
+            return "", pos + 2
+
+        if (quoted := _scan_quoted(text, pos + 1, quote)) is not None:
+            return quoted
+
+    chars = []
+    while pos < len(text) and text[pos] not in f"{SPACES}}}":
+        c, pos = _scan_escape(text, pos)
+        chars.append(c)
+
+    return "".join(chars), pos
+
+
+def _scan_quoted(text: str, pos: int, quote: str) -> tuple[str, int] | None:
+    if pos >= len(text) or text[pos] in SPACES:
+        return None
+
+    chars = []
+    while pos < len(text):
+        if text[pos] == quote:
+            return "".join(chars), pos + 1
+
+        m = ENTITY_PATTERN.match(text, pos)
+        if m and (entity := html.unescape(m.group())) != m.group():
+            chars.append(entity)
+            pos = m.end()
+            continue
+
+        c, pos = _scan_escape(text, pos)
+        chars.append(" " if c == "\n" else c)
+
+    return None
+
+
+def set_attributes_table(table: Table, *, pandoc: bool = False) -> Table:
     if not table.caption.content:
         return table
 
     plain = table.caption.content[0]
 
     if isinstance(plain, Plain):
-        elems = set_attributes(table, plain.content)
+        elems = set_attributes(table, plain.content, pandoc=pandoc)
 
         if elems:
             table.caption = Caption(Plain(*elems))
@@ -144,11 +287,15 @@ def set_attributes_figure(figure: Figure) -> Figure:
     return figure
 
 
-def set_attributes_math(para: Para) -> Para:
-    return Para(*_iter_elements(para.content))
+def set_attributes_math(para: Para, *, pandoc: bool = False) -> Para:
+    return Para(*_iter_elements(para.content, pandoc=pandoc))
 
 
-def _iter_elements(elems: Iterable[Element]) -> Iterator[Element]:
+def _iter_elements(
+    elems: Iterable[Element],
+    *,
+    pandoc: bool = False,
+) -> Iterator[Element]:
     collected: list[Element] = []
 
     for elem in elems:
@@ -161,7 +308,7 @@ def _iter_elements(elems: Iterable[Element]) -> Iterator[Element]:
 
         elif isinstance(elem, Str) and elem.text.endswith("}"):
             collected[0] = Span(collected[0])
-            set_attributes(collected[0], (*collected[1:], elem))
+            set_attributes(collected[0], (*collected[1:], elem), pandoc=pandoc)
 
             yield collected[0]
             collected.clear()
@@ -184,10 +331,10 @@ def split_image(para: Para) -> tuple[list[Image], list[Element]]:
     return images, rest
 
 
-def set_attributes_image(para: Para) -> Figure:
+def set_attributes_image(para: Para, *, pandoc: bool = False) -> Figure:
     images, elems = split_image(para)
     figure = Figure(Plain(*images))
-    rest = set_attributes(figure, elems)
+    rest = set_attributes(figure, elems, pandoc=pandoc)
 
     if rest and rest[0] == Str(":"):
         figure.caption = Caption(Plain(*strip_elements(rest[1:])))
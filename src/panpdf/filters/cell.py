@@ -1,34 +1,79 @@
 from __future__ import annotations
 
+import json
+import re
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, ClassVar
 
 import nbstore.notebook
 import panflute as pf
-from panflute import CodeBlock, Doc, Element, Figure, Image, Plain
+from panflute import CodeBlock, Doc, Element, Figure, Image, Para, Plain
+from panflute.elements import from_json
 
 from panpdf.filters.filter import Filter
+from panpdf.tools import get_hash
 
 if TYPE_CHECKING:
     from nbstore import Store
 
+HTML_CACHE: dict[str, str] = {}
+
+HTML_CACHE_SIZE = 256
+
+HTML_PREFIX = "panpdf-html-"
+
+HEADING_PATTERN = re.compile(r"<h[1-6][\s>]", re.IGNORECASE)
+
 
 @dataclass(repr=False)
 class Cell(Filter):
     types: ClassVar[type[Figure]] = Figure
     store: Store
 
-    def action(self, figure: Figure, doc: Doc) -> Figure | list[Element]:  # noqa: C901, PLR0911
-        if not figure.content:
-            return figure
+    def prepare(self, doc: Doc) -> None:
+        store_url = url = self.store.url
+        texts = []
 
-        plain = figure.content[0]
+        def collect(elem: Element, doc: Doc) -> None:  # noqa: ARG001
+            nonlocal url
 
-        if not isinstance(plain, Plain):
-            return figure
+            if isinstance(elem, Image) and elem.url.endswith(".ipynb"):
+                url = elem.url
+
+            # Images without a caption are still a Para before Attribute runs.
+            if isinstance(elem, Figure):
+                image = get_image(elem)
+            elif isinstance(elem, Para) and isinstance(elem.content[0], Image):
+                image = elem.content[0]
+            else:
+                return
+
+            if not image:
+                return
+
+            classes = image.classes
+            if "html" not in classes or not ("output" in classes or "cell" in classes):
+                return
 
-        image = plain.content[0]
-        if not isinstance(image, Image):
+            try:
+                nb = self.store.read(image.url or url)
+                identifier = image.identifier or getattr(elem, "identifier", "")
+                data = nbstore.notebook.get_data(nb, identifier)
+            except ValueError:
+                return
+
+            if "text/html" in data:
+                texts.append(data["text/html"])
+
+        try:
+            doc.walk(collect)
+        finally:
+            self.store.url = store_url
+
+        convert_html_all(texts)
+
+    def action(self, figure: Figure, doc: Doc) -> Figure | list[Element]:  # noqa: C901, PLR0911
+        if not (image := get_image(figure)):
             return figure
 
         url = image.url
@@ -93,8 +138,7 @@ class Cell(Filter):
             return None
 
         if "text/html" in data and html:
-            text = data["text/html"]
-            return pf.convert_text(text, input_format="html")  # type: ignore
+            return convert_html(data["text/html"])
 
         if "text/plain" in data:
             text = data["text/plain"]
@@ -102,3 +146,72 @@ class Cell(Filter):
             return [CodeBlock(text.rstrip(), classes=["output"])]
 
         return None
+
+
+def get_image(figure: Figure) -> Image | None:
+    if not figure.content:
+        return None
+
+    plain = figure.content[0]
+
+    if not isinstance(plain, Plain):
+        return None
+
+    image = plain.content[0]
+    return image if isinstance(image, Image) else None
+
+
+def convert_html(text: str) -> list[Element]:
+    key = get_hash(text)
+
+    if (blocks := HTML_CACHE.get(key)) is None:
+        elems: list[Element] = pf.convert_text(text, input_format="html")  # type: ignore
+        blocks = cache_html(key, json.dumps([elem.to_json() for elem in elems]))
+
+    return json.loads(blocks, object_hook=from_json)
+
+
+def cache_html(key: str, blocks: str) -> str:
+    HTML_CACHE[key] = blocks
+
+    while len(HTML_CACHE) > HTML_CACHE_SIZE:
+        del HTML_CACHE[next(iter(HTML_CACHE))]
+
+    return blocks
+
+
+def convert_html_all(texts: list[str]) -> None:
+    """Convert HTML outputs in one pandoc run to fill the cache."""
+    texts = [text for text in dict.fromkeys(texts) if get_hash(text) not in HTML_CACHE]
+
+    # Pandoc makes header identifiers unique over its whole input, so a
+    # fragment with headings is converted on its own.
+    texts = [text for text in texts if not HEADING_PATTERN.search(text)]
+
+    if len(texts) < 2:  # noqa: PLR2004
+        return
+
+    it = (
+        f'<div id="{HTML_PREFIX}{k}">\n{text}\n</div>' for k, text in enumerate(texts)
+    )
+
+    try:
+        output: str = pf.convert_text(
+            "\n".join(it),
+            input_format="html",
+            output_format="json",
+            standalone=True,
+        )  # type: ignore
+    except OSError:
+        return
+
+    divs = json.loads(output)["blocks"]
+    ids = [f"{HTML_PREFIX}{k}" for k in range(len(texts))]
+
+    # Unbalanced tags in a fragment break the split. Each fragment is then
+    # converted on its own when the cell is processed.
+    if [div["t"] == "Div" and div["c"][0][0] for div in divs] != ids:
+        return
+
+    for text, div in zip(texts, divs, strict=True):
+        cache_html(get_hash(text), json.dumps(div["c"][1]))
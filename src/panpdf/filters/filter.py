@@ -6,6 +6,8 @@ from typing import TYPE_CHECKING
 import panflute as pf
 from panflute import Doc, Element
 
+from panpdf.profiler import PROFILER
+
 if TYPE_CHECKING:
     from typing import Any
 
@@ -19,28 +21,34 @@ class Filter:
         return f"{self.__class__.__name__}()"
 
     def _prepare(self, doc: Doc):
-        self.prepare(doc)
+        with PROFILER.stage(self.__class__.__name__):
+            self.prepare(doc)
 
     def prepare(self, doc: Doc):
         pass
 
     def _action(self, elem: Element, doc: Doc):
         if isinstance(elem, self.types):
-            elems = self.action(elem, doc)
+            return self._apply(elem, doc)
+
+        return None
 
-            if elems != []:
-                self.elements.append(elem)
+    def _apply(self, elem: Element, doc: Doc):
+        with PROFILER.stage(self.__class__.__name__):
+            elems = self.action(elem, doc)
 
-            return elems
+        if elems != []:
+            self.elements.append(elem)
 
-        return None
+        return elems
 
     def action(self, elem: Element, doc: Doc):
         pass
 
     def _finalize(self, doc: Doc):
         if self.elements:
-            self.finalize(doc)
+            with PROFILER.stage(self.__class__.__name__):
+                self.finalize(doc)
 
     def finalize(self, doc: Doc):
         pass
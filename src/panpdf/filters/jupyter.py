@@ -2,23 +2,44 @@ from __future__ import annotations
 
 import base64
 import io
+import os
 import re
+import shutil
+import sys
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, ClassVar
 
 import nbstore.notebook
+import panflute as pf
 import yaml
-from panflute import Doc, Element, Image, Plain, RawInline
+from panflute import Doc, Element, Figure, Image, Plain, RawInline
 
 from panpdf.filters.filter import Filter
-from panpdf.tools import add_metadata_list, convert_doc, create_temp_file
+from panpdf.filters.layout import create_draft_box
+from panpdf.profiler import PROFILER
+from panpdf.tools import (
+    DRAFT_URL,
+    PGF_PREFIX,
+    add_metadata_list,
+    create_latex_args,
+    create_pdf_args,
+    create_temp_dir,
+    create_temp_file,
+    get_console,
+    get_format,
+    get_hash,
+    get_pdf_engine,
+    progress_all,
+    prune_cache,
+    resolve_path,
+    write_cache,
+)
 
 if TYPE_CHECKING:
+    from nbformat import NotebookNode
     from nbstore import Store
 
-PGF_PREFIX = "%% Creator: Matplotlib"
-
 
 @dataclass(repr=False)
 class Jupyter(Filter):
@@ -27,10 +48,26 @@ class Jupyter(Filter):
     defaults: Path | None = None
     standalone: bool = False
     pandoc_path: Path | None = None
+    jobs: int | None = None
+    cache_dir: Path | None = None
+    write_back: bool = True
+    precompile: bool = False
+    pgf_limit: int | None = None
+    draft: bool = False
+    pgf_dir: Path | None = None
+    pgf_base: Path | None = None
     pgf: bool = field(default=False, init=False)
+    pgf_files: set[Path] = field(default_factory=set, init=False)
     preamble: str = field(default="", init=False)
+    figures: list[tuple[str, str, str, Path, Path | None]] = field(
+        default_factory=list,
+        init=False,
+    )
+    dirty: dict[str, NotebookNode] = field(default_factory=dict, init=False)
+    written: list[Path] = field(default_factory=list, init=False)
+    demoted: list[tuple[str, str, int, str]] = field(default_factory=list, init=False)
 
-    def action(self, image: Image, doc: Doc) -> Image | list[Element]:  # noqa: PLR0911
+    def action(self, image: Image, doc: Doc) -> Image | list[Element]:  # noqa: C901, PLR0911
         url = image.url
         identifier = image.identifier
 
@@ -41,6 +78,15 @@ class Jupyter(Filter):
             self.store.url = url
             return []
 
+        if self.draft:
+            image.url = DRAFT_URL
+
+            # Layout only turns images inside figures into boxes.
+            if is_in_figure(image):
+                return image
+
+            return [RawInline(create_draft_box(image), format="latex")]
+
         try:
             nb = self.store.read(url)
             data = nbstore.notebook.get_data(nb, identifier)
@@ -51,7 +97,9 @@ class Jupyter(Filter):
         if not data:
             return image
 
-        if not (url_or_text := create_image_file(data, standalone=self.standalone)):
+        data, standalone = self.demote(data, identifier)
+
+        if not (url_or_text := create_image_file(data, standalone=standalone)):
             return image
 
         if not url_or_text.startswith(PGF_PREFIX):
@@ -63,29 +111,130 @@ class Jupyter(Filter):
         if not self.preamble:
             self.preamble = get_preamble(text)
 
-        if not self.standalone:
-            image.url = text
+        if not standalone:
+            image.url = self.create_pgf_file(text)
             self.pgf = True
             return image
 
-        image.url, text = create_image_file_pgf(
-            text,
-            defaults=self.defaults,
-            preamble=self.preamble,
-            pandoc_path=self.pandoc_path,
-            description=f"Creating an image for {url}#{identifier}",
-        )
-        nbstore.notebook.add_data(nb, identifier, "application/pdf", text)
-        self.store.write(url, nb)
+        cache = self.get_cache_path(text)
+
+        if cache and cache.exists():
+            image.url = cache.as_posix()
+            return image
+
+        path = create_temp_file(None, suffix=".pdf")
+        self.figures.append((self.store.url, identifier, text, path, cache))
+        image.url = path.as_posix()
         return image
 
+    def demote(
+        self,
+        data: dict[str, str],
+        identifier: str,
+    ) -> tuple[dict[str, str], bool]:
+        if self.standalone or (size := get_pgf_size(data)) <= self.get_pgf_limit():
+            return data, self.standalone
+
+        data, fallback = demote_pgf(data)
+        self.demoted.append((self.store.url, identifier, size, fallback))
+        return data, True
+
+    def get_pgf_limit(self) -> int:
+        if self.pgf_limit is None:
+            return PGF_LIMIT
+
+        return self.pgf_limit or sys.maxsize
+
+    def create_pgf_file(self, text: str) -> str:
+        if not self.pgf_dir:
+            return text
+
+        path = create_pgf_file(text, self.pgf_dir, self.pgf_base, self.pgf_files)
+        return get_pgf_url(path, self.pgf_base)
+
+    def prune_pgf_files(self) -> None:
+        if not self.pgf_dir or not self.pgf_dir.exists():
+            return
+
+        # Next to the output, only the files of the current figures are kept.
+        size = 0 if self.pgf_base else PGF_CACHE_SIZE
+        prune_cache(self.pgf_dir, size, keep=self.pgf_files)
+
+    def get_cache_path(self, text: str) -> Path | None:
+        if not self.cache_dir:
+            return None
+
+        key = get_figure_key(text, defaults=self.defaults, preamble=self.preamble)
+        return self.cache_dir / "figures" / f"{key}.pdf"
+
     def finalize(self, doc: Doc) -> None:
+        if self.demoted:
+            self.warn_demoted()
+
+        if self.figures:
+            self.create_images()
+
+        if self.write_back:
+            self.flush()
+
         if not self.pgf:
             return
 
+        self.prune_pgf_files()
         path = create_temp_file(f"\\usepackage{{pgf}}{self.preamble}", suffix=".tex")
         add_metadata_list(doc, "include-in-header", path.as_posix())
 
+    def warn_demoted(self) -> None:
+        limit = format_size(self.get_pgf_limit())
+        lines = [f"[yellow]{len(self.demoted)} PGF figure(s) larger than {limit}:"]
+
+        for url, identifier, size, fallback in self.demoted:
+            lines.append(f"  {url}#{identifier}: {format_size(size)}, using {fallback}")
+
+        get_console().log("\n".join(lines))
+        self.demoted.clear()
+
+    def create_images(self) -> None:
+        n = len(self.figures)
+
+        with PROFILER.stage("figures"):
+            texts = create_image_files_pgf(
+                [(text, path) for _, _, text, path, _ in self.figures],
+                defaults=self.defaults,
+                preamble=self.preamble,
+                pandoc_path=self.pandoc_path,
+                jobs=self.jobs,
+                description=f"Creating {n} image{'s' if n > 1 else ''}",
+                precompile=self.precompile,
+                cache_dir=self.cache_dir,
+            )
+
+        for (url, identifier, _, path, cache), text in zip(
+            self.figures,
+            texts,
+            strict=True,
+        ):
+            if text:
+                if cache:
+                    write_cache(cache, path.read_bytes())
+
+                nb = self.store.read(url)
+                nbstore.notebook.add_data(nb, identifier, "application/pdf", text)
+                self.dirty[url] = nb
+
+        self.figures.clear()
+
+    def flush(self) -> None:
+        for url, nb in self.dirty.items():
+            self.store.write(url, nb)
+            self.written.append(self.store.find_path(url))
+
+        self.dirty.clear()
+
+
+PGF_LIMIT = 2_000_000
+
+PGF_CACHE_SIZE = 200_000_000
 
 PREAMBLE_PATTERN = re.compile(
     r"^%% Matplotlib used the following preamble\n(.+?)\n%%\n",
@@ -109,12 +258,97 @@ def get_preamble(text: str) -> str:
     return ""
 
 
-def create_image_file(data: dict[str, str], *, standalone: bool = False) -> str | None:
+RASTER_PATTERN = re.compile(r"\{([^{}]+\.(?:png|jpe?g))\}")
+
+
+def normalize_pgf(text: str) -> str:
+    """Replace the per-process temporary raster paths with their content hash."""
+
+    def replace(match: re.Match[str]) -> str:
+        path = Path(match.group(1))
+
+        if not path.is_file():
+            return match.group(0)
+
+        return f"{{{get_hash(path.read_bytes())}{path.suffix}}}"
+
+    return RASTER_PATTERN.sub(replace, text)
+
+
+def get_figure_key(
+    text: str,
+    *,
+    defaults: Path | None = None,
+    preamble: str = "",
+) -> str:
+    parts: list[str | bytes] = [normalize_pgf(text), preamble]
+    engine = "xelatex" if "\\usepackage{fontspec}" in preamble else "pdflatex"
+
+    if defaults:
+        with defaults.open("r", encoding="utf8") as f:
+            config: dict[str, Any] = yaml.safe_load(f) or {}
+
+        engine = config.get("pdf-engine", engine)
+        parts.append(yaml.dump(config, sort_keys=True))
+
+        in_header = config.get("include-in-header", [])
+
+        if isinstance(in_header, str):
+            in_header = [in_header]
+
+        paths = (Path(resolve_path(defaults, name)) for name in in_header)
+        parts.extend(path.read_bytes() for path in paths if path.is_file())
+
+    return get_hash(*parts, engine)
+
+
+def get_pgf_text(data: dict[str, str]) -> str | None:
     if text := data.get("text/pgf"):
-        text_pgf = base64.b64decode(text).decode(encoding="utf-8")
-    else:
-        text = data.get("text/plain", "")
-        text_pgf = text if text.startswith(PGF_PREFIX) else None
+        return base64.b64decode(text).decode(encoding="utf-8")
+
+    text = data.get("text/plain", "")
+    return text if text.startswith(PGF_PREFIX) else None
+
+
+def get_pgf_size(data: dict[str, str]) -> int:
+    return len(text.encode("utf-8")) if (text := get_pgf_text(data)) else 0
+
+
+def demote_pgf(data: dict[str, str]) -> tuple[dict[str, str], str]:
+    """Drop PGF in favor of another output, or mark it for a standalone build."""
+    if not (mime := get_image_mime(data)):
+        return data, "a standalone build"
+
+    it = data.items()
+    return {k: v for k, v in it if k != "text/pgf" and not is_pgf(k, v)}, mime
+
+
+def get_image_mime(data: dict[str, str]) -> str | None:
+    """Return the MIME type `create_image_file` uses when PGF is dropped."""
+    for mime in ("application/pdf", "image/svg+xml"):
+        if mime in data:
+            return mime
+
+    return next((mime for mime in data if mime.startswith("image/")), None)
+
+
+def is_in_figure(image: Image) -> bool:
+    return isinstance(image.parent, Plain) and isinstance(image.parent.parent, Figure)
+
+
+def is_pgf(mime: str, text: str) -> bool:
+    return mime == "text/plain" and text.startswith(PGF_PREFIX)
+
+
+def format_size(size: int) -> str:
+    if size >= sys.maxsize:
+        return "unlimited"
+
+    return f"{size / 1e6:.1f} MB" if size >= 1e6 else f"{size / 1e3:.0f} kB"  # noqa: PLR2004
+
+
+def create_image_file(data: dict[str, str], *, standalone: bool = False) -> str | None:
+    text_pgf = get_pgf_text(data)
 
     if not standalone and text_pgf:
         return text_pgf
@@ -129,14 +363,59 @@ def create_image_file(data: dict[str, str], *, standalone: bool = False) -> str
     if text_pgf:
         return text_pgf
 
-    for mime, text in data.items():
-        if mime.startswith("image/"):
-            ext = mime.split("/")[1]
-            return create_image_file_base64(text, f".{ext}")
+    if mime := get_image_mime(data):
+        ext = mime.split("/")[1]
+        return create_image_file_base64(data[mime], f".{ext}")
 
     return None
 
 
+def create_pgf_file(
+    text: str,
+    directory: Path,
+    base: Path | None = None,
+    files: set[Path] | None = None,
+) -> Path:
+    """Write the PGF text and its rasters to the directory under their hashes.
+
+    The raster paths in the text are made relative to base, or absolute
+    without it, so the file name is stable across processes.
+    """
+    files = set() if files is None else files
+
+    def replace(match: re.Match[str]) -> str:
+        path = Path(match.group(1))
+
+        if not path.is_file():
+            return match.group(0)
+
+        data = path.read_bytes()
+        path = write_file(directory / f"{get_hash(data)}{path.suffix}", data)
+        files.add(path)
+        return f"{{{get_pgf_url(path, base)}}}"
+
+    text = RASTER_PATTERN.sub(replace, text)
+    path = write_file(directory / f"{get_hash(text)}.pgf", text.encode("utf-8"))
+    files.add(path)
+    return path
+
+
+def write_file(path: Path, data: bytes) -> Path:
+    if path.exists():
+        path.touch()  # Recently used files are kept when the cache is pruned.
+    else:
+        write_cache(path, data)
+
+    return path
+
+
+def get_pgf_url(path: Path, base: Path | None = None) -> str:
+    if base is None:
+        return path.absolute().as_posix()
+
+    return Path(os.path.relpath(path, base)).as_posix()
+
+
 def create_image_file_base64(text: str, suffix: str) -> str:
     data = base64.b64decode(text)
     path = create_temp_file(data, suffix=suffix)
@@ -162,24 +441,104 @@ def create_image_file_pgf(
     pandoc_path: Path | None = None,
     description: str = "",
 ) -> tuple[str, str]:
-    doc = Doc(Plain(RawInline(text, format="latex")))
+    path = create_temp_file(None, suffix=".pdf")
+
+    texts = create_image_files_pgf(
+        [(text, path)],
+        defaults=defaults,
+        preamble=preamble,
+        pandoc_path=pandoc_path,
+        description=description,
+    )
+
+    return path.as_posix(), texts[0]
+
+
+def create_image_files_pgf(  # noqa: PLR0913
+    figures: list[tuple[str, Path]],
+    *,
+    defaults: Path | None = None,
+    preamble: str = "",
+    pandoc_path: Path | None = None,
+    jobs: int | None = None,
+    description: str = "",
+    precompile: bool = False,
+    cache_dir: Path | None = None,
+) -> list[str]:
     defaults = create_defaults_for_standalone(defaults, preamble)
 
-    path = create_temp_file(None, suffix=".pdf")
-    extra_args = ["--defaults", defaults.as_posix(), "--output", path.as_posix()]
+    if not precompile or not compile_image_files_pgf(
+        figures,
+        defaults,
+        pandoc_path=pandoc_path,
+        jobs=jobs,
+        description=description,
+        cache_dir=cache_dir,
+    ):
+        args_list = []
+        docs = []
+        for text, path in figures:
+            extra_args = [
+                "--defaults",
+                defaults.as_posix(),
+                "--output",
+                path.as_posix(),
+            ]
+            args = create_pdf_args(extra_args=extra_args, pandoc_path=pandoc_path)
+            args_list.append(args)
+            docs.append(Doc(Plain(RawInline(text, format="latex"))))
+
+        progress_all(args_list, f"[green]{description}", docs=docs, jobs=jobs)
+
+    return [base64.b64encode(path.read_bytes()).decode() for _, path in figures]
+
 
-    convert_doc(
+FIGURE_PLACEHOLDER = "PANPDF__FIGURE"
+
+
+def compile_image_files_pgf(  # noqa: PLR0913
+    figures: list[tuple[str, Path]],
+    defaults: Path,
+    *,
+    pandoc_path: Path | None = None,
+    jobs: int | None = None,
+    description: str = "",
+    cache_dir: Path | None = None,
+) -> bool:
+    # All standalone figures share one preamble, so a single pandoc run gives
+    # the template and every figure is compiled against the dumped format.
+    args = ["--defaults", defaults.as_posix()]
+    engine, engine_opts = get_pdf_engine(args[:])
+
+    doc = Doc(Plain(RawInline(FIGURE_PLACEHOLDER, format="latex")))
+    tex: str = pf.convert_text(
         doc,
-        output_format="pdf",
+        input_format="panflute",
+        output_format="latex",
         standalone=True,
-        extra_args=extra_args,
+        extra_args=args,
         pandoc_path=pandoc_path,
-        description=description,
-    )
+    )  # type: ignore
 
-    data = path.read_bytes()
-    text = base64.b64encode(data).decode()
-    return path.as_posix(), text
+    if not (fmt := get_format(tex, engine=engine, cache_dir=cache_dir)):
+        return False
+
+    build_dir = create_temp_dir()
+    args_list = []
+
+    for k, (text, _) in enumerate(figures):
+        path = build_dir / f"{k}.tex"
+        path.write_text(tex.replace(FIGURE_PLACEHOLDER, text), encoding="utf8")
+        args = create_latex_args(path, engine=engine, engine_opts=engine_opts, fmt=fmt)
+        args_list.append(args)
+
+    progress_all(args_list, f"[green]{description}", jobs=jobs)
+
+    for k, (_, path) in enumerate(figures):
+        if (pdf := build_dir / f"{k}.pdf").exists():
+            shutil.copyfile(pdf, path)
+
+    return True
 
 
 def create_defaults_for_standalone(
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, ClassVar
 
@@ -13,16 +14,17 @@ from panflute import (
     Math,
     Plain,
     RawInline,
+    SoftBreak,
+    Space,
     Span,
     Str,
 )
 
 from panpdf.filters.filter import Filter
-from panpdf.filters.jupyter import PGF_PREFIX
-from panpdf.tools import add_metadata_list, create_temp_file
+from panpdf.tools import DRAFT_URL, PGF_PREFIX, add_metadata_list, create_temp_file
 
 if TYPE_CHECKING:
-    from collections.abc import Iterator
+    from collections.abc import Iterable, Iterator
     from typing import Any
 
 
@@ -110,9 +112,34 @@ def get_images(figure: Figure) -> list[Image]:
     return [image for image in plain.content if isinstance(image, Image)]
 
 
-def create_figure_from_image(image: Image) -> Figure:
+def get_raw_tex(image: Image) -> str | None:
     if image.url.startswith(PGF_PREFIX):
-        plain = Plain(RawInline(image.url, format="latex"))
+        return image.url
+
+    if image.url.endswith(".pgf"):
+        return f"\\input{{{image.url}}}"
+
+    if image.url == DRAFT_URL:
+        return create_draft_box(image)
+
+    return None
+
+
+def create_draft_box(image: Image) -> str:
+    attrs = image.attributes
+    width = format_dimension(attrs.get("width", ""), "\\linewidth") or "\\linewidth"
+    height = format_dimension(attrs.get("height", ""), "\\textheight")
+    height = height or f"\\dimexpr({width})*3/4\\relax"
+    label = image.identifier.translate(str.maketrans(ALT_ESCAPE))
+
+    parbox = f"\\parbox[c][{height}][c]{{\\dimexpr({width})-2\\fboxrule\\relax}}"
+    fbox = f"\\fbox{{{parbox}{{\\centering\\ttfamily {label}}}}}"
+    return f"{{\\setlength{{\\fboxsep}}{{0pt}}{fbox}}}"
+
+
+def create_figure_from_image(image: Image) -> Figure:
+    if tex := get_raw_tex(image):
+        plain = Plain(RawInline(tex, format="latex"))
     else:
         plain = Plain(image)
 
@@ -122,11 +149,8 @@ def create_figure_from_image(image: Image) -> Figure:
 
 
 def iter_subfigure_elements(image: Image, env: str, width: str) -> Iterator[Element]:
-    fig = create_figure_from_image(image)
-    fig.caption = Caption(Plain(Str("XXX")))
-
-    tex = pf.convert_text(fig, input_format="panflute", output_format="latex")
-    if not isinstance(tex, str):
+    tex = create_figure_tex(image) or create_figure_tex_pandoc(image)
+    if not tex:
         return
 
     tex = tex.replace(",height=\\textheight", "")
@@ -139,6 +163,101 @@ def iter_subfigure_elements(image: Image, env: str, width: str) -> Iterator[Elem
     yield RawInline(f"}}{tail}", format="latex")
 
 
+def create_figure_tex_pandoc(image: Image) -> str | None:
+    fig = create_figure_from_image(image)
+    fig.caption = Caption(Plain(Str("XXX")))
+
+    tex = pf.convert_text(fig, input_format="panflute", output_format="latex")
+    return tex if isinstance(tex, str) else None
+
+
+def create_figure_tex(image: Image) -> str | None:
+    if not (body := get_raw_tex(image) or create_includegraphics(image)):
+        return None
+
+    if (label := image.identifier) and not LABEL_PATTERN.match(label):
+        return None
+
+    label = f"\\label{{{label}}}" if label else ""
+    head = f"\\begin{{figure}}\n\\centering\n{body}\n"
+    return f"{head}\\caption{{XXX}}{label}\n\\end{{figure}}"
+
+
+LABEL_PATTERN = re.compile(r"^[A-Za-z0-9_+:.\-]+$")
+URL_PATTERN = re.compile(r"^[\w\-./:~+,@=' ]+$")
+DIMENSION_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)(cm|mm|in|em|pt|%)$")
+ALT_PATTERN = re.compile(r"[\\~^<>|'\"\[\]`]|--")
+ALT_ESCAPE = {c: f"\\{c}" for c in "%_{}&$#"}
+
+
+def create_includegraphics(image: Image) -> str | None:
+    url = image.url
+    if url.lower().endswith(".svg") or not URL_PATTERN.match(url):
+        return None
+
+    if any(key in image.attributes for key in ["page", "trim", "clip"]):
+        return None
+
+    width = image.attributes.get("width")
+    height = image.attributes.get("height")
+
+    options = []
+    for name, value, default in [
+        ("width", width, "\\linewidth"),
+        ("height", height, "\\textheight"),
+    ]:
+        if value:
+            if (dim := format_dimension(value, default)) is None:
+                return None
+            options.append(f"{name}={dim}")
+        elif width or height:
+            options.append(f"{name}={default}")
+
+    if not (width and height):
+        options.append("keepaspectratio")
+
+    if image.content:
+        if (alt := format_alt(image.content)) is None:
+            return None
+        options.append(f"alt={{{alt}}}")
+
+    tex = f"\\includegraphics[{','.join(options)}]{{{url}}}"
+    return tex if width or height else f"\\pandocbounded{{{tex}}}"
+
+
+def format_dimension(value: str, default: str) -> str | None:
+    if not (m := DIMENSION_PATTERN.match(value)):
+        return None
+
+    number, unit = m.groups()
+
+    if unit == "%":
+        return f"{format_number(float(number) / 100)}{default}"
+
+    return f"{format_number(float(number))}{unit}"
+
+
+def format_number(value: float) -> str:
+    return f"{value:.5f}".rstrip("0").rstrip(".")
+
+
+def format_alt(elems: Iterable[Element]) -> str | None:
+    texts = []
+    for elem in elems:
+        if isinstance(elem, Str):
+            texts.append(elem.text)
+        elif isinstance(elem, Space | SoftBreak):
+            texts.append(" ")
+        else:
+            return None
+
+    text = "".join(texts)
+    if ALT_PATTERN.search(text):
+        return None
+
+    return text.translate(str.maketrans(ALT_ESCAPE))
+
+
 def get_width(image: Image, name: str) -> str:
     width = image.attributes.get(name, "")
 
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+import panflute as pf
+from panflute import Doc, Element
+from panflute.containers import DictContainer, ListContainer
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+    from panpdf.filters.filter import Filter
+
+
+@dataclass(repr=False)
+class Pipeline:
+    filters: list[Filter] = field(default_factory=list)
+    dispatch: dict[type, list[int]] = field(default_factory=dict, init=False)
+
+    def __repr__(self) -> str:
+        names = ", ".join(repr(filter_) for filter_ in self.filters)
+        return f"{self.__class__.__name__}([{names}])"
+
+    def run(self, doc: str | Doc | None = None) -> Doc:
+        if isinstance(doc, str):
+            doc = pf.convert_text(doc, standalone=True)  # type:ignore
+
+        if not isinstance(doc, Doc):
+            msg = "[panpdf] Pipeline requires a document"
+            raise TypeError(msg)
+
+        for filter_ in self.filters:
+            filter_._prepare(doc)  # noqa: SLF001
+
+        doc = self.walk(doc, doc, 0, len(self.filters))  # type: ignore
+
+        for filter_ in self.filters:
+            filter_._finalize(doc)  # noqa: SLF001
+
+        return doc
+
+    def match(self, elem: Element) -> list[int]:
+        cls = type(elem)
+
+        if (indices := self.dispatch.get(cls)) is None:
+            it = enumerate(self.filters)
+            indices = [i for i, f in it if isinstance(elem, f.types)]
+            self.dispatch[cls] = indices
+
+        return indices
+
+    def walk(
+        self,
+        elem: Element,
+        doc: Doc,
+        start: int,
+        stop: int,
+    ) -> Element | list[Element]:
+        # Apply filters[start:stop] to the subtree of elem in the same order as
+        # running them one after another. When the k-th filter acts on elem,
+        # the children must be done with the filters up to k, and the filters
+        # after k must see whatever the k-th filter returns.
+        index = next((i for i in self.match(elem) if start <= i < stop), None)
+
+        if index is None:
+            walk_children(elem, lambda child: self.walk(child, doc, start, stop))
+            return elem
+
+        walk_children(elem, lambda child: self.walk(child, doc, start, index + 1))
+
+        altered = self.filters[index]._apply(elem, doc)  # noqa: SLF001
+
+        if altered is None:
+            altered = elem
+
+        if index + 1 == stop:
+            return altered
+
+        if isinstance(altered, list):
+            return flatten(self.walk(e, doc, index + 1, stop) for e in altered)
+
+        return self.walk(altered, doc, index + 1, stop)
+
+
+def flatten(elems: Iterable[Element | list[Element]]) -> list[Element]:
+    flat = []
+
+    for elem in elems:
+        if isinstance(elem, list):
+            flat.extend(elem)
+        else:
+            flat.append(elem)
+
+    return flat
+
+
+def walk_children(
+    elem: Element,
+    walk: Callable[[Element], Element | list[Element]],
+) -> None:
+    for name in elem._children:  # noqa: SLF001
+        child = getattr(elem, name)
+
+        if isinstance(child, ListContainer):
+            child = flatten(walk(item) for item in child)
+        elif isinstance(child, DictContainer):
+            items = ((key, walk(value)) for key, value in child.items())
+            child = [(key, value) for key, value in items if value != []]
+        elif isinstance(child, Element):
+            child = walk(child)
+        elif child is not None:
+            raise TypeError(type(child))
+
+        setattr(elem, name, child)
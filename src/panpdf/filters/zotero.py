@@ -3,21 +3,26 @@ from __future__ import annotations
 import asyncio
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import TYPE_CHECKING, ClassVar
+from typing import TYPE_CHECKING, Any, ClassVar
 
-import aiohttp
-import pyzotero.zotero
-from aiohttp import ClientError, ClientResponse, ClientSession
 from panflute import Cite
 
+from panpdf.filters.crossref import CROSSREF_PATTERN
 from panpdf.filters.filter import Filter
+from panpdf.library import Library
+from panpdf.profiler import PROFILER
+from panpdf.tools import get_console, write_cache
 
 if TYPE_CHECKING:
-    from collections.abc import Iterator
+    from collections.abc import Mapping
+    from concurrent.futures import Future
 
-    from panflute import Doc
+    from aiohttp import ClientSession
+    from panflute import Doc, Element
 
 CSL_PATH = Path("csl.json")
 
@@ -25,7 +30,11 @@ CSL_PATH = Path("csl.json")
 @dataclass(repr=False)
 class Zotero(Filter):
     types: ClassVar[type[Cite]] = Cite
+    verbose: bool = False
+    library: Path | None = None
     keys: list[str] = field(default_factory=list, init=False)
+    prefetched: list[str] = field(default_factory=list, init=False)
+    future: Future[list[dict] | None] | None = field(default=None, init=False)
 
     def action(self, elem: Cite, doc: Doc) -> None:
         for citation in elem.citations:
@@ -33,27 +42,82 @@ class Zotero(Filter):
             if key not in self.keys:
                 self.keys.append(key)
 
+    def prefetch(self, doc: Doc) -> None:
+        if not (keys := collect_keys(doc)):
+            return
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.prefetched = keys
+        self.future = executor.submit(
+            get_items,
+            keys,
+            library=self.library,
+            verbose=self.verbose,
+        )
+        executor.shutdown(wait=False)
+
     def finalize(self, doc: Doc) -> None:
         if not self.keys:
             return
 
-        if items := get_items(self.keys):
+        with PROFILER.stage("fetch"):
+            items = self.fetch()
+
+        if items:
             doc.metadata["references"] = items
 
+    def fetch(self) -> list[dict] | None:
+        items = self.future.result() if self.future else None
 
-def get_items(keys: list[str]) -> list[dict] | None:
-    if items := get_items_path():
-        cache_keys = [item["id"] for item in items]
-        if all(key in cache_keys for key in keys):
-            return items
+        if self.future and set(self.keys) <= set(self.prefetched):
+            found = {item["id"]: item for item in items or []}
+            return [found[key] for key in self.keys if key in found] or None
 
-    if not (items := get_items_zotxt(keys)) and not (items := get_items_api(keys)):
-        return None
+        return get_items(self.keys, library=self.library, verbose=self.verbose)
+
+
+def collect_keys(doc: Doc) -> list[str]:
+    keys = {}
+
+    def action(elem: Element, doc: Doc) -> None:  # noqa: ARG001
+        if isinstance(elem, Cite) and not is_crossref(elem):
+            keys.update((citation.id, None) for citation in elem.citations)
+
+    doc.walk(action)
+    return list(keys)
+
+
+def is_crossref(elem: Cite) -> bool:
+    return bool(elem.citations) and bool(CROSSREF_PATTERN.match(elem.citations[0].id))
+
+
+def get_items(
+    keys: list[str],
+    *,
+    library: Path | None = None,
+    verbose: bool = False,
+) -> list[dict] | None:
+    cache = load_cache()
+    missing = [key for key in keys if key not in cache]
+    found = {}
+
+    if missing and library and library.exists():
+        found.update(get_items_library(library, missing))
 
-    with CSL_PATH.open("w", encoding="utf-8") as f:
-        json.dump(items, f, indent=2, ensure_ascii=False)
+    if rest := [key for key in missing if key not in found]:
+        items = get_items_zotxt(rest) or get_items_api(rest) or []
+        found.update((item["id"], item) for item in items if "id" in item)
 
-    return items
+    if found:
+        cache.update(found)
+        save_cache(cache)
+
+    if verbose:
+        hits = len(keys) - len(missing)
+        msg = f"[gray50]Zotero cache: {hits} hit(s), {len(missing)} miss(es)"
+        get_console().log(f"{msg}, {len(found)} fetched")
+
+    return [cache[key] for key in keys if key in cache] or None
 
 
 def get_items_path() -> list[dict] | None:
@@ -64,68 +128,306 @@ def get_items_path() -> list[dict] | None:
     return json.loads(cache)
 
 
-def get_items_zotxt(keys: list[str]) -> list[dict] | None:
-    urls = [get_url_zotxt(key) for key in keys]
+def get_items_library(path: Path, keys: list[str]) -> dict[str, dict]:
+    library = Library(path)
 
     try:
-        asyncio.run(gather([urls[0]], get_csl_json))
-    except ClientError:
-        return None
+        return library.get_items(keys)
+    finally:
+        library.close()
+
+
+def load_cache() -> dict[str, dict]:
+    items = get_items_path() or []
+    return {item["id"]: item for item in items if "id" in item}
+
+
+def save_cache(cache: dict[str, dict]) -> None:
+    text = json.dumps(list(cache.values()), indent=2, ensure_ascii=False)
+    write_cache(CSL_PATH, text.encode("utf-8"))
+
+
+def get_items_zotxt(keys: list[str]) -> list[dict] | None:
+    if not keys:
+        return []
+
+    return Zotxt().get_items(keys)
+
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class Zotxt:
+    host: str = "localhost"
+    port: int = 23119
+    jobs: int = 8
+    timeout: float = 10
+    retries: int = 2
+    backoff: float = 0.1
+    batch: int = 1
 
-    return [ref for ref in asyncio.run(gather(urls, get_csl_json)) if ref]
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/zotxt/items"
 
+    def get_items(self, keys: list[str]) -> list[dict] | None:
+        return asyncio.run(self.fetch_all(keys))
 
-def get_url_zotxt(key: str, host: str = "localhost", port: int = 23119) -> str:
-    return f"http://{host}:{port}/zotxt/items?betterbibtexkey={key}"
+    def session(self) -> ClientSession:
+        import aiohttp
 
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.timeout,
+            sock_read=self.timeout,
+        )
+        connector = aiohttp.TCPConnector(limit=self.jobs)
+        return aiohttp.ClientSession(timeout=timeout, connector=connector)
 
-async def get_csl_json(response: ClientResponse) -> dict:
-    if response.status != 200:  # noqa: PLR2004
-        return {}
+    async def fetch_all(self, keys: list[str]) -> list[dict] | None:
+        from aiohttp import ClientError
 
-    text = await response.text()
-    return json.loads(text)[0]
+        batches = [keys[k : k + self.batch] for k in range(0, len(keys), self.batch)]
 
+        async with self.session() as session:
+            try:
+                first = await self.fetch(session, batches[0])
+            except (ClientError, asyncio.TimeoutError):
+                return None
 
-def get_zotero_api() -> pyzotero.zotero.Zotero | None:
+            coros = (self.fetch(session, keys) for keys in batches[1:])
+            rest = await asyncio.gather(*coros, return_exceptions=True)
+
+        results = [first, *(x for x in rest if isinstance(x, list))]
+        return [item for items in results for item in items if item]
+
+    async def fetch(self, session: ClientSession, keys: list[str]) -> list[dict]:
+        from aiohttp import ClientPayloadError, ServerDisconnectedError
+
+        errors = (ServerDisconnectedError, ClientPayloadError, asyncio.TimeoutError)
+        params = {"betterbibtexkey": ",".join(keys)}
+
+        for attempt in range(self.retries + 1):
+            retry = attempt < self.retries
+
+            try:
+                async with session.get(self.url, params=params) as response:
+                    if response.status in RETRY_STATUS and retry:
+                        await asyncio.sleep(self.backoff * 2**attempt)
+                        continue
+
+                    if response.status != 200:  # noqa: PLR2004
+                        return []
+
+                    return json.loads(await response.text())
+
+            except errors:
+                if not retry:
+                    raise
+
+                await asyncio.sleep(self.backoff * 2**attempt)
+
+        return []
+
+
+def get_items_api(keys: list[str]) -> list[dict] | None:
+    if not (client := get_zotero_client()):
+        return None
+
+    from aiohttp import ClientError
+
+    try:
+        return client.get_items(keys)
+    except (ClientError, asyncio.TimeoutError):
+        return None
+
+
+def get_zotero_client() -> ZoteroAPI | None:
     library_id = os.getenv("ZOTERO_LIBRARY_ID")
     library_type = os.getenv("ZOTERO_LIBRARY_TYPE") or "user"
     api_key = os.getenv("ZOTERO_API_KEY")
+    url = os.getenv("ZOTERO_API_URL") or ZOTERO_API_URL
 
     if not library_id or not api_key:
         return None
 
-    return pyzotero.zotero.Zotero(library_id, library_type, api_key)
+    return ZoteroAPI(library_id, api_key, library_type, url)
+
+
+ZOTERO_API_URL = "https://api.zotero.org"
+
+
+@dataclass
+class ZoteroAPI:
+    library_id: str
+    api_key: str
+    library_type: str = "user"
+    url: str = ZOTERO_API_URL
+    jobs: int = 8
+    limit: int = 100
+    timeout: float = 30
+    retries: int = 2
+    backoff: float = 1
+    resume: float = field(default=0, init=False, repr=False)
+
+    @property
+    def library_url(self) -> str:
+        return f"{self.url}/{self.library_type}s/{self.library_id}"
+
+    @property
+    def items_url(self) -> str:
+        return f"{self.library_url}/items"
+
+    def get_items(self, keys: list[str]) -> list[dict]:
+        return asyncio.run(self.search(keys))
+
+    def get_library(
+        self,
+        version: int | None = None,
+    ) -> tuple[dict[str, dict] | None, list[str], int]:
+        return asyncio.run(self.sync(version))
+
+    def session(self) -> ClientSession:
+        import aiohttp
+
+        headers = {"Zotero-API-Key": self.api_key, "Zotero-API-Version": "3"}
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.timeout,
+            sock_read=self.timeout,
+        )
+        connector = aiohttp.TCPConnector(limit=self.jobs)
+        return aiohttp.ClientSession(
+            headers=headers,
+            timeout=timeout,
+            connector=connector,
+        )
+
+    async def request(
+        self,
+        session: ClientSession,
+        url: str,
+        params: dict[str, str | int],
+        headers: dict[str, str] | None = None,
+    ) -> tuple[Any, Mapping[str, str]]:
+        for attempt in range(self.retries + 1):
+            retry = attempt < self.retries
+            await self.wait()
+
+            async with session.get(url, params=params, headers=headers) as r:
+                self.defer(r.headers)
+
+                if r.status in RETRY_STATUS and retry:
+                    self.defer(r.headers, self.backoff * 2**attempt)
+                    continue
+
+                if r.status == 304:  # noqa: PLR2004
+                    return None, r.headers
+
+                r.raise_for_status()
+                return await r.json(content_type=None), r.headers
+
+        return None, {}
+
+    async def fetch(
+        self,
+        session: ClientSession,
+        params: dict[str, str | int],
+        headers: dict[str, str] | None = None,
+    ) -> tuple[list[dict] | None, Mapping[str, str]]:
+        params = {"format": "csljson", "limit": self.limit, **params}
+        data, headers_ = await self.request(session, self.items_url, params, headers)
+
+        if data is None:
+            return None, headers_
+
+        return data.get("items", []) if isinstance(data, dict) else data, headers_
+
+    async def fetch_deleted(self, session: ClientSession, version: int) -> list[str]:
+        url = f"{self.library_url}/deleted"
+        data, _ = await self.request(session, url, {"since": version})
+        return data.get("items", []) if isinstance(data, dict) else []
+
+    async def wait(self) -> None:
+        if (delay := self.resume - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    def defer(self, headers: Mapping[str, str], default: float = 0) -> None:
+        delay = get_delay(headers) or default
+        self.resume = max(self.resume, time.monotonic() + delay)
+
+    async def search(self, keys: list[str]) -> list[dict]:
+        async with self.session() as session:
+            params = ({"q": key, "qmode": "everything"} for key in keys)
+            coros = (self.fetch(session, p) for p in params)
+            results = await asyncio.gather(*coros, return_exceptions=True)
+
+        if results and all(isinstance(x, BaseException) for x in results):
+            raise results[0]  # type: ignore
+
+        found = {}
+        for items, _ in (x for x in results if isinstance(x, tuple)):
+            for item in map(convert_note, items or []):
+                if (key := item.get("id")) in keys:
+                    found.setdefault(key, item)
+
+        return [found[key] for key in keys if key in found]
+
+    async def sync(
+        self,
+        version: int | None = None,
+    ) -> tuple[dict[str, dict] | None, list[str], int]:
+        params: dict[str, str | int] = {"start": 0}
+        headers = {}
+
+        if version is not None:
+            params["since"] = version
+            headers["If-Modified-Since-Version"] = str(version)
+
+        async with self.session() as session:
+            items, h = await self.fetch(session, params, headers)
+            latest = int(h.get("Last-Modified-Version", version or 0))
+
+            if items is None:
+                return None, [], latest
+
+            total = int(h.get("Total-Results", len(items)))
+            starts = range(len(items), total, self.limit) if items else []
+            coros = (
+                self.fetch(session, {**params, "start": s}, headers) for s in starts
+            )
+            pages = await asyncio.gather(*coros)
+            deleted = []
+            if version is not None:
+                deleted = await self.fetch_deleted(session, version)
 
+        for page, _ in pages:
+            items.extend(page or [])
+
+        found = {}
+        for item in items:
+            key = get_item_key(item)
+            found[key] = convert_note(item)
+
+        return found, deleted, latest
 
-def get_items_api(
-    keys: list[str],
-    start: int | None = None,
-    limit: int | None = None,
-) -> list[dict] | None:
-    if not (zot := get_zotero_api()):
-        return None
 
-    items = []
-    for key, item in iter_items_api(zot, start, limit):
-        if key in keys:
-            items.append(item)
+def get_item_key(item: dict) -> str:
+    # The API writes CSL JSON ids as `<library id>/<item key>`.
+    return str(item.get("id", "")).rsplit("/", maxsplit=1)[-1]
 
-    return items
 
+def get_delay(headers: Mapping[str, str]) -> float:
+    for name in ("Retry-After", "Backoff"):
+        if (value := headers.get(name, "")).replace(".", "", 1).isdigit():
+            return float(value)
 
-def iter_items_api(
-    zot: pyzotero.zotero.Zotero,
-    start: int | None = None,
-    limit: int | None = None,
-) -> Iterator[tuple[str, dict]]:
-    for item in zot.items(content="csljson", start=start, limit=limit):
-        item_ = convert_note(item)  # type:ignore
-        if key := item_.get("id"):
-            yield key, item_
+    return 0
 
 
 def convert_note(item: dict) -> dict:
+    if key := item.get("citation-key"):
+        item["id"] = key
+
     if not (note := item.pop("note", None)):
         return item
 
@@ -139,17 +441,3 @@ def convert_note(item: dict) -> dict:
                 item[name.lower().replace(" ", "-")] = text
 
     return item
-
-
-# Ref: https://gist.github.com/rhoboro/86629f831934827d832841709abfe715
-
-
-async def get(session: ClientSession, url: str, coro):  # noqa: ANN001, ANN201
-    response = await session.get(url)
-    return await coro(response)
-
-
-async def gather(urls: list[str], coro):  # noqa: ANN001, ANN201
-    async with aiohttp.ClientSession() as session:
-        tasks = (asyncio.create_task(get(session, url, coro)) for url in urls)
-        return await asyncio.gather(*tasks)
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from panpdf.tools import get_cache_dir
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+    from pathlib import Path
+
+    from panpdf.filters.zotero import ZoteroAPI
+
+LIBRARY_NAME = "zotero.sqlite"
+
+SCHEMA_VERSION = 2
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS items (
+  zotero TEXT PRIMARY KEY, key TEXT NOT NULL, item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_key ON items (key);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+PRAGMA user_version = {SCHEMA_VERSION};
+"""
+
+# Mirrors written by an older schema are dropped and synced again in full.
+DROP = """
+DROP TABLE IF EXISTS items;
+DROP TABLE IF EXISTS meta;
+"""
+
+
+def get_library_path(cache_dir: Path | None = None) -> Path:
+    return (cache_dir or get_cache_dir()) / LIBRARY_NAME
+
+
+@dataclass(repr=False)
+class Library:
+    path: Path
+    connection: sqlite3.Connection = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        row = self.connection.execute("PRAGMA user_version").fetchone()
+
+        if row[0] != SCHEMA_VERSION:
+            self.connection.executescript(DROP)
+
+        self.connection.executescript(SCHEMA)
+
+    def __len__(self) -> int:
+        cursor = self.connection.execute("SELECT COUNT(*) FROM items")
+        return cursor.fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @property
+    def version(self) -> int | None:
+        sql = "SELECT value FROM meta WHERE name = 'version'"
+        row = self.connection.execute(sql).fetchone()
+        return int(row[0]) if row else None
+
+    def get_items(self, keys: Iterable[str]) -> dict[str, dict]:
+        keys = list(dict.fromkeys(keys))
+        items = {}
+
+        for k in range(0, len(keys), 500):
+            chunk = keys[k : k + 500]
+            marks = ",".join("?" * len(chunk))
+            sql = f"SELECT key, item FROM items WHERE key IN ({marks})"  # noqa: S608
+            for key, item in self.connection.execute(sql, chunk):
+                items[key] = json.loads(item)
+
+        return items
+
+    def update(
+        self,
+        items: Mapping[str, dict],
+        version: int,
+        deleted: Iterable[str] = (),
+    ) -> None:
+        removed = [(key,) for key in [*deleted, *items]]
+        rows = [
+            (key, item["id"], json.dumps(item, ensure_ascii=False))
+            for key, item in items.items()
+            if "id" in item
+        ]
+
+        with self.connection:
+            sql = "DELETE FROM items WHERE zotero = ?"
+            self.connection.executemany(sql, removed)
+            sql = "INSERT INTO items VALUES (?, ?, ?)"
+            self.connection.executemany(sql, rows)
+            sql = "INSERT OR REPLACE INTO meta VALUES ('version', ?)"
+            self.connection.execute(sql, (str(version),))
+
+    def clear(self) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM items")
+            self.connection.execute("DELETE FROM meta")
+
+
+def sync_library(library: Library, client: ZoteroAPI) -> int | None:
+    items, deleted, version = client.get_library(library.version)
+
+    if items is None:
+        return None
+
+    library.update(items, version, deleted)
+    return len(items) + len(deleted)
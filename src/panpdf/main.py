@@ -1,21 +1,30 @@
+import io
+import itertools
+import json
 import os
+import re
 import sys
-from collections.abc import Iterable, Iterator
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
 from enum import Enum
-from importlib.metadata import version
 from pathlib import Path
-from typing import TYPE_CHECKING, Annotated
+from typing import TYPE_CHECKING, Annotated, Any
 
-import panflute as pf
 import typer
-from panflute import Doc
 from typer import Argument, Option
 
 if TYPE_CHECKING:
+    from nbstore import Store
+    from panflute import Doc
+
     from panpdf.filters.filter import Filter
 
 EXTRA_ARGS: list[str] = []
 
+PARSE_CACHE: dict[str, str] | None = None
+
+STORES: dict[Path, "Store"] = {}
+
 if "--" in sys.argv:
     index = sys.argv.index("--")
     EXTRA_ARGS[:] = sys.argv[index + 1 :]
@@ -28,11 +37,42 @@ class OutputFormat(str, Enum):
     auto = "auto"
 
 
-app = typer.Typer(add_completion=False)
+class App(typer.Typer):
+    def __init__(self, **kwargs: Any) -> None:  # noqa: ANN401
+        super().__init__(**kwargs)
+        self.subcommands: dict[str, typer.Typer] = {}
+
+    def add_subcommand(self, app: typer.Typer, name: str) -> None:
+        self.subcommands[name] = app
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+        if (sub := get_subcommand(self.subcommands, sys.argv[1:])) is not None:
+            kwargs.setdefault("prog_name", f"panpdf {sys.argv[1]}")
+            return sub(*args, args=sys.argv[2:], **kwargs)
+
+        return super().__call__(*args, **kwargs)
+
+
+def get_subcommand(
+    subcommands: dict[str, typer.Typer],
+    args: list[str],
+) -> typer.Typer | None:
+    if not args or (sub := subcommands.get(args[0])) is None:
+        return None
+
+    # A subcommand name always wins; a path with the same name needs `./`.
+    if Path(args[0]).exists():
+        msg = f"'{args[0]}' is a subcommand. Use ./{args[0]} for the path."
+        typer.secho(msg, fg="yellow", err=True)
+
+    return sub
+
+
+app = App(add_completion=False)
 
 
 @app.command(name="panpdf")
-def cli(  # noqa: C901, PLR0912, PLR0913
+def cli(  # noqa: C901, PLR0913, PLR0915
     files: Annotated[
         list[Path] | None,
         Argument(
@@ -104,6 +144,64 @@ def cli(  # noqa: C901, PLR0912, PLR0913
             help="Create self-contained figures with required packages.",
         ),
     ] = False,
+    jobs: Annotated[
+        int | None,
+        Option(
+            "--jobs",
+            "-j",
+            metavar="N",
+            help="Number of files to parse and figures to create in parallel.",
+            show_default="CPU count",
+        ),
+    ] = None,
+    cache_dir: Annotated[
+        Path | None,
+        Option(
+            metavar="DIRECTORY",
+            help="Directory to cache standalone figures across builds.",
+            envvar="PANPDF_CACHE_DIR",
+            show_default="~/.cache/panpdf",
+        ),
+    ] = None,
+    write_back: Annotated[
+        bool,
+        Option(
+            "--write-back/--no-write-back",
+            help="Embed created figures into notebooks for reuse.",
+        ),
+    ] = True,
+    build_dir: Annotated[
+        Path | None,
+        Option(
+            "--build-dir",
+            metavar="DIRECTORY",
+            help="Keep LaTeX files in DIRECTORY and rerun only the passes needed.",
+            show_default=False,
+        ),
+    ] = None,
+    precompile: Annotated[
+        bool,
+        Option(
+            "--precompile",
+            help="Reuse a precompiled LaTeX format of the preamble (mylatexformat).",
+        ),
+    ] = False,
+    pgf_limit: Annotated[
+        int | None,
+        Option(
+            "--pgf-limit",
+            metavar="BYTES",
+            help="Use PDF/PNG output or a standalone build for larger PGF (0: off).",
+            show_default="2000000",
+        ),
+    ] = None,
+    draft: Annotated[
+        bool,
+        Option(
+            "--draft",
+            help="Replace notebook figures with placeholder boxes for fast builds.",
+        ),
+    ] = False,
     figure_only: Annotated[
         bool,
         Option(
@@ -140,6 +238,37 @@ def cli(  # noqa: C901, PLR0912, PLR0913
         bool,
         Option("--quiet", help="Hide warning messages during processing."),
     ] = False,
+    watch: Annotated[
+        bool,
+        Option(
+            "--watch",
+            "-w",
+            help="Rebuild when Markdown files, notebooks or defaults change.",
+        ),
+    ] = False,
+    profile: Annotated[
+        bool,
+        Option(
+            "--profile",
+            help="Display time spent in each stage of the conversion.",
+        ),
+    ] = False,
+    profile_json: Annotated[
+        Path | None,
+        Option(
+            metavar="FILE",
+            help="Write the profile of each stage to FILE as JSON.",
+            show_default=False,
+        ),
+    ] = None,
+    sequential: Annotated[
+        bool,
+        Option(
+            "--sequential",
+            help="Run filters one after another instead of in a single pass.",
+            hidden=True,
+        ),
+    ] = False,
     version: Annotated[
         bool,
         Option(
@@ -158,89 +287,567 @@ def cli(  # noqa: C901, PLR0912, PLR0913
     if version:
         show_version(pandoc_path)
 
-    from nbstore import Store
-
-    from panpdf.filters.attribute import Attribute
-    from panpdf.filters.cell import Cell
-    from panpdf.filters.crossref import Crossref
-    from panpdf.filters.jupyter import Jupyter
-    from panpdf.filters.layout import Layout
-    from panpdf.filters.snippet import Snippet
-    from panpdf.filters.verbatim import Verbatim
-    from panpdf.filters.zotero import Zotero
+    from panpdf.profiler import PROFILER
     from panpdf.tools import (
         convert_doc,
+        get_cache_dir,
         get_defaults_file_path,
         get_metadata_str,
         iter_extra_args_from_metadata,
     )
 
-    text = get_text(files)
-
     extra_args = []
 
     if defaults_path := get_defaults_file_path(defaults):
         extra_args.extend(["--defaults", defaults_path.as_posix()])
 
-    doc: Doc = pf.convert_text(
+    store = get_store(notebook_dir) if notebook_dir else None
+    cache: dict[str, str] | None = {} if watch else PARSE_CACHE
+
+    def build() -> list[Path]:
+        nonlocal output, output_format
+
+        args = extra_args[:]
+
+        with PROFILER.stage("parse"):
+            doc = parse_files(
+                files,
+                args,
+                pandoc_path,
+                defaults_path,
+                jobs=jobs,
+                cache_dir=cache_dir,
+                cache=cache,
+            )
+
+        if output and str(output).startswith("."):
+            title = get_metadata_str(doc, "title") or "a"
+            output = Path(f"{title}{output}")
+
+        if output_format == OutputFormat.auto:
+            output_format = get_output_format(output)
+
+        if output_format == OutputFormat.pdf and not output:
+            typer.secho("No output file. Aborted.", fg="red")
+            raise typer.Exit
+
+        only_figures = bool(store and figure_only)
+        zotero = None
+
+        if citeproc and not only_figures:
+            zotero = create_zotero(doc, cache_dir=cache_dir, verbose=verbose)
+
+        pgf_dir, pgf_base = get_pgf_dirs(
+            output,
+            output_format,
+            cache_dir or get_cache_dir(),
+        )
+
+        filters = create_filters(
+            store,
+            zotero,
+            figure_only=only_figures,
+            defaults=defaults_path,
+            standalone=standalone_figure,
+            pandoc_path=pandoc_path,
+            jobs=jobs,
+            cache_dir=cache_dir or get_cache_dir(),
+            write_back=write_back,
+            pgf_dir=pgf_dir,
+            pgf_base=pgf_base,
+            precompile=precompile,
+            pgf_limit=pgf_limit,
+            draft=draft,
+        )
+
+        if only_figures:
+            run_filters(filters, doc, sequential=sequential)
+            raise typer.Exit
+
+        doc = run_filters(filters, doc, sequential=sequential)
+
+        args.extend(iter_extra_args_from_metadata(doc, defaults=defaults))
+
+        if citeproc:
+            args.append("--citeproc")
+
+        if draft:
+            args.extend(["--variable", "classoption=draft"])
+
+        if output:
+            args.extend(["--output", output.as_posix()])
+
+        args.extend(EXTRA_ARGS)
+
+        with PROFILER.stage("convert"):
+            result = convert_doc(
+                doc,
+                output_format=output_format.value,
+                standalone=standalone,
+                extra_args=args,
+                pandoc_path=pandoc_path,
+                verbose=verbose,
+                quiet=quiet,
+                build_dir=build_dir,
+                precompile=precompile,
+                cache_dir=cache_dir,
+            )
+
+        if not output and isinstance(result, str):
+            typer.echo(result)
+
+        return list(iter_written_paths(filters))
+
+    if profile or profile_json:
+        build = profiled(build, show=profile, path=profile_json)
+
+    if not watch:
+        build()
+        return
+
+    if not files:
+        typer.secho("No input files to watch. Aborted.", fg="red")
+        raise typer.Exit
+
+    from panpdf.watch import Watcher, watch_files
+
+    paths = [*files, *(path for path in [notebook_dir, defaults_path] if path)]
+    watch_files(build, Watcher(paths))
+
+
+def parse_text(
+    text: str,
+    extra_args: list[str],
+    pandoc_path: Path | None = None,
+    defaults_path: Path | None = None,
+    cache: dict[str, str] | None = None,
+) -> "Doc":
+    import panflute as pf
+
+    if cache is None:
+        return pf.convert_text(
+            text,
+            standalone=True,
+            extra_args=extra_args[:],
+            pandoc_path=pandoc_path,
+        )  # type: ignore
+
+    key = "\0".join([*get_parse_key(extra_args, defaults_path), text])
+
+    if json := cache.get(key):
+        return pf.load(io.StringIO(json))
+
+    doc = parse_text(text, extra_args, pandoc_path)
+
+    with io.StringIO() as f:
+        pf.dump(doc, f)
+        cache.clear()
+        cache[key] = f.getvalue()
+
+    return doc
+
+
+def parse_files(  # noqa: PLR0913
+    files: list[Path] | None,
+    extra_args: list[str],
+    pandoc_path: Path | None = None,
+    defaults_path: Path | None = None,
+    *,
+    jobs: int | None = None,
+    cache_dir: Path | None = None,
+    cache: dict[str, str] | None = None,
+) -> "Doc":
+    from concurrent.futures import ThreadPoolExecutor
+
+    import panflute as pf
+
+    from panpdf.tools import get_cache_dir, get_pandoc_version
+
+    if not files:
+        text = get_text(files)
+        return parse_text(text, extra_args, pandoc_path, defaults_path, cache)
+
+    if not (paths := list(collect(files))):
+        return parse_text("", extra_args, pandoc_path)
+
+    texts = [path.read_text(encoding="utf8") for path in paths]
+    version = get_pandoc_version(pandoc_path)
+    prefix = [version, *get_parse_key(extra_args, defaults_path)]
+    cache_dir = (cache_dir or get_cache_dir()) / "ast"
+
+    def parse(text: str) -> dict[str, Any]:
+        return parse_file(text, extra_args, pandoc_path, cache_dir, [*prefix, text])
+
+    # References across files only resolve in the joined text, and filters
+    # may count or collect elements over the whole document.
+    if has_parse_filters(extra_args, defaults_path) or not is_self_contained(texts):
+        return pf.load(io.StringIO(json.dumps(parse("\n\n".join(texts)))))
+
+    # Each pandoc runs in its own process, so threads are enough to parse
+    # the files concurrently. `map` keeps the original order.
+    if jobs == 1 or len(texts) == 1:
+        asts = [parse(text) for text in texts]
+    else:
+        with ThreadPoolExecutor(jobs) as executor:
+            asts = list(executor.map(parse, texts))
+
+    return pf.load(io.StringIO(json.dumps(join_asts(asts))))
+
+
+PARSE_FILTERS = ("--lua-filter", "-L", "--filter", "-F")
+PARSE_OPTIONS = (*PARSE_FILTERS, "--metadata-file")
+PARSE_DEFAULTS = ("filters", "metadata-files", "metadata-file")
+
+
+def has_parse_filters(extra_args: list[str], defaults_path: Path | None) -> bool:
+    from panpdf.tools import get_defaults, pop_option
+
+    if "--citeproc" in extra_args or "-C" in extra_args:
+        return True
+
+    if any(pop_option(extra_args[:], option) for option in PARSE_FILTERS):
+        return True
+
+    if not defaults_path or not defaults_path.exists():
+        return False
+
+    return any(get_defaults(defaults_path, name) for name in ("filters", "citeproc"))
+
+
+def get_parse_key(extra_args: list[str], defaults_path: Path | None) -> list[str]:
+    """Return the parse arguments with the text of every file they name.
+
+    Filters and metadata files run during the parse, so editing one of
+    them must invalidate a cached AST.
+    """
+    from panpdf.tools import get_defaults, pop_option
+
+    names: list[Any] = []
+    for option in PARSE_OPTIONS:
+        names.extend(pop_option(extra_args[:], option))
+
+    key = [*extra_args]
+
+    if defaults_path and defaults_path.exists():
+        key.append(defaults_path.read_text(encoding="utf8"))
+
+        for name in PARSE_DEFAULTS:
+            value = get_defaults(defaults_path, name) or []
+            names.extend(value if isinstance(value, list) else [value])
+
+    for name in names:
+        path = Path(name.get("path", "") if isinstance(name, dict) else name)
+        if path.is_file():
+            key.append(path.read_text(encoding="utf8", errors="replace"))
+
+    return key
+
+
+REFERENCE_PATTERN = re.compile(r"^ {0,3}\[(\^?[^\]]+)\]:", re.MULTILINE)
+HEADER_PATTERN = re.compile(r"^#{1,6}[ \t]+(.+?)(?:[ \t]+\{.*\})?[ \t]*$", re.MULTILINE)
+EXAMPLE_PATTERN = re.compile(r"^[ \t]*\(@[\w-]*\)[ \t]", re.MULTILINE)
+MACRO_PATTERN = re.compile(r"\\(?:(?:re|provide)?newcommand|def)\b")
+FENCE_PATTERN = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$")
+DIV_PATTERN = re.compile(r"^ {0,3}:{3,}[ \t]*(\S?)")
+LIST_PATTERN = re.compile(r"^ {0,3}(?:[-+*:~]|\(?(?:\d+|[#a-zA-Z]|[ivxlcdm]+)[.)])\s")
+
+
+def is_self_contained(texts: list[str]) -> bool:
+    """Return True if each text parses alone as it does in the joined text.
+
+    Link reference definitions, footnotes, implicit header references,
+    example lists, and LaTeX macros resolve across files, and a block left
+    open at the end of a file continues into the next one. The check is
+    conservative: a file that mentions a label another file defines needs
+    the joined parse.
+    """
+    if len(texts) > 1 and any(MACRO_PATTERN.search(text) for text in texts):
+        return False
+
+    if any(is_open(text) for text in texts[:-1]):
+        return False
+
+    if any(text.lstrip("\r\n")[:1] in (" ", "\t") for text in texts[1:]):
+        return False
+
+    examples = [text for text in texts if "(@" in text]
+    if len(examples) > 1 and any(EXAMPLE_PATTERN.search(x) for x in examples):
+        return False
+
+    texts = [re.sub(r"[*_`]", "", text) for text in texts]
+    labels = [get_labels(text) for text in texts]
+    counts = Counter(label for ls in labels for label in ls)
+
+    for text, ls in zip(texts, labels, strict=True):
+        if any(counts[x] > (x in ls) for x in get_mentions(text)):
+            return False
+
+    return True
+
+
+def is_open(text: str) -> bool:
+    """Return True if the text ends inside a code block, div, or list."""
+    fence, depth = "", 0
+
+    for line in text.splitlines():
+        if m := FENCE_PATTERN.match(line):
+            marker, rest = m.groups()
+            if not fence:
+                fence = marker
+            elif marker.startswith(fence) and not rest.strip():
+                fence = ""
+
+        elif not fence and (m := DIV_PATTERN.match(line)):
+            depth = depth + 1 if m.group(1) else max(depth - 1, 0)
+
+    if fence or depth:
+        return True
+
+    if not (lines := [line for line in text.splitlines() if line.strip()]):
+        return False
+
+    return lines[-1][:1] in (" ", "\t") or bool(LIST_PATTERN.match(lines[-1]))
+
+
+def get_labels(text: str) -> set[str]:
+    labels = REFERENCE_PATTERN.findall(text) + HEADER_PATTERN.findall(text)
+    return {normalize_label(label) for label in labels}
+
+
+def get_mentions(text: str) -> set[str]:
+    return {normalize_label(x) for x in re.findall(r"\[([^\[\]]+)\]", text)}
+
+
+def normalize_label(label: str) -> str:
+    return " ".join(label.split()).lower()
+
+
+def parse_file(
+    text: str,
+    extra_args: list[str],
+    pandoc_path: Path | None,
+    cache_dir: Path,
+    key: list[str],
+) -> dict[str, Any]:
+    import panflute as pf
+
+    from panpdf.tools import get_hash, write_cache
+
+    path = cache_dir / f"{get_hash(*key)}.json"
+
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf8"))
+
+    ast: str = pf.convert_text(
         text,
+        output_format="json",
         standalone=True,
         extra_args=extra_args[:],
         pandoc_path=pandoc_path,
-    )  # type:ignore
+    )  # type: ignore
 
-    if output and str(output).startswith("."):
-        title = get_metadata_str(doc, "title") or "a"
-        output = Path(f"{title}{output}")
+    write_cache(path, ast.encode("utf8"))
+    return json.loads(ast)
 
-    if output_format == OutputFormat.auto:
-        output_format = get_output_format(output)
 
-    if output_format == OutputFormat.pdf and not output:
-        typer.secho("No output file. Aborted.", fg="red")
-        raise typer.Exit
+def join_asts(asts: list[dict[str, Any]]) -> dict[str, Any]:
+    meta = {}
+    for ast in asts:
+        meta.update(ast["meta"])
+
+    blocks = [block for ast in asts for block in ast["blocks"]]
+    dedupe_identifiers(blocks)
+
+    return {
+        "pandoc-api-version": asts[0]["pandoc-api-version"],
+        "meta": meta,
+        "blocks": blocks,
+    }
+
+
+def dedupe_identifiers(blocks: list[dict[str, Any]]) -> None:
+    used = set()
+
+    for header in iter_headers(blocks):
+        attr = header["c"][1]
+        identifier = attr[0]
+        base = get_identifier(header["c"][2])
+
+        if identifier == base or re.fullmatch(rf"{re.escape(base)}-\d+", identifier):
+            identifier, k = base, 0
+            while identifier in used:
+                k += 1
+                identifier = f"{base}-{k}"
+
+            attr[0] = identifier
+
+        used.add(identifier)
+
+
+def iter_headers(elem: Any) -> Iterator[dict[str, Any]]:  # noqa: ANN401
+    if isinstance(elem, list):
+        for e in elem:
+            yield from iter_headers(e)
+
+    elif isinstance(elem, dict):
+        if elem.get("t") == "Header":
+            yield elem
+        else:
+            yield from iter_headers(elem.get("c"))
+
+
+def get_identifier(inlines: list[dict[str, Any]]) -> str:
+    """Return the identifier that pandoc's `auto_identifiers` derives."""
+    text = "".join(iter_strings(inlines)).lower()
+    text = "".join(c for c in text if c.isalnum() or c in "_-." or c.isspace())
+    text = "-".join(text.split())
+    text = "".join(itertools.dropwhile(lambda c: not c.isalpha(), text))
+    return text or "section"
+
+
+def iter_strings(elem: Any) -> Iterator[str]:  # noqa: ANN401
+    if isinstance(elem, list):
+        for e in elem:
+            yield from iter_strings(e)
+
+    elif isinstance(elem, dict):
+        match elem.get("t"):
+            case "Str":
+                yield elem["c"]
+            case "Code" | "Math":
+                yield elem["c"][1]
+            case "Space" | "SoftBreak" | "LineBreak":
+                yield " "
+            case "Note" | "RawInline":
+                pass
+            case _:
+                yield from iter_strings(elem.get("c"))
+
+
+def get_store(path: Path) -> "Store":
+    from nbstore import Store
+
+    path = path.absolute()
+
+    if (store := STORES.get(path)) is None:
+        store = STORES[path] = Store(path)
+
+    return store
+
+
+def create_zotero(
+    doc: "Doc",
+    *,
+    cache_dir: Path | None = None,
+    verbose: bool = False,
+) -> "Filter":
+    from panpdf.filters.zotero import Zotero
+    from panpdf.library import get_library_path
+
+    zotero = Zotero(verbose=verbose, library=get_library_path(cache_dir))
+    zotero.prefetch(doc)
+    return zotero
+
+
+def get_pgf_dirs(
+    output: Path | None,
+    output_format: str,
+    cache_dir: Path,
+) -> tuple[Path | None, Path | None]:
+    """Return where PGF figures are written and what `\\input` is relative to.
+
+    A PDF is compiled from the cache, a LaTeX file gets the figures next to
+    it, and LaTeX written to stdout inlines them.
+    """
+    if output_format == "pdf":
+        return cache_dir / "pgf", None
+
+    if output:
+        return output.parent / f"{output.stem}-pgf", output.parent
+
+    return None, None
+
+
+def create_filters(
+    store: "Store | None" = None,
+    zotero: "Filter | None" = None,
+    *,
+    figure_only: bool = False,
+    **options: Any,  # noqa: ANN401
+) -> list["Filter"]:
+    from panpdf.filters.attribute import Attribute
+    from panpdf.filters.crossref import Crossref
+    from panpdf.filters.layout import Layout
+    from panpdf.filters.snippet import Snippet
+    from panpdf.filters.verbatim import Verbatim
 
     filters: list[Filter] = [Attribute(), Snippet()]
 
-    if notebook_dir:
-        store = Store(notebook_dir.absolute())
-        cell = Cell(store)
-        jupyter = Jupyter(store, defaults_path, standalone_figure, pandoc_path)
-        filters.extend([cell, jupyter])
+    if store:
+        from panpdf.filters.cell import Cell
+        from panpdf.filters.jupyter import Jupyter
+
+        filters.extend([Cell(store), Jupyter(store, **options)])
+
+        if figure_only:
+            return filters
 
     filters.extend([Verbatim(), Layout(), Crossref()])
 
-    if citeproc:
-        filters.append(Zotero())
+    if zotero:
+        filters.append(zotero)
+
+    return filters
+
+
+def run_filters(
+    filters: list["Filter"],
+    doc: "Doc",
+    *,
+    sequential: bool = False,
+) -> "Doc":
+    from panpdf.profiler import PROFILER
 
+    with PROFILER.stage("filters"):
+        if not sequential:
+            from panpdf.filters.pipeline import Pipeline
+
+            return Pipeline(filters).run(doc)
+
+        for filter_ in filters:
+            doc = filter_.run(doc)
+
+        return doc
+
+
+def iter_written_paths(filters: list["Filter"]) -> Iterator[Path]:
     for filter_ in filters:
-        doc = filter_.run(doc)
-        if figure_only and isinstance(filter_, Jupyter):
-            raise typer.Exit
+        yield from getattr(filter_, "written", ())
 
-    extra_args.extend(iter_extra_args_from_metadata(doc, defaults=defaults))
 
-    if citeproc:
-        extra_args.append("--citeproc")
+def profiled(
+    build: Callable[[], list[Path]],
+    *,
+    show: bool = True,
+    path: Path | None = None,
+) -> Callable[[], list[Path]]:
+    from rich.console import Console
 
-    if output:
-        extra_args.extend(["--output", output.as_posix()])
+    from panpdf.profiler import profile
 
-    if EXTRA_ARGS:
-        extra_args.extend(EXTRA_ARGS)
+    def build_profiled() -> list[Path]:
+        with profile() as profiler:
+            written = build()
 
-    result = convert_doc(
-        doc,
-        output_format=output_format.value,
-        standalone=standalone,
-        extra_args=extra_args,
-        pandoc_path=pandoc_path,
-        verbose=verbose,
-        quiet=quiet,
-    )
+        if show:
+            Console(stderr=True).print(profiler.create_table())
+
+        if path:
+            profiler.write_json(path)
 
-    if not output and isinstance(result, str):
-        typer.echo(result)
+        return written
+
+    return build_profiled
 
 
 def get_text(files: list[Path] | None) -> str:
@@ -280,11 +887,189 @@ def get_output_format(output: Path | None) -> OutputFormat:
 
 
 def show_version(pandoc_path: Path | None) -> None:
+    from importlib.metadata import version
+
     from panpdf.tools import get_pandoc_version
 
     pandoc_version = get_pandoc_version(pandoc_path)
 
     typer.echo(f"pandoc {pandoc_version}")
-    typer.echo(f"panflute {pf.__version__}")
+    typer.echo(f"panflute {version('panflute')}")
     typer.echo(f"panpdf {version('panpdf')}")
     raise typer.Exit
+
+
+build_app = typer.Typer(add_completion=False)
+app.add_subcommand(build_app, "build")
+
+
+@build_app.command()
+def build_manifest(  # noqa: PLR0913
+    manifest: Annotated[
+        Path,
+        Argument(
+            help="YAML manifest listing the documents to build.",
+            exists=True,
+            dir_okay=False,
+            show_default=False,
+        ),
+    ],
+    *,
+    jobs: Annotated[
+        int | None,
+        Option(
+            "--jobs",
+            "-j",
+            metavar="N",
+            help="Number of figures and documents to convert in parallel.",
+            show_default="CPU count",
+        ),
+    ] = None,
+    cache_dir: Annotated[
+        Path | None,
+        Option(
+            metavar="DIRECTORY",
+            help="Directory to cache standalone figures across builds.",
+            envvar="PANPDF_CACHE_DIR",
+            show_default="~/.cache/panpdf",
+        ),
+    ] = None,
+    pandoc_path: Annotated[
+        Path | None,
+        Option(
+            metavar="FILE",
+            help="Path to custom pandoc executable.",
+            show_default=False,
+        ),
+    ] = None,
+    verbose: Annotated[
+        bool,
+        Option("--verbose", help="Display detailed processing information."),
+    ] = False,
+    quiet: Annotated[
+        bool,
+        Option("--quiet", help="Hide warning messages during processing."),
+    ] = False,
+) -> None:
+    """Build every document in a manifest in one process.
+
+    Documents share the notebook store, the figure cache and the reference
+    cache. The final pandoc runs are spread over a bounded pool of processes.
+    """
+    from panpdf.build import build, create_table, load_manifest
+    from panpdf.tools import get_console
+
+    try:
+        documents = load_manifest(manifest)
+    except ValueError as e:
+        typer.secho(str(e), fg="red")
+        raise typer.Exit(1) from None
+
+    reports = build(
+        documents,
+        jobs=jobs,
+        cache_dir=cache_dir,
+        pandoc_path=pandoc_path,
+        quiet=quiet,
+        verbose=verbose,
+    )
+
+    get_console().print(create_table(reports))
+
+    if any(report.failed for report in reports):
+        raise typer.Exit(1)
+
+
+serve_app = typer.Typer(add_completion=False)
+app.add_subcommand(serve_app, "serve")
+
+
+@serve_app.command()
+def serve(
+    socket: Annotated[
+        Path | None,
+        Option(
+            metavar="PATH",
+            help="Unix socket to listen on.",
+            envvar="PANPDF_SOCKET",
+            show_default=False,
+        ),
+    ] = None,
+) -> None:
+    """Keep panpdf warm in the background and run jobs sent by the CLI.
+
+    While the server is running, panpdf forwards each invocation to it
+    instead of starting a new Python process.
+    """
+    from panpdf.server import get_socket_path
+    from panpdf.server import serve as serve_forever
+
+    path = socket or get_socket_path()
+    typer.secho(f"Serving on {path}. Press Ctrl+C to stop.", fg="cyan")
+
+    try:
+        serve_forever(path)
+    except FileExistsError as e:
+        typer.secho(str(e), fg="red")
+        raise typer.Exit(1) from None
+
+
+zotero_app = typer.Typer(add_completion=False)
+app.add_subcommand(zotero_app, "zotero")
+
+
+@zotero_app.callback()
+def zotero() -> None:
+    """Manage the local mirror of the Zotero library."""
+
+
+@zotero_app.command()
+def sync(
+    cache_dir: Annotated[
+        Path | None,
+        Option(
+            metavar="DIRECTORY",
+            help="Directory to store the library mirror.",
+            envvar="PANPDF_CACHE_DIR",
+            show_default="~/.cache/panpdf",
+        ),
+    ] = None,
+    *,
+    full: Annotated[
+        bool,
+        Option("--full", help="Discard the mirror and download all items."),
+    ] = False,
+) -> None:
+    """Download items changed since the last sync into the local mirror.
+
+    Requires ZOTERO_LIBRARY_ID and ZOTERO_API_KEY environment variables.
+    """
+    from aiohttp import ClientError
+
+    from panpdf.filters.zotero import get_zotero_client
+    from panpdf.library import Library, get_library_path, sync_library
+
+    if not (client := get_zotero_client()):
+        typer.secho("No Zotero API key. Aborted.", fg="red")
+        raise typer.Exit(1)
+
+    library = Library(get_library_path(cache_dir))
+
+    try:
+        if full:
+            library.clear()
+
+        n = sync_library(library, client)
+        version = library.version
+
+    except (ClientError, TimeoutError) as e:
+        typer.secho(f"Sync failed: {e}", fg="red")
+        raise typer.Exit(1) from None
+
+    finally:
+        library.close()
+
+    if n is None:
+        typer.echo(f"Up to date: version {version}")
+    else:
+        typer.echo(f"Synced {n} item(s): version {version}")
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from contextlib import AbstractContextManager
+    from pathlib import Path
+
+    from rich.table import Table
+
+
+@dataclass
+class Stage:
+    name: str
+    depth: int = 0
+    time: float = 0
+    calls: int = 0
+    subprocesses: int = 0
+    bytes: int = 0
+
+
+@dataclass(repr=False)
+class Profiler:
+    enabled: bool = False
+    stages: dict[str, Stage] = field(default_factory=dict)
+    stack: list[Stage] = field(default_factory=list)
+
+    def stage(self, name: str) -> AbstractContextManager[None]:
+        if not self.enabled:
+            return NULL_CONTEXT
+
+        return self._stage(name)
+
+    @contextlib.contextmanager
+    def _stage(self, name: str) -> Iterator[None]:
+        key = "/".join([*(stage.name for stage in self.stack), name])
+
+        if not (stage := self.stages.get(key)):
+            stage = self.stages[key] = Stage(name, len(self.stack))
+
+        self.stack.append(stage)
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            stage.time += time.perf_counter() - start
+            stage.calls += 1
+            self.stack.pop()
+
+    def add(self, *, subprocesses: int = 0, nbytes: int = 0) -> None:
+        if not self.enabled:
+            return
+
+        for stage in self.stack:
+            stage.subprocesses += subprocesses
+            stage.bytes += nbytes
+
+    def reset(self) -> None:
+        self.stages.clear()
+        self.stack.clear()
+
+    def to_list(self) -> list[dict]:
+        return [{"stage": key, **asdict(s)} for key, s in self.stages.items()]
+
+    def write_json(self, path: Path) -> None:
+        text = json.dumps(self.to_list(), indent=2)
+        path.write_text(text, encoding="utf8")
+
+    def create_table(self) -> Table:
+        from rich.table import Table
+
+        table = Table(title="Profile")
+        table.add_column("Stage")
+        table.add_column("Time (s)", justify="right")
+        table.add_column("Calls", justify="right")
+        table.add_column("Subprocesses", justify="right")
+        table.add_column("Pandoc bytes", justify="right")
+
+        for s in self.stages.values():
+            table.add_row(
+                f"{'  ' * s.depth}{s.name}",
+                f"{s.time:.3f}",
+                str(s.calls),
+                str(s.subprocesses),
+                f"{s.bytes:,}",
+            )
+
+        return table
+
+
+NULL_CONTEXT = contextlib.nullcontext()
+
+PROFILER = Profiler()
+
+
+@contextlib.contextmanager
+def profile() -> Iterator[Profiler]:
+    import panflute.tools
+
+    run_pandoc = panflute.tools.run_pandoc
+
+    def run_pandoc_profiled(text: str = "", *args, **kwargs) -> str:  # noqa: ANN002, ANN003
+        output = run_pandoc(text, *args, **kwargs)
+        nbytes = len(text.encode()) + len(output.encode())
+        PROFILER.add(subprocesses=1, nbytes=nbytes)
+        return output
+
+    PROFILER.reset()
+    PROFILER.enabled = True
+    panflute.tools.run_pandoc = run_pandoc_profiled
+
+    try:
+        yield PROFILER
+
+    finally:
+        panflute.tools.run_pandoc = run_pandoc
+        PROFILER.enabled = False
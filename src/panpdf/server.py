@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import contextlib
+import getpass
+import importlib
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+SOCKET_ENV = "PANPDF_SOCKET"
+
+LOCAL_COMMANDS = ("serve", "--watch", "-w")
+
+PRELOAD_MODULES = (
+    "panpdf.main",
+    "panpdf.filters.pipeline",
+    "panpdf.filters.cell",
+    "panpdf.filters.jupyter",
+    "panpdf.filters.zotero",
+    "rich.progress",
+    "aiohttp",
+)
+
+
+# Environment variables read by panpdf, pandoc, and the TeX engines.
+FORWARD_ENV_NAMES = (
+    "HOME",
+    "LANG",
+    "LANGUAGE",
+    "PATH",
+    "SOURCE_DATE_EPOCH",
+    "TMPDIR",
+    "TZ",
+    "USERPROFILE",
+)
+FORWARD_ENV_PREFIXES = (
+    "BIB",
+    "BST",
+    "LC_",
+    "PANDOC_",
+    "PANPDF_",
+    "TEX",
+    "XDG_",
+    "ZOTERO_",
+)
+
+
+def get_socket_path() -> Path:
+    if path := os.getenv(SOCKET_ENV):
+        return Path(path)
+
+    if runtime := os.getenv("XDG_RUNTIME_DIR"):
+        return Path(runtime) / "panpdf" / "panpdf.sock"
+
+    directory = Path(tempfile.gettempdir()) / f"panpdf-{getpass.getuser()}"
+    return directory / "panpdf.sock"
+
+
+def is_forwarded(name: str) -> bool:
+    return name in FORWARD_ENV_NAMES or name.startswith(FORWARD_ENV_PREFIXES)
+
+
+def filter_env(env: dict[str, str]) -> dict[str, str]:
+    return {name: value for name, value in env.items() if is_forwarded(name)}
+
+
+def is_private(path: Path) -> bool:
+    # Another user must neither own the socket nor be able to replace it.
+    try:
+        st = path.lstat()
+        parent = path.parent.lstat()
+    except OSError:
+        return False
+
+    uid = os.getuid()
+    return (
+        st.st_uid == uid
+        and parent.st_uid == uid
+        and stat.S_ISDIR(parent.st_mode)
+        and not parent.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    )
+
+
+def get_peer_uid(sock: socket.socket) -> int | None:
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+
+    size = struct.calcsize("3i")
+    cred = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, size)
+    return struct.unpack("3i", cred)[1]
+
+
+def main() -> None:
+    if (code := forward(sys.argv[1:])) is not None:
+        sys.exit(code)
+
+    from panpdf.main import app
+
+    app()
+
+
+def forward(args: list[str], path: Path | None = None) -> int | None:
+    if not hasattr(socket, "AF_UNIX") or not can_forward(args):
+        return None
+
+    path = path or get_socket_path()
+
+    if not is_private(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(str(path))
+    except OSError:
+        sock.close()
+        return None
+
+    if get_peer_uid(sock) not in (None, os.getuid()):
+        sock.close()
+        return None
+
+    with sock, sock.makefile("rwb") as f:
+        env = filter_env(dict(os.environ))
+        request = {"args": args, "cwd": str(Path.cwd()), "env": env}
+        send(f, request)
+
+        for message in receive(f):
+            if "stdout" in message:
+                sys.stdout.write(message["stdout"])
+                sys.stdout.flush()
+            elif "stderr" in message:
+                sys.stderr.write(message["stderr"])
+                sys.stderr.flush()
+            elif "stdin" in message:
+                send(f, {"stdin": sys.stdin.read()})
+            elif "exit" in message:
+                return message["exit"]
+
+    return None
+
+
+def can_forward(args: list[str]) -> bool:
+    args = args[: args.index("--")] if "--" in args else args
+    return not any(arg in LOCAL_COMMANDS for arg in args)
+
+
+def send(f: BinaryIO, message: dict[str, Any]) -> None:
+    f.write(json.dumps(message).encode() + b"\n")
+    f.flush()
+
+
+def receive(f: BinaryIO) -> Iterator[dict[str, Any]]:
+    for line in f:
+        yield json.loads(line)
+
+
+def is_running(path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+
+        return True
+
+
+class Writer(io.RawIOBase):
+    def __init__(self, wfile: BinaryIO, name: str) -> None:
+        self.wfile = wfile
+        self.name = name
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: Any) -> int:  # noqa: ANN401
+        send(self.wfile, {self.name: bytes(b).decode(errors="replace")})
+        return len(b)
+
+
+class Reader(io.TextIOBase):
+    def __init__(self, rfile: BinaryIO, wfile: BinaryIO) -> None:
+        self.rfile = rfile
+        self.wfile = wfile
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int | None = -1) -> str:
+        send(self.wfile, {"stdin": True})
+        return json.loads(self.rfile.readline())["stdin"]
+
+
+def create_stream(wfile: BinaryIO, name: str) -> io.TextIOWrapper:
+    writer = Writer(wfile, name)
+    return io.TextIOWrapper(writer, encoding="utf-8", write_through=True)  # type: ignore
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        from panpdf.tools import temp_paths
+
+        if not (line := self.rfile.readline()):
+            return
+
+        request = json.loads(line)
+        stdout = create_stream(self.wfile, "stdout")  # type: ignore
+        stderr = create_stream(self.wfile, "stderr")  # type: ignore
+
+        with (
+            environ(request["cwd"], request["env"]),
+            redirect_stdin(Reader(self.rfile, self.wfile)),  # type: ignore
+            contextlib.redirect_stdout(stdout),
+            contextlib.redirect_stderr(stderr),
+            temp_paths(),
+        ):
+            code = execute(request["args"])
+
+        send(self.wfile, {"exit": code})  # type: ignore
+
+
+@contextlib.contextmanager
+def environ(cwd: str, env: dict[str, str]) -> Iterator[None]:
+    cwd_, env_ = Path.cwd(), dict(os.environ)
+    os.chdir(cwd)
+
+    for name in filter_env(env_):
+        del os.environ[name]
+
+    os.environ.update(filter_env(env))
+
+    try:
+        yield
+
+    finally:
+        os.chdir(cwd_)
+        os.environ.clear()
+        os.environ.update(env_)
+
+
+@contextlib.contextmanager
+def redirect_stdin(stdin: io.TextIOBase) -> Iterator[None]:
+    stdin_, sys.stdin = sys.stdin, stdin
+
+    try:
+        yield
+
+    finally:
+        sys.stdin = stdin_
+
+
+def execute(args: list[str]) -> int:
+    import typer
+
+    from panpdf.main import EXTRA_ARGS, app, get_subcommand
+
+    if "--" in args:
+        index = args.index("--")
+        args, EXTRA_ARGS[:] = args[:index], args[index + 1 :]
+    else:
+        EXTRA_ARGS.clear()
+
+    if sub := get_subcommand(app.subcommands, args):
+        command = typer.main.get_command(sub)
+        name, args = f"panpdf {args[0]}", args[1:]
+    else:
+        command = typer.main.get_command(app)
+        name = "panpdf"
+
+    try:
+        command.main(args, prog_name=name)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(bool(e.code))
+    except Exception:  # noqa: BLE001
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+
+def create_server(path: Path) -> socketserver.UnixStreamServer:
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+
+    from panpdf import main
+
+    main.PARSE_CACHE = {}
+
+    if path.exists():
+        if is_running(path):
+            msg = f"[panpdf] Server already running: {path}"
+            raise FileExistsError(msg)
+
+        path.unlink()
+
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    server = socketserver.UnixStreamServer(str(path), Handler)
+    path.chmod(0o600)
+
+    if not is_private(path):
+        server.server_close()
+        path.unlink(missing_ok=True)
+        msg = f"[panpdf] Socket directory is not private: {path.parent}"
+        raise PermissionError(msg)
+
+    return server
+
+
+def serve(path: Path) -> None:
+    server = create_server(path)
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
@@ -2,11 +2,15 @@ from __future__ import annotations
 
 import asyncio
 import atexit
+import contextlib
+import functools
+import hashlib
 import inspect
-import io
+import json
 import os
 import re
 import shutil
+import subprocess
 import tempfile
 from asyncio.subprocess import PIPE
 from pathlib import Path
@@ -15,21 +19,23 @@ from typing import TYPE_CHECKING, Any
 import panflute as pf
 import yaml
 from panflute import Doc
-from panflute.io import dump
-from rich.console import Console
-from rich.progress import (
-    BarColumn,
-    Progress,
-    SpinnerColumn,
-    TextColumn,
-    TimeElapsedColumn,
-)
+
+from panpdf.profiler import PROFILER
 
 if TYPE_CHECKING:
-    from asyncio.streams import StreamReader
+    from asyncio.streams import StreamReader, StreamWriter
     from collections.abc import Callable, Iterable, Iterator
 
-console = Console(log_time=False, log_path=False)
+    from rich.console import Console
+    from rich.progress import Progress
+
+
+@functools.cache
+def get_console() -> Console:
+    from rich.console import Console
+
+    return Console(log_time=False, log_path=False)
+
 
 PANDOC_PATH: list[Path] = []
 
@@ -46,6 +52,7 @@ def get_pandoc_path(pandoc_cmd: str = "pandoc") -> Path:
     raise OSError(msg)
 
 
+@functools.cache
 def get_pandoc_version(pandoc_path: Path | None = None) -> str:
     output: str = pf.run_pandoc(args=["--version"], pandoc_path=pandoc_path)
     return output.splitlines()[0].split(" ")[1]
@@ -63,6 +70,36 @@ def get_data_dir(pandoc_path: Path | None = None) -> Path:
 
 TEMPFILE_PREFIX = "panpdf__"
 
+PGF_PREFIX = "%% Creator: Matplotlib"
+
+DRAFT_URL = "panpdf:draft"
+
+TEMP_PATHS: list[Path] = []
+
+
+def remove_temp_paths(start: int = 0) -> None:
+    while len(TEMP_PATHS) > start:
+        path = TEMP_PATHS.pop()
+
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+
+atexit.register(remove_temp_paths)
+
+
+@contextlib.contextmanager
+def temp_paths() -> Iterator[None]:
+    start = len(TEMP_PATHS)
+
+    try:
+        yield
+
+    finally:
+        remove_temp_paths(start)
+
 
 def create_temp_file(
     text: str | bytes | None,
@@ -81,7 +118,7 @@ def create_temp_file(
         path.write_bytes(text)
 
     os.close(fd)
-    atexit.register(lambda: path.unlink(missing_ok=True))
+    TEMP_PATHS.append(path)
     return path
 
 
@@ -93,10 +130,66 @@ def create_temp_dir(
 ) -> Path:
     dirname = tempfile.mkdtemp(suffix, prefix, dir)
     path = Path(dirname)
-    atexit.register(lambda: shutil.rmtree(path))
+    TEMP_PATHS.append(path)
     return path
 
 
+CACHE_DIR_ENV = "PANPDF_CACHE_DIR"
+
+
+def get_cache_dir() -> Path:
+    if path := os.getenv(CACHE_DIR_ENV):
+        return Path(path)
+
+    if path := os.getenv("XDG_CACHE_HOME"):
+        return Path(path) / "panpdf"
+
+    return Path.home() / ".cache" / "panpdf"
+
+
+def get_hash(*parts: str | bytes) -> str:
+    hasher = hashlib.sha256()
+
+    for part in parts:
+        data = part.encode() if isinstance(part, str) else part
+        hasher.update(f"{len(data)}:".encode())
+        hasher.update(data)
+
+    return hasher.hexdigest()
+
+
+def write_cache(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, filename = tempfile.mkstemp(path.suffix, TEMPFILE_PREFIX, path.parent)
+
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+    Path(filename).replace(path)
+
+
+def prune_cache(directory: Path, max_size: int, keep: Iterable[Path] = ()) -> None:
+    """Remove the least recently used files beyond max_size bytes."""
+    keep = {path.absolute() for path in keep}
+    files = []
+
+    for path in directory.iterdir():
+        if path.name.startswith(TEMPFILE_PREFIX):
+            continue
+
+        with contextlib.suppress(FileNotFoundError):
+            stat = path.stat()
+            files.append((path.absolute() in keep, stat.st_mtime, stat.st_size, path))
+
+    size = 0
+
+    for kept, _, file_size, path in sorted(files, reverse=True):
+        if kept or size + file_size <= max_size:
+            size += file_size
+        else:
+            path.unlink(missing_ok=True)
+
+
 def get_file_path(name: Path | str | None, dir: str) -> Path | None:  # noqa: A002
     if not name:
         return None
@@ -136,7 +229,23 @@ def convert_doc(  # noqa: PLR0913
     verbose: bool = False,
     quiet: bool = False,
     transient: bool = False,
+    build_dir: Path | None = None,
+    precompile: bool = False,
+    cache_dir: Path | None = None,
 ) -> Any:  # noqa: ANN401
+    if output_format == "pdf" and (build_dir or precompile):
+        return build_pdf(
+            doc,
+            build_dir or create_temp_dir(),
+            extra_args=extra_args,
+            pandoc_path=pandoc_path,
+            description=description,
+            verbose=verbose,
+            transient=transient or quiet,
+            precompile=precompile,
+            cache_dir=cache_dir,
+        )
+
     if output_format == "latex":
         return pf.convert_text(
             doc,
@@ -147,17 +256,31 @@ def convert_doc(  # noqa: PLR0913
             pandoc_path=pandoc_path,
         )
 
-    with io.StringIO() as f:
-        dump(doc, f)
-        text = f.getvalue()
+    args = create_pdf_args(
+        extra_args=extra_args,
+        pandoc_path=pandoc_path,
+        quiet=quiet,
+    )
 
-    fd, filename = tempfile.mkstemp(".json", text=True)
-    path = Path(filename)
-    path.write_text(text, encoding="utf8")
+    if not description:
+        output = args[args.index("--output") + 1]
+        description = f"Producing {output}"
 
-    os.close(fd)
-    atexit.register(path.unlink)
+    return progress(
+        args,
+        f"[green]{description}",
+        doc=doc,
+        transient=transient or quiet,
+        verbose=verbose,
+    )
 
+
+def create_pdf_args(
+    *,
+    extra_args: list[str] | None = None,
+    pandoc_path: Path | None = None,
+    quiet: bool = False,
+) -> list[str]:
     extra_args = extra_args[:] if extra_args else []
 
     extra_args.extend(["--from", "json", "--to", "pdf", "--standalone", "--verbose"])
@@ -168,52 +291,359 @@ def convert_doc(  # noqa: PLR0913
     if not pandoc_path:
         pandoc_path = get_pandoc_path()
 
-    args = [str(pandoc_path), filename, *extra_args]
+    return [str(pandoc_path), *extra_args]
 
-    if not description:
-        output = extra_args[extra_args.index("--output") + 1]
-        description = f"Producing {output}"
 
-    return progress(
-        args,
-        f"[green]{description}",
-        transient=transient or quiet,
-        verbose=verbose,
+def dumps(obj: Any) -> str:  # noqa: ANN401
+    return json.dumps(
+        obj,
+        default=lambda elem: elem.to_json(),
+        check_circular=False,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+
+
+def iter_json(doc: Doc) -> Iterator[str]:
+    api_version = dumps(doc.api_version)
+    meta = dumps(doc.metadata.content.to_json())
+    yield f'{{"pandoc-api-version":{api_version},"meta":{meta},"blocks":['
+
+    for k, block in enumerate(doc.content):
+        yield f",{dumps(block)}" if k else dumps(block)
+
+    yield "]}"
+
+
+def create_progress(*, transient: bool = False) -> Progress:
+    from rich.progress import (
+        BarColumn,
+        Progress,
+        SpinnerColumn,
+        TextColumn,
+        TimeElapsedColumn,
+    )
+
+    return Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TimeElapsedColumn(),
+        console=get_console(),
+        transient=transient,
     )
 
 
+def create_loggers(
+    progress: Progress,
+    *,
+    verbose: bool = False,
+) -> tuple[Callable[[str], None], Callable[[str], None]]:
+    def stdout(output: str) -> None:
+        if TEMPFILE_PREFIX not in output:
+            progress.log(f"[green]{output}".rstrip())
+
+    def stderr(output: str) -> None:
+        if not verbose and (output.startswith(" ") or TEMPFILE_PREFIX in output):
+            return
+
+        color = get_color(output)
+
+        progress.log(f"[{color}]{output}".rstrip())
+
+    return stdout, stderr
+
+
 def progress(
     args: list[str],
     description: str = "",
     *,
+    doc: Doc | None = None,
     transient: bool = False,
     verbose: bool = False,
 ) -> int | None:
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TimeElapsedColumn(),
-        console=console,
-        transient=transient,
-    ) as progress:
+    with create_progress(transient=transient) as progress:
         task = progress.add_task(description, total=None)
 
-        def stdout(output: str) -> None:
-            if TEMPFILE_PREFIX not in output:
-                progress.log(f"[green]{output}".rstrip())
+        stdout, stderr = create_loggers(progress, verbose=verbose)
+
+        coro = run(args, stdout, stderr, doc)
+
+        returncode = asyncio.run(coro)
+
+        description = "[red bold]Fail" if returncode else "[green bold]Done"
+        progress.update(task, description=description, total=1)
+        progress.advance(task)
+
+        return returncode
+
+
+def progress_all(  # noqa: PLR0913
+    args_list: list[list[str]],
+    description: str = "",
+    *,
+    docs: list[Doc] | None = None,
+    jobs: int | None = None,
+    transient: bool = False,
+    verbose: bool = False,
+) -> list[int | None]:
+    with create_progress(transient=transient) as progress:
+        task = progress.add_task(description, total=len(args_list))
 
-        def stderr(output: str) -> None:
-            if not verbose and (output.startswith(" ") or TEMPFILE_PREFIX in output):
-                return
+        stdout, stderr = create_loggers(progress, verbose=verbose)
 
-            color = get_color(output)
+        async def run_all() -> list[int | None]:
+            semaphore = asyncio.Semaphore(jobs or os.cpu_count() or 1)
 
-            progress.log(f"[{color}]{output}".rstrip())
+            async def run_one(args: list[str], doc: Doc | None) -> int | None:
+                async with semaphore:
+                    returncode = await run(args, stdout, stderr, doc)
 
-        coro = run(args, stdout, stderr)
+                progress.advance(task)
+                return returncode
 
-        returncode = asyncio.run(coro)
+            it = zip(args_list, docs or [None] * len(args_list), strict=True)
+            return await asyncio.gather(*(run_one(*x) for x in it))
+
+        returncodes = asyncio.run(run_all())
+
+        description = "[red bold]Fail" if any(returncodes) else "[green bold]Done"
+        progress.update(task, description=description)
+
+        return returncodes
+
+
+def build_pdf(  # noqa: PLR0913
+    doc: Doc,
+    build_dir: Path,
+    *,
+    extra_args: list[str] | None = None,
+    pandoc_path: Path | None = None,
+    description: str = "",
+    verbose: bool = False,
+    transient: bool = False,
+    precompile: bool = False,
+    cache_dir: Path | None = None,
+) -> int | None:
+    extra_args = extra_args[:] if extra_args else []
+    output = Path(pop_option(extra_args, "--output")[-1])
+    engine, engine_opts = get_pdf_engine(extra_args)
+
+    tex = pf.convert_text(
+        doc,
+        input_format="panflute",
+        output_format="latex",
+        standalone=True,
+        extra_args=extra_args,
+        pandoc_path=pandoc_path,
+    )
+
+    build_dir.mkdir(parents=True, exist_ok=True)
+    path = build_dir / output.with_suffix(".tex").name
+    pdf = path.with_suffix(".pdf")
+
+    if is_up_to_date(path, tex):  # type: ignore
+        returncode = 0
+    else:
+        path.write_text(tex, encoding="utf8")  # type: ignore
+        fmt = None
+        if precompile:
+            fmt = get_format(
+                tex,  # type: ignore
+                engine=engine,
+                engine_opts=engine_opts,
+                cache_dir=cache_dir,
+            )
+        returncode = compile_latex(
+            path,
+            engine=engine,
+            engine_opts=engine_opts,
+            fmt=fmt,
+            bibliography=get_bibliography_tool(extra_args),
+            env=create_tex_env(get_resource_path(extra_args)),
+            description=description or f"[green]Producing {output}",
+            verbose=verbose,
+            transient=transient,
+        )
+
+    if returncode:
+        pdf.unlink(missing_ok=True)
+    else:
+        shutil.copyfile(pdf, output)
+
+    return returncode
+
+
+def is_up_to_date(path: Path, tex: str) -> bool:
+    pdf = path.with_suffix(".pdf")
+    fls = path.with_suffix(".fls")
+
+    if not (pdf.exists() and fls.exists() and path.exists()):
+        return False
+
+    if path.read_text(encoding="utf8") != tex:
+        return False
+
+    mtime = pdf.stat().st_mtime_ns
+    inputs = get_recorded_inputs(fls)
+    return all(p.exists() and p.stat().st_mtime_ns <= mtime for p in inputs)
+
+
+def get_recorded_inputs(fls: Path) -> list[Path]:
+    cwd = Path()
+    inputs: list[Path] = []
+    outputs: set[Path] = set()
+
+    for line in fls.read_text(encoding="utf8", errors="replace").splitlines():
+        kind, _, name = line.partition(" ")
+
+        if kind == "PWD":
+            cwd = Path(name)
+        elif kind == "INPUT":
+            inputs.append(cwd / name)
+        elif kind == "OUTPUT":
+            outputs.add(cwd / name)
+
+    return [p for p in dict.fromkeys(inputs) if p not in outputs]
+
+
+def get_resource_path(args: list[str]) -> list[str]:
+    paths: list[str] = []
+
+    for defaults in pop_option(args[:], "--defaults"):
+        value = get_defaults(defaults, "resource-path") or []
+        paths.extend([value] if isinstance(value, str) else value)
+
+    for value in pop_option(args[:], "--resource-path"):
+        paths.extend(value.split(os.pathsep))
+
+    return paths
+
+
+def create_tex_env(resource_path: Iterable[str]) -> dict[str, str] | None:
+    if not (paths := [p for p in resource_path if p not in ("", ".")]):
+        return None
+
+    texinputs = os.pathsep.join([".", *paths, os.environ.get("TEXINPUTS", "")])
+    return {**os.environ, "TEXINPUTS": texinputs}
+
+
+def get_bibliography_tool(args: list[str]) -> str | None:
+    method = None
+
+    for defaults in pop_option(args[:], "--defaults"):
+        method = get_defaults(defaults, "cite-method") or method
+
+    for name in ("natbib", "biblatex"):
+        if f"--{name}" in args:
+            method = name
+
+    return {"natbib": "bibtex", "biblatex": "biber"}.get(method or "")
+
+
+def pop_option(args: list[str], name: str) -> list[str]:
+    values = []
+    rest = []
+    it = iter(args)
+
+    for arg in it:
+        if arg == name:
+            values.append(next(it, ""))
+        elif arg.startswith(f"{name}="):
+            values.append(arg.split("=", maxsplit=1)[1])
+        else:
+            rest.append(arg)
+
+    args[:] = rest
+    return values
+
+
+def get_pdf_engine(args: list[str]) -> tuple[str, list[str]]:
+    engine = "pdflatex"
+    engine_opts: list[str] = []
+
+    for defaults in pop_option(args[:], "--defaults"):
+        engine = get_defaults(defaults, "pdf-engine") or engine
+        engine_opts = get_defaults(defaults, "pdf-engine-opts") or engine_opts
+
+    if engines := pop_option(args, "--pdf-engine"):
+        engine = engines[-1]
+
+    if opts := pop_option(args, "--pdf-engine-opt"):
+        engine_opts = opts
+
+    return engine, engine_opts
+
+
+LATEX_OPTIONS = [
+    "-interaction=nonstopmode",
+    "-halt-on-error",
+    "-file-line-error",
+    "-recorder",
+]
+AUX_SUFFIXES = [".aux", ".toc", ".lof", ".lot", ".out", ".nav", ".snm", ".vrb"]
+LATEX_ERROR_PATTERN = re.compile(r"^(!|.+?:\d+: )")
+FORMAT_ERROR = "Fatal format file error"
+
+
+def compile_latex(  # noqa: C901, PLR0913
+    path: Path,
+    *,
+    engine: str = "pdflatex",
+    engine_opts: Iterable[str] = (),
+    fmt: Path | None = None,
+    bibliography: str | None = None,
+    env: dict[str, str] | None = None,
+    max_runs: int = 4,
+    description: str = "",
+    transient: bool = False,
+    verbose: bool = False,
+) -> int | None:
+    args = create_latex_args(path, engine=engine, engine_opts=engine_opts, fmt=fmt)
+
+    with create_progress(transient=transient) as progress:
+        task = progress.add_task(description, total=None)
+
+        def stdout(output: str) -> None:
+            if LATEX_ERROR_PATTERN.match(output):
+                progress.log(f"[red]{output}".rstrip())
+            elif verbose:
+                progress.log(f"[{get_color(output)}]{output}".rstrip())
+
+        _, stderr = create_loggers(progress, verbose=verbose)
+        returncode = None
+        outputs: list[str] = []
+
+        def stdout_fmt(output: str) -> None:
+            outputs.append(output)
+            stdout(output)
+
+        for k in range(max_runs):
+            aux = get_aux_hash(path)
+            progress.update(task, description=f"{description} (pass {k + 1})")
+            outputs.clear()
+            returncode = asyncio.run(run(args, stdout_fmt, stderr, env=env))
+
+            # A format the engine cannot load is dropped, and the pass rerun.
+            if returncode and fmt and any(FORMAT_ERROR in x for x in outputs):
+                fmt.unlink(missing_ok=True)
+                fmt = None
+                args = create_latex_args(path, engine=engine, engine_opts=engine_opts)
+                returncode = asyncio.run(run(args, stdout, stderr, env=env))
+
+            if returncode:
+                break
+
+            if k == 0 and bibliography:
+                progress.update(task, description=f"{description} ({bibliography})")
+                bib_args, bib_env = create_bibliography_args(path, bibliography, env)
+                returncode = asyncio.run(run(bib_args, stdout, stderr, env=bib_env))
+
+                if returncode:
+                    break
+
+            elif get_aux_hash(path) == aux:
+                break
 
         description = "[red bold]Fail" if returncode else "[green bold]Done"
         progress.update(task, description=description, total=1)
@@ -222,14 +652,125 @@ def progress(
         return returncode
 
 
+def create_latex_args(
+    path: Path,
+    *,
+    engine: str = "pdflatex",
+    engine_opts: Iterable[str] = (),
+    fmt: Path | None = None,
+) -> list[str]:
+    args = [engine, *LATEX_OPTIONS, f"-output-directory={path.parent.as_posix()}"]
+
+    if fmt:
+        args.append(f"-fmt={fmt.with_suffix('').as_posix()}")
+
+    return [*args, *engine_opts, path.as_posix()]
+
+
+def create_bibliography_args(
+    path: Path,
+    tool: str,
+    env: dict[str, str] | None = None,
+) -> tuple[list[str], dict[str, str]]:
+    if tool == "biber":
+        args = [tool, f"--output-directory={path.parent.as_posix()}", path.stem]
+        return args, env or dict(os.environ)
+
+    # bibtex only writes to absolute paths under TEXMFOUTPUT in paranoid mode.
+    env = {**(env or os.environ), "TEXMFOUTPUT": path.parent.absolute().as_posix()}
+    return [tool, path.with_suffix(".aux").as_posix()], env
+
+
+FORMAT_ENGINES = ("pdflatex", "xelatex")
+BEGIN_DOCUMENT = "\\begin{document}"
+
+
+def get_format(
+    tex: str,
+    *,
+    engine: str = "pdflatex",
+    engine_opts: Iterable[str] = (),
+    cache_dir: Path | None = None,
+) -> Path | None:
+    name = Path(engine).stem
+
+    if name not in FORMAT_ENGINES or BEGIN_DOCUMENT not in tex:
+        return None
+
+    preamble = tex[: tex.index(BEGIN_DOCUMENT)]
+    directory = (cache_dir or get_cache_dir()) / "formats"
+    key = get_hash(preamble, name, get_engine_version(engine), *engine_opts)
+    path = directory / f"{key}.fmt"
+
+    if path.exists():
+        return path
+
+    directory.mkdir(parents=True, exist_ok=True)
+    dump_dir = create_temp_dir(dir=directory)
+    src = dump_dir / path.with_suffix(".tex").name
+    src.write_text(f"{preamble}{BEGIN_DOCUMENT}\n\\end{{document}}\n", encoding="utf8")
+
+    args = [
+        engine,
+        "-ini",
+        "-interaction=batchmode",
+        f"-jobname={path.stem}",
+        f"-output-directory={dump_dir.as_posix()}",
+        f"&{name}",
+        "mylatexformat.ltx",
+        src.as_posix(),
+    ]
+
+    PROFILER.add(subprocesses=1)
+    subprocess.run(args, capture_output=True, check=False)  # noqa: S603
+
+    if not (fmt := dump_dir / path.name).exists():
+        return None
+
+    fmt.replace(path)
+    return path
+
+
+@functools.cache
+def get_engine_version(engine: str) -> str:
+    try:
+        PROFILER.add(subprocesses=1)
+        args = [engine, "--version"]
+        result = subprocess.run(args, capture_output=True, text=True, check=False)  # noqa: S603
+    except OSError:
+        return ""
+
+    return next(iter(result.stdout.splitlines()), "")
+
+
+def get_aux_hash(path: Path) -> str:
+    paths = (path.with_suffix(suffix) for suffix in AUX_SUFFIXES)
+    return get_hash(*(p.read_bytes() for p in paths if p.exists()))
+
+
 async def run(
     args: list[str],
     stdout: Callable[[str], None],
     stderr: Callable[[str], None],
+    doc: Doc | None = None,
+    *,
+    env: dict[str, str] | None = None,
 ) -> int | None:
-    process = await asyncio.create_subprocess_exec(*args, stdout=PIPE, stderr=PIPE)
+    PROFILER.add(subprocesses=1)
+    stdin = PIPE if doc is not None else None
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=stdin,
+        stdout=PIPE,
+        stderr=PIPE,
+        env=env,
+    )
+
+    coros = [log(process.stdout, stdout), log(process.stderr, stderr)]  # type:ignore
+
+    if doc is not None:
+        coros.append(write(process.stdin, doc))  # type:ignore
 
-    coros = log(process.stdout, stdout), log(process.stderr, stderr)  # type:ignore
     await asyncio.gather(*coros)
 
     await process.communicate()
@@ -237,6 +778,39 @@ async def run(
     return process.returncode
 
 
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+async def write(writer: StreamWriter, doc: Doc) -> None:
+    buffer: list[bytes] = []
+    size = 0
+
+    try:
+        for text in iter_json(doc):
+            data = text.encode()
+            buffer.append(data)
+            size += len(data)
+
+            if size >= WRITE_BUFFER_SIZE:
+                await flush(writer, buffer)
+                buffer.clear()
+                size = 0
+
+        await flush(writer, buffer)
+        writer.close()
+        await writer.wait_closed()
+
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+
+
+async def flush(writer: StreamWriter, buffer: list[bytes]) -> None:
+    data = b"".join(buffer)
+    PROFILER.add(nbytes=len(data))
+    writer.write(data)
+    await writer.drain()
+
+
 async def log(reader: StreamReader, write: Callable[[str], None]) -> None:
     while True:
         if reader.at_eof():
@@ -311,9 +885,7 @@ def get_defaults(path: Path | str, name: str) -> Any:  # noqa: ANN401
     if not (default_path := get_defaults_file_path(path)):
         return None
 
-    with default_path.open(encoding="utf8") as f:
-        defaults = yaml.safe_load(f)
-
+    defaults = load_yaml(default_path)
     value = defaults.get(name)
 
     if isinstance(value, str):
@@ -325,6 +897,16 @@ def get_defaults(path: Path | str, name: str) -> Any:  # noqa: ANN401
     return value
 
 
+def load_yaml(path: Path) -> Any:  # noqa: ANN401
+    return _load_yaml(path.resolve(), path.stat().st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=32)
+def _load_yaml(path: Path, mtime: int) -> Any:  # noqa: ANN401, ARG001
+    with path.open(encoding="utf8") as f:
+        return yaml.safe_load(f)
+
+
 def search_path(
     path: Path | str,
     resource_path: Iterable[Path | str] = (),
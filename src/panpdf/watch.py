@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import typer
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Iterator
+
+SUFFIXES = (".md", ".ipynb", ".py", ".yaml", ".yml")
+
+
+@dataclass
+class Watcher:
+    paths: list[Path]
+    suffixes: tuple[str, ...] = SUFFIXES
+    mtimes: dict[Path, float] = field(default_factory=dict, init=False)
+
+    def __post_init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.mtimes = self.snapshot()
+
+    def snapshot(self) -> dict[Path, float]:
+        mtimes = {}
+
+        for path in iter_files(self.paths, self.suffixes):
+            with contextlib.suppress(FileNotFoundError):
+                mtimes[path] = path.stat().st_mtime
+
+        return mtimes
+
+    def poll(self) -> list[Path]:
+        mtimes = self.snapshot()
+        paths = mtimes.keys() | self.mtimes.keys()
+        changed = sorted(p for p in paths if mtimes.get(p) != self.mtimes.get(p))
+        self.mtimes = mtimes
+        return changed
+
+    def ignore(self, paths: Iterable[Path]) -> None:
+        if not (ignored := {path.resolve() for path in paths}):
+            return
+
+        for path, mtime in self.snapshot().items():
+            if path.resolve() in ignored:
+                self.mtimes[path] = mtime
+
+
+def iter_files(paths: Iterable[Path], suffixes: Iterable[str]) -> Iterator[Path]:
+    suffixes = tuple(suffixes)
+
+    for path in paths:
+        if not path.is_dir():
+            yield path
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+            for filename in filenames:
+                if filename.endswith(suffixes):
+                    yield Path(dirpath) / filename
+
+
+def watch_files(
+    build: Callable[[], Iterable[Path] | None],
+    watcher: Watcher,
+    *,
+    interval: float = 0.5,
+    debounce: float = 0.2,
+) -> None:
+    watcher.reset()
+    watcher.ignore(build() or ())
+    typer.secho("Watching for changes. Press Ctrl+C to stop.", fg="cyan")
+
+    try:
+        while True:
+            time.sleep(interval)
+
+            if not (changed := wait(watcher, debounce)):
+                continue
+
+            watcher.ignore(rebuild(build, changed))
+
+    except KeyboardInterrupt:
+        pass
+
+
+def wait(watcher: Watcher, debounce: float) -> list[Path]:
+    changed = set(watcher.poll())
+
+    while changed:
+        time.sleep(debounce)
+
+        if not (paths := watcher.poll()):
+            break
+
+        changed.update(paths)
+
+    return sorted(changed)
+
+
+def rebuild(
+    build: Callable[[], Iterable[Path] | None],
+    changed: list[Path],
+) -> Iterable[Path]:
+    names = ", ".join(path.name for path in changed)
+    start = time.perf_counter()
+
+    try:
+        written = build() or ()
+    except typer.Exit:
+        return ()
+    except Exception as e:  # noqa: BLE001
+        typer.secho(f"Rebuild failed: {e}", fg="red")
+        return ()
+
+    elapsed = time.perf_counter() - start
+    typer.secho(f"Rebuilt in {elapsed:.2f}s ({names})", fg="green")
+    return written
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import platform
+import sys
 from pathlib import Path
 
 import panflute as pf
@@ -24,6 +26,52 @@ def _clear_cache():
     CSL_PATH.unlink(missing_ok=True)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def _cache_dir(tmp_path_factory: pytest.TempPathFactory):
+    mp = pytest.MonkeyPatch()
+    mp.setenv("PANPDF_CACHE_DIR", tmp_path_factory.mktemp("cache").as_posix())
+    yield
+    mp.undo()
+
+
+FAKE_LATEX = """\
+import sys
+from pathlib import Path
+
+args = sys.argv[1:]
+
+if args == ["--version"]:
+    print("pdfTeX 3.141592653-2.6-1.40.26 (Fake)")
+    sys.exit()
+
+options = dict(arg[1:].split("=", 1) for arg in args if "=" in arg)
+path = Path(args[-1])
+output_dir = Path(options["output-directory"])
+log = Path(sys.argv[0]).with_suffix(".log")
+log.write_text((log.read_text() if log.exists() else "") + " ".join(args) + "\\n")
+
+if "-ini" in args:
+    (output_dir / f"{options['jobname']}.fmt").write_text(path.read_text())
+elif "fmt" in options and Path(options["fmt"] + ".fmt").read_text() == "stale":
+    print("(Fatal format file error; I'm stymied)")
+    sys.exit(1)
+else:
+    (output_dir / path.with_suffix(".pdf").name).write_bytes(b"%PDF")
+"""
+
+
+@pytest.fixture
+def fake_latex(tmp_path: Path) -> Path:
+    if platform.system() == "Windows":
+        pytest.skip("shebang script")
+
+    path = tmp_path / "bin" / "pdflatex"
+    path.parent.mkdir()
+    path.write_text(f"#!{sys.executable}\n{FAKE_LATEX}")
+    path.chmod(0o755)
+    return path
+
+
 @pytest.fixture(scope="session")
 def notebook_dir() -> Path:
     return Path("tests/notebooks")
@@ -1,6 +1,9 @@
+import asyncio
+import threading
 from pathlib import Path
 
 import pytest
+from aiohttp import web
 
 
 @pytest.fixture
@@ -8,3 +11,32 @@ def defaults():
     path = Path("tests/examples/defaults.yaml")
     assert path.exists()
     return path
+
+
+@pytest.fixture
+def serve():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runners: list[web.AppRunner] = []
+
+    async def start(app: web.Application) -> str:
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        runners.append(runner)
+        port = runner.addresses[0][1]
+        return f"http://127.0.0.1:{port}"
+
+    def serve(app: web.Application) -> str:
+        return asyncio.run_coroutine_threadsafe(start(app), loop).result()
+
+    yield serve
+
+    for runner in runners:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 import panflute as pf
 import pytest
 from panflute import (
@@ -266,3 +268,103 @@ def test_convert_table_without_caption():
     tex = pf.convert_text(table, input_format="panflute", output_format="latex")
     assert isinstance(tex, str)
     assert "\\caption" not in tex
+
+
+ATTRIBUTES = [
+    "",
+    "{#id}",
+    "{#id .cls}",
+    "{#id .cls1\n.cls2 k1=v1 k2=v2}",
+    "{#fig:id .c .d width=10cm}",
+    "{#fig:png width=4cm}",
+    "{#fig:ab .c k=v}",
+    "{#tbl:id}",
+    "{#sec:1}",
+    "{#.}",
+    "{#fig:source .source}",
+    '{#id .c k="a b" j=\'x y\' l=a\\"b}',
+    "{#a-b:c.d .x-y -}",
+    '{#id class="a b" .c}',
+    "{#id id=foo}",
+    "{#a #b}",
+    "{#id k=v k=w}",
+    "{#id k= j=''}",
+    '{#id k="a\\"b" j="a\\\\b" l="a\\bb"}',
+    '{#id k="&amp;x" j=&amp;}',
+    "{#id k=a\\}b}",
+    "{#あ .い う=え}",
+    "{#id .a.b .c#d}",
+    "{ #id   .c }",
+    "{#id .1a}",
+    '{#id k=" a"}',
+    '{#id k="a"b}',
+    "{#id",
+    "{#id}}",
+]
+
+
+@pytest.mark.parametrize("text", ATTRIBUTES)
+def test_parse_attributes(text: str):
+    from panpdf.filters.attribute import parse_attributes, parse_attributes_pandoc
+
+    expected = parse_attributes_pandoc(text)
+
+    if (attrs := parse_attributes(text)) is None:
+        assert expected == ("", [], {})
+    else:
+        assert attrs == expected
+
+
+@pytest.mark.parametrize("path", sorted(Path("tests/examples/src").glob("*.md")))
+def test_parse_attributes_examples(path: Path):
+    from panpdf.filters.attribute import (
+        iter_attributes,
+        parse_attributes,
+        parse_attributes_pandoc,
+    )
+
+    for block in pf.convert_text(path.read_text(encoding="utf-8")):  # type: ignore
+        if not isinstance(block, Para):
+            continue
+
+        attr = [elem for elem, is_attr in iter_attributes(block.content) if is_attr]
+        text = pf.stringify(Plain(*attr))
+        assert parse_attributes(text) == parse_attributes_pandoc(text)
+
+
+@pytest.mark.parametrize("pandoc", [True, False])
+def test_attribute_pandoc(pandoc):
+    text = '$$a = 1$$ {#eq:a .c k="a b"}\n\n'
+    text += "![a](a.png){#fig:a}\n![b](b.png){#fig:b}\n: x {#fig:x .c}"
+    doc = Attribute(pandoc=pandoc).run(text)
+    span = doc.content[0].content[0]  # type: ignore
+    assert isinstance(span, Span)
+    assert span.identifier == "eq:a"
+    assert span.attributes["k"] == "a b"
+    fig = doc.content[1]
+    assert isinstance(fig, Figure)
+    assert fig.identifier == "fig:x"
+    assert fig.classes == ["c"]
+
+
+def test_set_attributes_fallback(monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import attribute
+    from panpdf.filters.attribute import set_attributes
+
+    calls = []
+
+    def parse_attributes_pandoc(text: str):
+        calls.append(text)
+        return "x", [], {}
+
+    monkeypatch.setattr(attribute, "parse_attributes_pandoc", parse_attributes_pandoc)
+
+    code = Code("text")
+    set_attributes(code, _get_para("{#id .cls}").content)
+    assert code.identifier == "id"
+    assert not calls
+
+    code = Code("text")
+    set_attributes(code, _get_para("{#id .1a}").content)
+    assert code.identifier == "x"
+    assert calls == ["{#id .1a}"]
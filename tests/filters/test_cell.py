@@ -208,6 +208,105 @@ def test_action_text_pandas(store: Store):
     assert isinstance(elems[0], pf.Div)
 
 
+def test_prepare_html(store: Store, monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import cell
+    from panpdf.filters.cell import Cell
+
+    monkeypatch.setattr(cell, "HTML_CACHE", {})
+    text = "![a](cell.ipynb){#text:pandas .output .html}\n\n"
+    text += "![b](){#text:polars .cell .html}\n"
+    doc = pf.convert_text(text, standalone=True)
+    assert isinstance(doc, Doc)
+
+    c = Cell(store=store)
+    store.url = ""
+    c.prepare(doc)
+    assert len(cell.HTML_CACHE) == 2
+    assert store.url == ""
+
+    def convert_text(*args, **kwargs):
+        raise NotImplementedError
+
+    monkeypatch.setattr(cell.pf, "convert_text", convert_text)
+    doc = c.run(doc)
+    assert [type(e).__name__ for e in doc.content] == ["Div", "CodeBlock", "Div"]
+
+
+def test_prepare_html_without_caption(store: Store, monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import cell
+    from panpdf.filters.cell import Cell
+
+    monkeypatch.setattr(cell, "HTML_CACHE", {})
+    calls = []
+    convert_text = cell.pf.convert_text
+
+    def count(*args, **kwargs):
+        calls.append(args)
+        return convert_text(*args, **kwargs)
+
+    text = "![](cell.ipynb){#text:pandas .output .html}\n\n"
+    text += "![](cell.ipynb){#text:polars .output .html}\n"
+    doc = pf.convert_text(text, standalone=True)
+    assert isinstance(doc, Doc)
+    assert all(isinstance(e, pf.Para) for e in doc.content)
+
+    monkeypatch.setattr(cell.pf, "convert_text", count)
+
+    Cell(store=store).prepare(doc)
+    assert len(cell.HTML_CACHE) == 2
+    assert len(calls) == 1
+
+
+def test_convert_html_all(monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import cell
+    from panpdf.filters.cell import convert_html, convert_html_all
+
+    monkeypatch.setattr(cell, "HTML_CACHE", {})
+    texts = ["<p>a</p>", "<p><em>b</em></p>", "<p>a</p>"]
+    convert_html_all(texts)
+    assert len(cell.HTML_CACHE) == 2
+    for text in texts:
+        x = pf.convert_text(text, input_format="html")
+        assert convert_html(text) == x
+
+
+def test_convert_html_all_headings(monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import cell
+    from panpdf.filters.cell import convert_html, convert_html_all
+
+    monkeypatch.setattr(cell, "HTML_CACHE", {})
+    texts = ["<h2>Summary</h2><p>a</p>", "<h2>Summary</h2><p>b</p>", "<p>c</p>"]
+    convert_html_all([*texts, "<p>d</p>"])
+    assert len(cell.HTML_CACHE) == 2
+    for text in texts:
+        x = pf.convert_text(text, input_format="html")
+        assert convert_html(text) == x
+    assert convert_html(texts[1])[0].identifier == "summary"
+
+
+def test_cache_html(monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import cell
+    from panpdf.filters.cell import cache_html
+
+    monkeypatch.setattr(cell, "HTML_CACHE", {})
+    monkeypatch.setattr(cell, "HTML_CACHE_SIZE", 2)
+    for key in "abc":
+        cache_html(key, "[]")
+    assert list(cell.HTML_CACHE) == ["b", "c"]
+
+
+def test_convert_html_all_unbalanced(monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import cell
+    from panpdf.filters.cell import convert_html, convert_html_all
+
+    monkeypatch.setattr(cell, "HTML_CACHE", {})
+    texts = ["<div><p>a</p>", "<p>b</p>"]
+    convert_html_all(texts)
+    assert not cell.HTML_CACHE
+    assert convert_html(texts[1]) == pf.convert_text(texts[1], input_format="html")
+    assert len(cell.HTML_CACHE) == 1
+
+
 def test_figure_image():
     text = "![caption](a.png){#fig:a}"
     list_ = pf.convert_text(text)
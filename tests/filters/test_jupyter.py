@@ -1,13 +1,16 @@
 from __future__ import annotations
 
+import base64
+import copy
 import platform
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 import nbstore.notebook
+import panflute as pf
 import pytest
 import yaml
-from panflute import Doc, Image, Str
+from panflute import Doc, Image, RawInline, Str
 
 from panpdf.filters.jupyter import Jupyter
 
@@ -123,6 +126,63 @@ def test_create_image_file_pgf(store: Store, defaults, use_defaults):
     assert text.startswith("JVBER")
 
 
+def test_create_pgf_file(tmp_path: Path):
+    from panpdf.filters.jupyter import create_pgf_file
+
+    path = create_pgf_file("%% Creator: Matplotlib", tmp_path)
+    assert path.parent == tmp_path
+    assert path.read_text(encoding="utf-8") == "%% Creator: Matplotlib"
+    assert create_pgf_file("%% Creator: Matplotlib", tmp_path) == path
+    assert create_pgf_file("%% Creator: Matplotlib, x", tmp_path) != path
+
+
+@pytest.mark.parametrize("relative", [False, True])
+def test_create_pgf_file_raster(tmp_path: Path, relative: bool):  # noqa: FBT001
+    from panpdf.filters.jupyter import create_pgf_file
+
+    directory = tmp_path / "a-pgf"
+    base = tmp_path if relative else None
+    paths, files = set(), set()
+
+    for k in range(2):
+        raster = tmp_path / f"tmp{k}.png"
+        raster.write_bytes(b"png")
+        text = f"%% Creator: Matplotlib\n\\includegraphics{{{raster}}}\n"
+        paths.add(create_pgf_file(text, directory, base, files))
+        raster.unlink()
+
+    assert len(paths) == 1
+    assert len(files) == 2
+    text = paths.pop().read_text(encoding="utf-8")
+    png = next(path for path in files if path.suffix == ".png")
+    assert png.read_bytes() == b"png"
+    url = f"a-pgf/{png.name}" if relative else png.as_posix()
+    assert f"{{{url}}}" in text
+
+
+@pytest.mark.parametrize("relative", [False, True])
+def test_jupyter_pgf_dir(
+    store: Store,
+    image_factory,
+    tmp_path: Path,
+    relative: bool,  # noqa: FBT001
+):
+    pgf_dir = tmp_path / "a-pgf"
+    pgf_dir.mkdir()
+    (pgf_dir / "old.pgf").touch()
+    base = tmp_path if relative else None
+
+    jupyter = Jupyter(store, pgf_dir=pgf_dir, pgf_base=base)
+    image = jupyter.action(image_factory("pgf.ipynb", "fig:pgf"), Doc())
+    assert isinstance(image, Image)
+    jupyter.finalize(Doc())
+
+    path = pgf_dir / Path(image.url).name
+    assert image.url == ("a-pgf/" + path.name if relative else path.as_posix())
+    assert path.read_text(encoding="utf-8").startswith("%%")
+    assert (pgf_dir / "old.pgf").exists() is not relative
+
+
 @pytest.mark.parametrize("standalone", [False, True])
 def test_jupyter(store: Store, image_factory, defaults, fmt, standalone):
     if fmt == "pgf":
@@ -148,6 +208,8 @@ def test_jupyter(store: Store, image_factory, defaults, fmt, standalone):
         raise
 
     assert isinstance(image, Image)
+    jupyter.finalize(doc)
+
     if fmt == "pgf" and not standalone:
         assert image.url.startswith("%%")
     else:
@@ -167,6 +229,323 @@ def test_jupyter(store: Store, image_factory, defaults, fmt, standalone):
             assert "application/pdf" not in data
 
 
+PGF_TEXT = "%% Creator: Matplotlib, PGF backend\n"
+
+
+@pytest.mark.parametrize(
+    ("data", "keys", "fallback"),
+    [
+        ({"text/plain": PGF_TEXT, "image/png": "x"}, ["image/png"], "image/png"),
+        (
+            {"text/pgf": "x", "text/plain": "a", "application/pdf": "x"},
+            ["text/plain", "application/pdf"],
+            "application/pdf",
+        ),
+        (
+            {"text/plain": PGF_TEXT, "image/png": "x", "application/pdf": "x"},
+            ["image/png", "application/pdf"],
+            "application/pdf",
+        ),
+        (
+            {"text/plain": PGF_TEXT, "image/png": "x", "image/svg+xml": "x"},
+            ["image/png", "image/svg+xml"],
+            "image/svg+xml",
+        ),
+        ({"text/plain": PGF_TEXT}, ["text/plain"], "a standalone build"),
+    ],
+)
+def test_demote_pgf(data, keys, fallback):
+    from panpdf.filters.jupyter import demote_pgf
+
+    x, f = demote_pgf(data)
+    assert list(x) == keys
+    assert f == fallback
+
+
+@pytest.mark.parametrize(
+    ("limit", "demoted"),
+    [(None, False), (0, False), (1000, True)],
+)
+def test_jupyter_pgf_limit(
+    store: Store,
+    image_factory,
+    monkeypatch: pytest.MonkeyPatch,
+    limit: int | None,
+    demoted: bool,  # noqa: FBT001
+):
+    import io
+
+    from rich.console import Console
+
+    from panpdf.filters import jupyter
+
+    console = Console(file=io.StringIO(), width=200)
+    monkeypatch.setattr(jupyter, "get_console", lambda: console)
+
+    jupyter = Jupyter(store, pgf_limit=limit)
+    image = jupyter.action(image_factory("pgf.ipynb", "fig:pgf"), Doc())
+    assert isinstance(image, Image)
+    assert image.url.endswith((".png", ".pdf")) is demoted
+    assert len(jupyter.demoted) == int(demoted)
+
+    jupyter.finalize(Doc())
+    assert not jupyter.demoted
+    output = console.file.getvalue()  # type: ignore
+    assert ("pgf.ipynb#fig:pgf: 29 kB, using image/png" in output) is demoted
+    assert ("larger than 1 kB" in output) is demoted
+
+
+def test_jupyter_draft(store: Store, image_factory):
+    from panpdf.tools import DRAFT_URL
+
+    jupyter = Jupyter(store, standalone=True, draft=True)
+    doc = Doc()
+
+    for identifier in ["fig:pgf", "fig:unknown"]:
+        image = jupyter.action(image_factory("pgf.ipynb", identifier), doc)
+        assert isinstance(image, Image)
+        assert image.url == DRAFT_URL
+
+    jupyter.finalize(doc)
+    assert not jupyter.figures
+    assert "include-in-header" not in doc.metadata
+
+
+def test_jupyter_draft_inline(store: Store):
+    jupyter = Jupyter(store, draft=True)
+    doc = pf.convert_text("a ![x](pgf.ipynb){#fig:pgf width=2cm} b", standalone=True)
+    assert isinstance(doc, Doc)
+    doc = jupyter.run(doc)
+    raw = doc.content[0].content[2]  # type: ignore
+    assert isinstance(raw, RawInline)
+    assert "\\fbox{" in raw.text
+    assert "2cm" in raw.text
+
+
+def test_jupyter_standalone_deferred(store: Store, image_factory):
+    jupyter = Jupyter(store, standalone=True)
+    nb = store.read("pgf.ipynb")
+    data = nbstore.notebook.get_data(nb, "fig:pgf")
+    data.pop("application/pdf", None)
+
+    images = [image_factory("pgf.ipynb", "fig:pgf") for _ in range(3)]
+    for image in images:
+        assert jupyter.action(image, Doc()) is image
+
+    assert len(jupyter.figures) == 3
+    urls = [image.url for image in images]
+    assert [path.as_posix() for _, _, _, path, _ in jupyter.figures] == urls
+    assert len(set(urls)) == 3
+    assert all(url.endswith(".pdf") for url in urls)
+
+
+def test_create_image_files_pgf(store: Store, monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import jupyter
+    from panpdf.filters.jupyter import create_image_files_pgf
+    from panpdf.tools import create_temp_file
+
+    calls = []
+
+    def progress_all(args_list, description="", *, jobs=None, **kwargs):
+        calls.append((args_list, jobs))
+        for args in args_list:
+            output = args[args.index("--output") + 1]
+            Path(output).write_bytes(b"%PDF")
+
+    monkeypatch.setattr(jupyter, "progress_all", progress_all)
+
+    figures = [(f"text{k}", create_temp_file(None, suffix=".pdf")) for k in range(4)]
+    texts = create_image_files_pgf(figures, jobs=2)
+    assert texts == ["JVBERg=="] * 4
+    args_list, jobs = calls[0]
+    assert len(args_list) == 4
+    assert jobs == 2
+    defaults = {args[args.index("--defaults") + 1] for args in args_list}
+    assert len(defaults) == 1
+
+
+def test_get_figure_key(defaults: Path):
+    from panpdf.filters.jupyter import get_figure_key
+
+    key = get_figure_key("a")
+    assert len(key) == 64
+    assert get_figure_key("a") == key
+    assert get_figure_key("b") != key
+    assert get_figure_key("a", preamble="\\usepackage{fontspec}") != key
+    assert get_figure_key("a", defaults=defaults) != key
+
+
+def test_get_figure_key_raster(tmp_path: Path):
+    from panpdf.filters.jupyter import get_figure_key, normalize_pgf
+
+    paths = [tmp_path / f"tmp{k}.png" for k in range(3)]
+    for path, data in zip(paths, [b"a", b"a", b"b"], strict=True):
+        path.write_bytes(data)
+
+    def pgf(path: Path) -> str:
+        return f"\\pgfimage[interpolate=true]{{{path.as_posix()}}}"
+
+    keys = [get_figure_key(pgf(path)) for path in paths]
+    assert keys[0] == keys[1]
+    assert keys[0] != keys[2]
+    assert "tmp0" not in normalize_pgf(pgf(paths[0]))
+    assert normalize_pgf("{x.png}") == "{x.png}"
+
+
+def test_create_image_files_pgf_precompile(fake_latex: Path, tmp_path: Path):
+    from panpdf.filters.jupyter import create_image_files_pgf
+    from panpdf.tools import create_temp_file
+
+    defaults = tmp_path / "defaults.yaml"
+    defaults.write_text(f"pdf-engine: {fake_latex.as_posix()}\n", encoding="utf8")
+
+    figures = [(f"text{k}", create_temp_file(None, suffix=".pdf")) for k in range(3)]
+    for _ in range(2):
+        texts = create_image_files_pgf(
+            figures,
+            defaults=defaults,
+            precompile=True,
+            cache_dir=tmp_path,
+        )
+        assert texts == ["JVBERg=="] * 3
+
+    lines = fake_latex.with_suffix(".log").read_text().splitlines()
+    assert len([line for line in lines if "-ini" in line]) == 1
+    assert len([line for line in lines if "-fmt=" in line]) == 6
+
+
+def test_jupyter_cache(
+    store: Store,
+    image_factory,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+):
+    from panpdf.filters import jupyter
+
+    calls = []
+
+    def progress_all(args_list, description="", **kwargs):
+        calls.append(args_list)
+        for args in args_list:
+            output = args[args.index("--output") + 1]
+            Path(output).write_bytes(b"%PDF")
+
+    monkeypatch.setattr(jupyter, "progress_all", progress_all)
+
+    for _ in range(2):
+        nb = store.read("pgf.ipynb")
+        nbstore.notebook.get_data(nb, "fig:pgf").pop("application/pdf", None)
+        f = Jupyter(store, standalone=True, cache_dir=tmp_path)
+        image = image_factory("pgf.ipynb", "fig:pgf")
+        f.action(image, Doc())
+        f.finalize(Doc())
+
+    assert len(calls) == 1
+    paths = list((tmp_path / "figures").glob("*.pdf"))
+    assert len(paths) == 1
+    assert image.url == paths[0].as_posix()
+    assert paths[0].read_bytes() == b"%PDF"
+
+
+def create_scaled_notebook(path: Path, n: int) -> None:
+    import nbformat
+
+    nb = nbformat.read("tests/notebooks/pgf.ipynb", as_version=4)
+    cell = nb.cells[2]
+    cell.outputs[0].data.pop("application/pdf", None)
+    nb.cells = nb.cells[:2]
+
+    for k in range(n):
+        c = copy.deepcopy(cell)
+        c.source = c.source.replace("#fig:pgf", f"#fig:pgf{k}")
+        nb.cells.append(c)
+
+    nbformat.write(nb, path)
+
+
+@pytest.fixture
+def fake_pdf(monkeypatch: pytest.MonkeyPatch) -> bytes:
+    from panpdf.filters import jupyter
+
+    data = b"%PDF" + bytes(range(256)) * 16
+
+    def progress_all(args_list, description="", **kwargs):
+        for args in args_list:
+            Path(args[args.index("--output") + 1]).write_bytes(data)
+
+    monkeypatch.setattr(jupyter, "progress_all", progress_all)
+    return data
+
+
+@pytest.mark.parametrize("write_back", [True, False])
+def test_jupyter_write_back(
+    image_factory,
+    fake_pdf: bytes,
+    tmp_path: Path,
+    write_back: bool,  # noqa: FBT001
+):
+    from nbstore import Store
+
+    path = tmp_path / "pgf.ipynb"
+    create_scaled_notebook(path, 3)
+    text = path.read_text(encoding="utf-8")
+
+    store = Store(tmp_path)
+    jupyter = Jupyter(store, standalone=True, write_back=write_back)
+    for k in range(3):
+        jupyter.action(image_factory("pgf.ipynb", f"fig:pgf{k}"), Doc())
+
+    jupyter.create_images()
+    assert path.read_text(encoding="utf-8") == text
+    assert list(jupyter.dirty) == ["pgf.ipynb"]
+
+    jupyter.finalize(Doc())
+    assert (path.read_text(encoding="utf-8") == text) is not write_back
+    assert bool(jupyter.dirty) is not write_back
+    assert jupyter.written == ([path] if write_back else [])
+
+
+def test_jupyter_write_back_volume(
+    image_factory,
+    fake_pdf: bytes,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    import nbformat
+    from nbstore import Store
+
+    n = 40
+    path = tmp_path / "pgf.ipynb"
+    create_scaled_notebook(path, n)
+
+    # Volume written when the notebook was rewritten after every figure.
+    nb = nbformat.read(path, as_version=4)
+    before = 0
+    for k in range(n):
+        data = base64.b64encode(fake_pdf).decode()
+        nbstore.notebook.add_data(nb, f"fig:pgf{k}", "application/pdf", data)
+        before += len(nbformat.writes(nb).encode())
+
+    store = Store(tmp_path)
+    sizes = []
+
+    def write(url, nb):
+        Store.write(store, url, nb)
+        sizes.append(path.stat().st_size)
+
+    monkeypatch.setattr(store, "write", write)
+
+    jupyter = Jupyter(store, standalone=True)
+    for k in range(n):
+        jupyter.action(image_factory("pgf.ipynb", f"fig:pgf{k}"), Doc())
+    jupyter.finalize(Doc())
+
+    after = sum(sizes)
+    assert len(sizes) == 1
+    assert after == path.stat().st_size
+    assert after * n // 2 < before
+
+
 def test_jupyter_action(store: Store):
     from panpdf.filters.jupyter import Jupyter
 
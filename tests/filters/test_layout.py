@@ -3,10 +3,22 @@ from pathlib import Path
 
 import panflute as pf
 import pytest
-from panflute import Doc, Figure, Image, Math, Para, RawInline, Span, Str
+from panflute import (
+    Doc,
+    Figure,
+    Image,
+    Math,
+    Para,
+    RawInline,
+    SoftBreak,
+    Space,
+    Span,
+    Str,
+)
 
 from panpdf.filters.attribute import Attribute
 from panpdf.filters.jupyter import Jupyter
+from panpdf.tools import DRAFT_URL
 
 
 def _prepare(text: str):
@@ -151,3 +163,96 @@ def test_get_width():
 
     image = Image(Str("a"), attributes={"width": "50%"})
     assert get_width(image, "width") == "0.5\\columnwidth"
+
+
+PGF = "%% Creator: Matplotlib, PGF backend\n\\begingroup%\n\\endgroup%"
+
+IMAGES = [
+    Image(url="a.png"),
+    Image(url="a.png", identifier="fig:a"),
+    Image(Str("A"), url="a.png", identifier="fig:a_b"),
+    Image(Str("A"), Space(), Str("B"), url="a b/c.pdf", identifier="fig:a"),
+    Image(Str("図"), SoftBreak(), Str("1-a."), url="図.png", identifier="fig:1"),
+    Image(Str("a%b_c{d}&$#"), url="/tmp/panpdf__x.pdf"),
+    Image(Str("A"), url="a.png", attributes={"width": "4cm"}),
+    Image(Str("A"), url="a.png", attributes={"height": "3.50mm"}),
+    Image(Str("A"), url="a.png", attributes={"width": "50%", "height": "2in"}),
+    Image(Str("A"), url="a.png", attributes={"width": "33.3%", "cwidth": "3cm"}),
+    Image(Str("A"), url="a.png", attributes={"width": "10pt", "hspace": "1mm"}),
+    Image(Str("A"), url=PGF, identifier="fig:pgf"),
+    Image(url=PGF),
+    Image(Str("A"), url="/tmp/a.pgf", identifier="fig:pgf"),
+    Image(Str("A"), url=DRAFT_URL, identifier="fig:a", attributes={"width": "50%"}),
+]
+
+
+@pytest.mark.parametrize("image", IMAGES)
+def test_create_figure_tex(image: Image):
+    from panpdf.filters.layout import create_figure_tex, create_figure_tex_pandoc
+
+    tex = create_figure_tex(image)
+    assert tex
+    assert tex == create_figure_tex_pandoc(image)
+
+
+@pytest.mark.parametrize(
+    ("attributes", "width", "height"),
+    [
+        ({}, "\\linewidth", "\\dimexpr(\\linewidth)*3/4\\relax"),
+        ({"width": "50%"}, "0.5\\linewidth", "\\dimexpr(0.5\\linewidth)*3/4\\relax"),
+        ({"width": "4cm", "height": "3cm"}, "4cm", "3cm"),
+    ],
+)
+def test_create_draft_box(attributes, width, height):
+    from panpdf.filters.layout import create_draft_box
+
+    image = Image(url=DRAFT_URL, identifier="fig:a_b", attributes=attributes)
+    tex = create_draft_box(image)
+    assert f"\\parbox[c][{height}][c]{{\\dimexpr({width})-2\\fboxrule\\relax}}" in tex
+    assert "\\ttfamily fig:a\\_b}" in tex
+
+
+FALLBACK_IMAGES = [
+    Image(Str("A"), url="a.svg"),
+    Image(Str("A"), url="a%20b.png"),
+    Image(Str("A"), url="a#b.png"),
+    Image(Str("A"), url="a.png", identifier="図"),
+    Image(Str("a--b"), url="a.png"),
+    Image(Str("a<b"), url="a.png"),
+    Image(Math("x", format="InlineMath"), url="a.png"),
+    Image(Str("A"), url="a.png", attributes={"width": "100px"}),
+    Image(Str("A"), url="a.png", attributes={"width": "2"}),
+    Image(Str("A"), url="a.png", attributes={"page": "2"}),
+]
+
+
+@pytest.mark.parametrize("image", FALLBACK_IMAGES)
+def test_create_figure_tex_fallback(image: Image):
+    from panpdf.filters.layout import create_figure_tex
+
+    assert create_figure_tex(image) is None
+
+
+def test_iter_subfigure_elements(monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import layout
+    from panpdf.filters.layout import iter_subfigure_elements
+
+    def convert_text(*args, **kwargs):
+        raise AssertionError
+
+    monkeypatch.setattr(layout.pf, "convert_text", convert_text)
+
+    image = Image(
+        Str("A"),
+        url="a.png",
+        identifier="fig:a",
+        attributes={"width": "4cm"},
+    )
+    elems = list(iter_subfigure_elements(image, "subfigure", "3cm"))
+    assert len(elems) == 3
+    assert isinstance(elems[0], RawInline)
+    assert elems[0].text.startswith("\\begin{subfigure}{3cm}\n\\centering\n")
+    assert "[width=4cm,keepaspectratio,alt={A}]{a.png}" in elems[0].text
+    assert elems[1] == Str("A")
+    assert isinstance(elems[2], RawInline)
+    assert elems[2].text == "}\\label{fig:a}\n\\end{subfigure}"
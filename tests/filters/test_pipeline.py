@@ -0,0 +1,155 @@
+import re
+from pathlib import Path
+
+import panflute as pf
+import pytest
+from panflute import CodeBlock, Element, Para, Str
+
+from panpdf.filters.attribute import Attribute
+from panpdf.filters.cell import Cell
+from panpdf.filters.crossref import Crossref
+from panpdf.filters.filter import Filter
+from panpdf.filters.jupyter import Jupyter
+from panpdf.filters.layout import Layout
+from panpdf.filters.pipeline import Pipeline
+from panpdf.filters.snippet import Snippet
+from panpdf.filters.verbatim import Verbatim
+
+
+def create_filters(store) -> list[Filter]:
+    return [
+        Attribute(),
+        Snippet(),
+        Cell(store),
+        Jupyter(store),
+        Verbatim(),
+        Layout(),
+        Crossref(),
+    ]
+
+
+def convert(doc) -> str:
+    tex = pf.convert_text(doc, input_format="panflute", output_format="latex")
+    assert isinstance(tex, str)
+    return re.sub(r"panpdf__\w+", "panpdf__", tex)
+
+
+TEXT = """
+# Section {#sec:a}
+
+![a](pgf.ipynb){#fig:pgf}
+
+![b](png.ipynb){#fig:png width=4cm}
+![c](pgf.ipynb){#fig:pgf cwidth=3cm}
+: subcaption [@fig:pgf] {#fig:ab}
+
+$$x=1$$ {#eq:x}
+
+|a|b|
+|-|-|
+|1|2|
+
+: caption [@eq:x] {#tbl:a}
+
+```python {title=abc}
+a = 1
+```
+
+![](cell.ipynb){#.}
+
+![source](){#fig:source .source}
+
+![cell](){#fig:source .cell}
+
+[@fig:ab], [@tbl:a_], [@sec:a], [@panflute]
+"""
+
+
+@pytest.mark.parametrize("path", [*sorted(Path("tests/examples/src").glob("*.md"))])
+def test_pipeline_examples(store, path: Path):
+    text = path.read_text(encoding="utf-8")
+    if "holoviews" in text:
+        text = text.split("![pdf]")[0]
+
+    doc = pf.convert_text(text, standalone=True)
+    for filter_ in create_filters(store):
+        doc = filter_.run(doc)
+
+    expected = convert(doc)
+
+    doc = pf.convert_text(text, standalone=True)
+    doc = Pipeline(create_filters(store)).run(doc)
+    assert convert(doc) == expected
+
+
+def test_pipeline(store):
+    doc = pf.convert_text(TEXT, standalone=True)
+    filters = create_filters(store)
+    for filter_ in filters:
+        doc = filter_.run(doc)
+
+    expected = convert(doc)
+    metadata = doc.metadata.to_json()
+
+    doc = pf.convert_text(TEXT, standalone=True)
+    pipeline = Pipeline(create_filters(store))
+    doc = pipeline.run(doc)
+    assert convert(doc) == expected
+    assert doc.metadata.to_json().keys() == metadata.keys()
+
+    for x, y in zip(filters, pipeline.filters, strict=True):
+        assert len(x.elements) == len(y.elements)
+
+
+def test_pipeline_text():
+    doc = Pipeline([Attribute(), Verbatim()]).run("```python {.output}\na\n```")
+    assert len(doc.content) == 3
+
+
+def test_pipeline_error():
+    with pytest.raises(TypeError):
+        Pipeline().run()
+
+
+def test_repr():
+    assert (
+        repr(Pipeline([Attribute(), Layout()])) == "Pipeline([Attribute(), Layout()])"
+    )
+
+
+class Upper(Filter):
+    def action(self, elem: Element, doc) -> Element:
+        return Str(elem.text.upper())  # type: ignore
+
+
+class Double(Filter):
+    def action(self, elem: Element, doc) -> list[Element]:
+        return [elem, Str(elem.text)]  # type: ignore
+
+
+class Wrap(Filter):
+    def action(self, elem: Element, doc) -> CodeBlock:
+        return CodeBlock(pf.stringify(elem))
+
+
+@pytest.mark.parametrize(
+    "factory",
+    [
+        lambda: [Double(Str), Upper(Str)],
+        lambda: [Upper(Str), Double(Str)],
+        lambda: [Double(Str), Double(Str), Upper(Str)],
+        lambda: [Upper(Str), Wrap(Para), Verbatim()],
+        lambda: [Wrap(Para), Upper(Str)],
+    ],
+)
+def test_pipeline_replacement(factory):
+    text = "abc def\n\nghi"
+    doc = pf.convert_text(text, standalone=True)
+    for filter_ in factory():
+        doc = filter_.run(doc)
+
+    expected = convert(doc)
+
+    doc = pf.convert_text(text, standalone=True)
+    doc = Pipeline(factory()).run(doc)
+    assert convert(doc) == expected
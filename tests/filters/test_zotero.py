@@ -1,7 +1,12 @@
+import asyncio
+import json
 import os
+import socket
+import time
 
 import panflute as pf
 import pytest
+from aiohttp import web
 from panflute import Cite, Doc, Para
 
 
@@ -68,14 +73,14 @@ def test_convert_note():
 
 
 def test_invalid_env():
-    from panpdf.filters.zotero import get_items_api, get_zotero_api
+    from panpdf.filters.zotero import get_items_api, get_zotero_client
 
     name = "ZOTERO_API_KEY"
     if not (env := os.getenv(name)):
         return
 
     os.environ[name] = ""
-    assert not get_zotero_api()
+    assert not get_zotero_client()
     assert get_items_api([]) is None
     os.environ[name] = env
 
@@ -100,6 +105,376 @@ def test_zotero_csl_path():
     assert "generator あα" in csl
 
 
+@pytest.fixture
+def fetched(monkeypatch: pytest.MonkeyPatch) -> list[list[str]]:
+    from panpdf.filters import zotero
+
+    calls = []
+
+    def get_items_zotxt(keys: list[str]) -> list[dict]:
+        calls.append(keys)
+        return [{"id": key, "title": f"あ {key}"} for key in keys if key != "x"]
+
+    monkeypatch.setattr(zotero, "get_items_zotxt", get_items_zotxt)
+    monkeypatch.setattr(zotero, "get_items_api", lambda keys: None)
+    return calls
+
+
+def test_get_items_incremental(fetched: list[list[str]]):
+    from panpdf.filters.zotero import CSL_PATH, get_items
+
+    items = get_items(["a", "b"])
+    assert items
+    assert [item["id"] for item in items] == ["a", "b"]
+    assert fetched == [["a", "b"]]
+
+    items = get_items(["c", "b", "x"])
+    assert items
+    assert [item["id"] for item in items] == ["c", "b"]
+    assert fetched[-1] == ["c", "x"]
+
+    items = get_items(["a", "c"])
+    assert items
+    assert len(fetched) == 2
+
+    csl = CSL_PATH.read_text(encoding="utf-8")
+    assert "あ c" in csl
+    assert len(json.loads(csl)) == 3
+
+
+def test_get_items_verbose(fetched: list[list[str]], capsys: pytest.CaptureFixture):
+    from panpdf.filters.zotero import get_items
+
+    get_items(["a"])
+    get_items(["a", "b", "x"], verbose=True)
+    out = capsys.readouterr().out
+    assert "1 hit(s), 2 miss(es), 1 fetched" in out
+
+
+def test_get_items_none(fetched: list[list[str]]):
+    from panpdf.filters.zotero import CSL_PATH, get_items
+
+    assert get_items(["x"]) is None
+    assert not CSL_PATH.exists()
+
+
+def test_collect_keys():
+    from panpdf.filters.zotero import collect_keys
+
+    doc = pf.convert_text("[@b; @a]\n\n- [@c]\n- [@a]", standalone=True)
+    assert isinstance(doc, Doc)
+    assert collect_keys(doc) == ["b", "a", "c"]
+
+
+def test_collect_keys_crossref():
+    from panpdf.filters.zotero import collect_keys
+
+    doc = pf.convert_text("@fig:a [@tbl:b; @eq:c] [@a]", standalone=True)
+    assert isinstance(doc, Doc)
+    assert collect_keys(doc) == ["a"]
+
+
+def test_zotero_crossref_no_calls(monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters import zotero
+    from panpdf.filters.crossref import Crossref
+
+    calls = []
+    monkeypatch.setattr(zotero, "get_items_zotxt", calls.append)
+    monkeypatch.setattr(zotero, "get_items_api", calls.append)
+
+    doc = pf.convert_text("See @fig:x.", standalone=True)
+    assert isinstance(doc, Doc)
+    filter_ = zotero.Zotero()
+    filter_.prefetch(doc)
+    assert filter_.future is None
+    filter_.run(Crossref().run(doc))
+    assert calls == []
+
+
+def test_zotero_prefetch(fetched: list[list[str]]):
+    from panpdf.filters.zotero import Zotero
+
+    doc = pf.convert_text("[@b; @a; @x]", standalone=True)
+    assert isinstance(doc, Doc)
+    zotero = Zotero()
+    zotero.prefetch(doc)
+    assert zotero.future
+    doc = zotero.run(doc)
+    assert fetched == [["b", "a", "x"]]
+    refs = doc.metadata["references"]
+    assert [pf.stringify(ref["id"]) for ref in refs.content] == ["b", "a"]
+
+
+def test_zotero_prefetch_missing(fetched: list[list[str]]):
+    from panpdf.filters.zotero import Zotero
+
+    doc = pf.convert_text("[@a]", standalone=True)
+    assert isinstance(doc, Doc)
+    zotero = Zotero()
+    zotero.prefetch(doc)
+    doc = pf.convert_text("[@a; @b]", standalone=True)
+    doc = zotero.run(doc)
+    assert fetched == [["a"], ["b"]]
+    assert len(doc.metadata["references"].content) == 2
+
+
+def test_zotero_prefetch_none():
+    from panpdf.filters.zotero import Zotero
+
+    zotero = Zotero()
+    zotero.prefetch(Doc())
+    assert zotero.future is None
+
+
+def create_zotxt() -> tuple[web.Application, dict]:
+    stats = {"requests": 0, "active": 0, "max_active": 0, "flaky": 0}
+
+    async def items(request: web.Request) -> web.Response:
+        stats["requests"] += 1
+        keys = request.query["betterbibtexkey"].split(",")
+
+        if "flaky" in keys and not stats["flaky"]:
+            stats["flaky"] += 1
+            return web.Response(status=503)
+
+        if "slow" in keys:
+            await asyncio.sleep(1)
+
+        if "x" in keys:
+            return web.Response(status=400, text="No item found")
+
+        stats["active"] += 1
+        stats["max_active"] = max(stats["max_active"], stats["active"])
+        await asyncio.sleep(0.02)
+        stats["active"] -= 1
+
+        return web.json_response([{"id": key, "title": f"あ {key}"} for key in keys])
+
+    app = web.Application()
+    app.router.add_get("/zotxt/items", items)
+    return app, stats
+
+
+@pytest.fixture
+def zotxt(serve):
+    from panpdf.filters.zotero import Zotxt
+
+    app, stats = create_zotxt()
+    port = int(serve(app).rsplit(":", 1)[1])
+
+    def zotxt(**kwargs) -> Zotxt:
+        return Zotxt("127.0.0.1", port, **kwargs)
+
+    return zotxt, stats
+
+
+def test_zotxt_get_items(zotxt):
+    factory, stats = zotxt
+    items = factory().get_items(["a", "b", "x"])
+    assert items
+    assert [item["id"] for item in items] == ["a", "b"]
+    assert stats["requests"] == 3
+
+
+def test_zotxt_jobs(zotxt):
+    factory, stats = zotxt
+    items = factory(jobs=2).get_items([f"k{k}" for k in range(10)])
+    assert items
+    assert len(items) == 10
+    assert stats["max_active"] == 2
+
+
+def test_zotxt_batch(zotxt):
+    factory, stats = zotxt
+    items = factory(batch=4).get_items([f"k{k}" for k in range(10)])
+    assert items
+    assert [item["id"] for item in items] == [f"k{k}" for k in range(10)]
+    assert stats["requests"] == 3
+
+
+def test_zotxt_retry(zotxt):
+    factory, stats = zotxt
+    items = factory(backoff=0).get_items(["flaky", "a"])
+    assert items
+    assert [item["id"] for item in items] == ["flaky", "a"]
+    assert stats["requests"] == 3
+
+
+def test_zotxt_timeout(zotxt):
+    factory, _ = zotxt
+    zotxt = factory(timeout=0.1, retries=1, backoff=0)
+    start = time.perf_counter()
+    assert zotxt.get_items(["slow", "a"]) is None
+    items = zotxt.get_items(["a", "slow", "b"])
+    assert items
+    assert [item["id"] for item in items] == ["a", "b"]
+    assert time.perf_counter() - start < 1
+
+
+def test_zotxt_unavailable():
+    from panpdf.filters.zotero import Zotxt
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    assert Zotxt("127.0.0.1", port).get_items(["a"]) is None
+
+
+def create_api(n: int = 250, version: int = 10) -> tuple[web.Application, dict]:
+    library = [
+        {"id": f"1/{k}", "title": f"t{k}", "note": f"Citation Key: key{k}"}
+        for k in range(n)
+    ]
+    versions = [k % version + 1 for k in range(n)]
+    deleted: dict[str, int] = {}
+    stats = {"requests": 0, "active": 0, "max_active": 0, "limited": 0}
+    stats.update(library=library, versions=versions, deleted=deleted, version=version)
+
+    async def items(request: web.Request) -> web.Response:
+        assert request.headers["Zotero-API-Key"] == "secret"
+        assert request.query["format"] == "csljson"
+        stats["requests"] += 1
+        version = stats["version"]
+        headers = {"Last-Modified-Version": str(version)}
+
+        if request.query.get("q") == "limited" and not stats["limited"]:
+            stats["limited"] += 1
+            return web.Response(status=429, headers={"Retry-After": "0.1"})
+
+        if request.query.get("q") == "broken":
+            return web.Response(status=500)
+
+        since = request.headers.get("If-Modified-Since-Version")
+        if since and int(since) >= version:
+            return web.Response(status=304, headers=headers)
+
+        since = int(request.query.get("since", 0))
+        it = zip(library, versions, strict=True)
+        selected = [x for x, v in it if v > since]
+
+        if q := request.query.get("q"):
+            selected = [x for x in selected if q in x["note"]]
+
+        start = int(request.query.get("start", 0))
+        limit = int(request.query.get("limit", 25))
+        headers["Total-Results"] = str(len(selected))
+
+        stats["active"] += 1
+        stats["max_active"] = max(stats["max_active"], stats["active"])
+        await asyncio.sleep(0.02)
+        stats["active"] -= 1
+
+        data = {"items": selected[start : start + limit]}
+        return web.json_response(data, headers=headers)
+
+    async def deleted_items(request: web.Request) -> web.Response:
+        since = int(request.query["since"])
+        keys = [key for key, v in deleted.items() if v > since]
+        return web.json_response({"items": keys})
+
+    app = web.Application()
+    app.router.add_get("/users/123/items", items)
+    app.router.add_get("/users/123/deleted", deleted_items)
+    return app, stats
+
+
+@pytest.fixture
+def api(serve):
+    from panpdf.filters.zotero import ZoteroAPI
+
+    app, stats = create_api()
+    url = serve(app)
+    return ZoteroAPI("123", "secret", url=url, jobs=2), stats
+
+
+def test_api_get_items(api):
+    client, stats = api
+    items = client.get_items(["key3", "key42", "nokey"])
+    assert [item["id"] for item in items] == ["key3", "key42"]
+    assert items[0]["title"] == "t3"
+    assert stats["requests"] == 3
+
+
+def test_api_get_items_failure(serve):
+    from panpdf.filters.zotero import ZoteroAPI
+
+    app, stats = create_api()
+    client = ZoteroAPI("123", "secret", url=serve(app), backoff=0)
+    items = client.get_items(["key3", "broken", "limited", "key4"])
+    assert [item["id"] for item in items] == ["key3", "key4"]
+    assert stats["limited"] == 1
+    assert stats["requests"] == 7
+
+
+def test_api_get_items_retry_after(serve):
+    from panpdf.filters.zotero import ZoteroAPI
+
+    app, _ = create_api()
+    client = ZoteroAPI("123", "secret", url=serve(app), retries=1, backoff=0)
+    start = time.perf_counter()
+    client.get_items(["limited"])
+    assert time.perf_counter() - start > 0.1
+
+
+def test_api_get_items_all_failed(serve):
+    from aiohttp import ClientResponseError
+
+    from panpdf.filters.zotero import ZoteroAPI
+
+    app, _ = create_api()
+    client = ZoteroAPI("123", "secret", url=serve(app), backoff=0)
+
+    with pytest.raises(ClientResponseError):
+        client.get_items(["broken"])
+
+
+def test_get_delay():
+    from panpdf.filters.zotero import get_delay
+
+    assert get_delay({}) == 0
+    assert get_delay({"Retry-After": "2"}) == 2
+    assert get_delay({"Backoff": "3"}) == 3
+    assert get_delay({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+
+
+def test_api_get_library(api):
+    client, stats = api
+    items, deleted, version = client.get_library()
+    assert items
+    assert len(items) == 250
+    assert len({item["id"] for item in items.values()}) == 250
+    assert items["3"]["id"] == "key3"
+    assert deleted == []
+    assert version == 10
+    assert stats["requests"] == 3
+    assert stats["max_active"] == 2
+
+
+def test_api_get_library_since(api):
+    client, stats = api
+    assert client.get_library(10) == (None, [], 10)
+    items, _, version = client.get_library(8)
+    assert items
+    assert len(items) == 50
+    assert version == 10
+
+
+def test_get_items_api_env(serve, monkeypatch: pytest.MonkeyPatch):
+    from panpdf.filters.zotero import get_items_api
+
+    app, _ = create_api()
+    monkeypatch.setenv("ZOTERO_API_URL", serve(app))
+    monkeypatch.setenv("ZOTERO_LIBRARY_ID", "123")
+    monkeypatch.setenv("ZOTERO_API_KEY", "secret")
+    items = get_items_api(["key1"])
+    assert items
+    assert items[0]["id"] == "key1"
+
+    monkeypatch.setenv("ZOTERO_API_KEY", "invalid")
+    assert get_items_api(["key1"]) is None
+
+
 def test_zotero():
     from panpdf.filters.zotero import Zotero
 
@@ -129,3 +504,120 @@ def test_zotero_nokey():
     doc = Doc()
     Zotero().finalize(doc)
     assert not doc.metadata
+
+
+def test_library(tmp_path):
+    from panpdf.library import Library
+
+    library = Library(tmp_path / "zotero.sqlite")
+    assert library.version is None
+    library.update({"A": {"id": "a", "title": "あ"}, "B": {"id": "b"}}, 3)
+    assert len(library) == 2
+    assert library.version == 3
+    assert library.get_items(["b", "x", "a", "b"]) == {
+        "b": {"id": "b"},
+        "a": {"id": "a", "title": "あ"},
+    }
+    library.update({"B": {"id": "c"}}, 4, ["A"])
+    assert library.get_items(["a", "b", "c"]) == {"c": {"id": "c"}}
+    assert library.version == 4
+    library.clear()
+    assert len(library) == 0
+    assert library.version is None
+    library.close()
+
+
+def test_library_schema(tmp_path):
+    import sqlite3
+
+    from panpdf.library import Library
+
+    path = tmp_path / "zotero.sqlite"
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE items (key TEXT PRIMARY KEY, item TEXT)")
+    connection.execute("INSERT INTO items VALUES ('a', '{}')")
+    connection.commit()
+    connection.close()
+
+    library = Library(path)
+    assert len(library) == 0
+    assert library.version is None
+    library.close()
+
+
+def test_sync_library(api, tmp_path):
+    from panpdf.library import Library, sync_library
+
+    client, stats = api
+    library = Library(tmp_path / "zotero.sqlite")
+    assert sync_library(library, client) == 250
+    assert len(library) == 250
+    assert library.version == 10
+    assert sync_library(library, client) is None
+    assert stats["requests"] == 4
+    library.close()
+
+
+def test_sync_library_deleted_and_rekeyed(api, tmp_path):
+    from panpdf.library import Library, sync_library
+
+    client, stats = api
+    library = Library(tmp_path / "zotero.sqlite")
+    sync_library(library, client)
+
+    stats["version"] = 11
+    del stats["library"][0], stats["versions"][0]
+    stats["deleted"]["0"] = 11
+    stats["library"][0]["note"] = "Citation Key: renamed"
+    stats["versions"][0] = 11
+
+    assert sync_library(library, client) == 2
+    assert len(library) == 249
+    assert library.version == 11
+    items = library.get_items(["key0", "key1", "renamed"])
+    assert list(items) == ["renamed"]
+    assert items["renamed"]["title"] == "t1"
+    library.close()
+
+
+def test_get_items_library(api, tmp_path, fetched: list[list[str]]):
+    from panpdf.filters.zotero import get_items
+    from panpdf.library import Library, sync_library
+
+    client, _ = api
+    path = tmp_path / "zotero.sqlite"
+    library = Library(path)
+    sync_library(library, client)
+    library.close()
+
+    items = get_items(["key1", "a", "key2"], library=path)
+    assert items
+    assert [item["id"] for item in items] == ["key1", "a", "key2"]
+    assert fetched == [["a"]]
+
+
+def test_cli_zotero_sync(serve, tmp_path, monkeypatch: pytest.MonkeyPatch):
+    from typer.testing import CliRunner
+
+    from panpdf.main import zotero_app
+
+    app, stats = create_api()
+    monkeypatch.setenv("ZOTERO_API_URL", serve(app))
+    monkeypatch.setenv("ZOTERO_LIBRARY_ID", "123")
+    monkeypatch.setenv("ZOTERO_API_KEY", "secret")
+    args = ["sync", "--cache-dir", str(tmp_path)]
+
+    result = CliRunner().invoke(zotero_app, args)
+    assert result.exit_code == 0
+    assert "Synced 250 item(s): version 10" in result.stdout
+    assert (tmp_path / "zotero.sqlite").exists()
+
+    result = CliRunner().invoke(zotero_app, args)
+    assert "Up to date: version 10" in result.stdout
+
+    result = CliRunner().invoke(zotero_app, [*args, "--full"])
+    assert "Synced 250 item(s)" in result.stdout
+
+    monkeypatch.delenv("ZOTERO_API_KEY")
+    result = CliRunner().invoke(zotero_app, args)
+    assert result.exit_code == 1
@@ -0,0 +1,158 @@
+import sys
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from panpdf.build import build, load_manifest
+
+MANIFEST = """
+notebook-dir: {notebook_dir}
+jobs: 2
+documents:
+  - files: a.md
+    output: out/a.tex
+  - files: [a.md, b.md]
+    output: out/ab.tex
+    standalone: true
+    extra-args: [--wrap=none]
+"""
+
+TEXT_A = "# A {#sec:a}\n\n![a](pgf.ipynb){#fig:pgf}\n\n[@fig:pgf]\n"
+TEXT_B = "# B\n\nあ *b* [@sec:a]\n"
+
+
+@pytest.fixture
+def manifest(tmp_path: Path) -> Path:
+    notebook_dir = Path("tests/notebooks").absolute().as_posix()
+    path = tmp_path / "manifest.yaml"
+    path.write_text(MANIFEST.format(notebook_dir=notebook_dir), encoding="utf8")
+    (tmp_path / "a.md").write_text(TEXT_A, encoding="utf8")
+    (tmp_path / "b.md").write_text(TEXT_B, encoding="utf8")
+    return path
+
+
+def test_load_manifest(manifest: Path):
+    m = load_manifest(manifest)
+    assert m.jobs == 2
+    a, ab = m.documents
+    assert a.files == [manifest.parent / "a.md"]
+    assert a.output == manifest.parent / "out/a.tex"
+    assert a.output_format == "latex"
+    assert a.notebook_dir == ab.notebook_dir
+    assert not a.standalone
+    assert ab.standalone
+    assert ab.extra_args == ["--wrap=none"]
+
+
+@pytest.mark.parametrize(
+    ("text", "match"),
+    [
+        ("documents: []", "No documents"),
+        ("documents:\n  - files: a.md", "requires files and output"),
+        (
+            "documents:\n  - {files: a.md, output: a.pdf, x: 1}",
+            "Unknown manifest keys: x",
+        ),
+        (
+            "documents:\n  - {files: a.md, output: a.docx}",
+            "Unknown output format in manifest: a.docx",
+        ),
+    ],
+)
+def test_load_manifest_error(tmp_path: Path, text: str, match: str):
+    path = tmp_path / "manifest.yaml"
+    path.write_text(text, encoding="utf8")
+    with pytest.raises(ValueError, match=match):
+        load_manifest(path)
+
+
+def test_build(manifest: Path):
+    from panpdf.main import STORES
+
+    reports = build(load_manifest(manifest))
+    assert [r.failed for r in reports] == [False, False]
+    assert all(r.prepare > 0 and r.convert > 0 for r in reports)
+    assert Path("tests/notebooks").absolute() in STORES
+
+    a = (manifest.parent / "out/a.tex").read_text(encoding="utf8")
+    assert "\\section{A}\\label{sec:a}" in a
+    assert "\\ref{fig:pgf}" in a
+
+    ab = (manifest.parent / "out/ab.tex").read_text(encoding="utf8")
+    assert "\\documentclass" in ab
+    assert "あ \\emph{b} \\ref{sec:a}" in ab
+
+
+def test_build_resource_path(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    root = tmp_path / "root"
+    root.mkdir()
+    text = "documents:\n  - {files: a.md, output: a.tex, extra-args: [--citeproc]}"
+    (root / "manifest.yaml").write_text(text, encoding="utf8")
+    text = "---\nbibliography: refs.bib\n---\n\n[@a]\n"
+    (root / "a.md").write_text(text, encoding="utf8")
+    text = "@article{a, title={T}, author={X, Y}, year={2000}}\n"
+    (root / "refs.bib").write_text(text, encoding="utf8")
+
+    monkeypatch.chdir(tmp_path)
+    m = load_manifest(Path("root/manifest.yaml"))
+    reports = build(m)
+    assert not reports[0].failed
+    assert "(X 2000)" in (root / "a.tex").read_text(encoding="utf8")
+
+
+def test_build_error(manifest: Path):
+    m = load_manifest(manifest)
+    m.documents[0].files = [manifest.parent / "x.md"]
+    reports = build(m)
+    assert reports[0].failed
+    assert "x.md" in reports[0].error
+    assert not reports[1].failed
+
+
+def test_cli_build(manifest: Path, monkeypatch: pytest.MonkeyPatch):
+    from panpdf.main import build_app
+
+    monkeypatch.chdir(manifest.parent)
+
+    result = CliRunner().invoke(build_app, [manifest.as_posix()])
+    assert result.exit_code == 0
+    assert "ab.tex" in result.stdout
+    assert "Done" in result.stdout
+
+    (manifest.parent / "a.md").unlink()
+    result = CliRunner().invoke(build_app, [manifest.as_posix()])
+    assert result.exit_code == 1
+    assert "Error" in result.stdout
+
+
+def test_cli_build_with_build_dir(
+    manifest: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+):
+    from panpdf.main import app
+
+    monkeypatch.chdir(manifest.parent)
+    Path("build").mkdir()
+    monkeypatch.setattr(sys, "argv", ["panpdf", "build", manifest.name])
+
+    with pytest.raises(SystemExit) as e:
+        app()
+
+    assert e.value.code == 0
+    assert (manifest.parent / "out/ab.tex").exists()
+    assert "Use ./build for the path" in capsys.readouterr().err
+
+
+def test_cli_build_invalid(tmp_path: Path):
+    from panpdf.main import build_app
+
+    path = tmp_path / "manifest.yaml"
+    path.write_text("jobs: 1\n", encoding="utf8")
+    result = CliRunner().invoke(build_app, [path.as_posix()])
+    assert result.exit_code == 1
+    assert "No documents" in result.stdout
@@ -86,6 +86,308 @@ def test_figure(fmt: str):
         assert f".{fmt}}}" in result.stdout
 
 
+def test_figure_pgf_input(tmp_path: Path):
+    import nbformat
+
+    from panpdf.main import get_store
+
+    nb = get_store(Path("tests/notebooks")).read("pgf.ipynb")
+    cells = [nbformat.v4.new_code_cell(f"# #fig:{k}\nplot()") for k in range(50)]
+    for k, cell in enumerate(cells):
+        pgf = nb.cells[2].outputs[0].data["text/plain"]
+        data = {"text/plain": pgf.replace("\\endgroup%", f"%{k}\n\\endgroup%")}
+        cell.outputs = [nbformat.v4.new_output("display_data", data=data)]
+
+    nbformat.write(nbformat.v4.new_notebook(cells=cells), tmp_path / "a.ipynb")
+    text = "\n\n".join(f"![{k}](a.ipynb){{#fig:{k}}}" for k in range(50))
+    output = tmp_path / "a.tex"
+    args = ["-n", tmp_path.as_posix(), "--no-write-back", "-o", output.as_posix()]
+    runner.invoke(app, args, input=text)
+    tex = output.read_text(encoding="utf-8")
+    assert tex.count("\\input{a-pgf/") == 50
+    assert len(tex) < len(pgf)
+    assert "%% Creator: Matplotlib, " not in tex
+    assert len(list((tmp_path / "a-pgf").glob("*.pgf"))) == 50
+
+    runner.invoke(app, args, input="![0](a.ipynb){#fig:0}")
+    assert len(list((tmp_path / "a-pgf").glob("*.pgf"))) == 1
+
+
+def test_draft():
+    text = "![a](pgf.ipynb){#fig:pgf width=50%}\n\n[@fig:pgf]\n"
+    args = ["-n", "tests/notebooks", "--draft", "--standalone"]
+    result = runner.invoke(app, args, input=text)
+    assert "draft]{article}" in result.stdout
+    assert "\\fbox{\\parbox[c][\\dimexpr(0.5\\linewidth)*3/4" in result.stdout
+    assert "\\caption{a}\\label{fig:pgf}" in result.stdout
+    assert "\\ref{fig:pgf}" in result.stdout
+    assert "\\usepackage{pgf}" not in result.stdout
+
+
+def test_draft_inline():
+    text = "Text ![a](pgf.ipynb){#fig:pgf width=2cm} text.\n"
+    args = ["-n", "tests/notebooks", "--draft"]
+    result = runner.invoke(app, args, input=text)
+    assert "panpdf:draft" not in result.stdout
+    assert "\\fbox{\\parbox[c][\\dimexpr(2cm)*3/4" in result.stdout
+
+
+def test_sequential():
+    text = "# a {#sec:a}\n\n![a](pgf.ipynb){#fig:pgf}\n\n[@fig:pgf] [@sec:a]\n"
+    args = ["-n", "tests/notebooks"]
+    result = runner.invoke(app, args, input=text)
+    assert "\\ref{fig:pgf}" in result.stdout
+    sequential = runner.invoke(app, [*args, "--sequential"], input=text)
+    assert result.stdout == sequential.stdout
+
+
+def test_get_subcommand(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+):
+    from panpdf.main import get_subcommand, zotero_app
+
+    subcommands = {"zotero": zotero_app}
+    assert get_subcommand(subcommands, ["zotero", "sync"]) is zotero_app
+    assert get_subcommand(subcommands, ["a.md"]) is None
+    assert get_subcommand(subcommands, []) is None
+    assert not capsys.readouterr().err
+
+    monkeypatch.chdir(tmp_path)
+    Path("zotero").mkdir()
+    assert get_subcommand(subcommands, ["zotero"]) is zotero_app
+    assert "Use ./zotero for the path" in capsys.readouterr().err
+    assert get_subcommand(subcommands, ["./zotero"]) is None
+
+
+def test_watch_no_files():
+    result = runner.invoke(app, ["--watch"], input="a")
+    assert "No input files to watch" in result.stdout
+
+
+def test_watch(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from panpdf import watch
+
+    path = tmp_path / "a.md"
+    path.write_text("# a\n", encoding="utf-8")
+    output = tmp_path / "a.tex"
+    texts = iter(["# b\n", None])
+
+    def sleep(seconds: float) -> None:
+        if seconds == 0.5:  # noqa: PLR2004
+            if (text := next(texts)) is None:
+                raise KeyboardInterrupt
+            path.write_text(text, encoding="utf-8")
+            path.touch()
+
+    monkeypatch.setattr(watch.time, "sleep", sleep)
+    result = runner.invoke(app, [path.as_posix(), "-o", output.as_posix(), "-w"])
+    assert "Rebuilt in" in result.stdout
+    assert "(a.md)" in result.stdout
+    assert "section{b}" in output.read_text(encoding="utf-8")
+
+
+def test_parse_text(tmp_path: Path):
+    from panpdf.main import parse_text
+
+    cache = {}
+    doc = parse_text("# a", [], cache=cache)
+    assert len(cache) == 1
+    assert parse_text("# a", [], cache=cache).to_json() == doc.to_json()
+    assert len(cache) == 1
+    parse_text("# b", [], cache=cache)
+    assert len(cache) == 1
+    assert next(iter(cache)).endswith("# b")
+    parse_text("# b", ["--wrap=none"], cache=cache)
+    assert next(iter(cache)).startswith("--wrap=none")
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_parse_files(tmp_path: Path, jobs: int):
+    from panpdf.main import get_text, parse_files, parse_text
+
+    files = [Path("tests/examples/src")]
+    doc = parse_text(get_text(files), [])
+
+    for _ in range(2):
+        x = parse_files(files, [], jobs=jobs, cache_dir=tmp_path)
+        assert x.to_json() == doc.to_json()
+
+    assert len(list((tmp_path / "ast").glob("*.json"))) == 3
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_parse_files_cross_references(tmp_path: Path, jobs: int):
+    import panflute as pf
+
+    from panpdf.main import get_text, parse_files, parse_text
+
+    texts = [
+        "# A\n\nSee [the site][ref] and a note[^n].\n\n(@) One.\n",
+        "# B\n\n[ref]: https://example.com\n\n[^n]: The note.\n\n(@) Two.\n",
+        "# C\n\nText.\n",
+    ]
+    files = []
+    for k, text in enumerate(texts):
+        files.append(tmp_path / f"{k}.md")
+        files[-1].write_text(text, encoding="utf8")
+
+    doc = parse_text(get_text(files), [])
+    x = parse_files(files, [], jobs=jobs, cache_dir=tmp_path)
+    assert x.to_json() == doc.to_json()
+
+    para = x.content[1]
+    assert isinstance(para.content[2], pf.Link)
+    assert any(isinstance(e, pf.Note) for e in para.content)
+
+
+def test_parse_files_changed(tmp_path: Path):
+    from panpdf.main import parse_files
+
+    a, b = tmp_path / "a.md", tmp_path / "b.md"
+    a.write_text("---\ntitle: A\n---\n\n# X\n", encoding="utf8")
+    b.write_text("---\nauthor: B\n---\n\n# X\n", encoding="utf8")
+    doc = parse_files([a, b], [], cache_dir=tmp_path)
+    assert [h.identifier for h in doc.content] == ["x", "x-1"]
+    assert sorted(doc.metadata.content) == ["author", "title"]
+
+    b.write_text("# Y\n", encoding="utf8")
+    doc = parse_files([a, b], [], cache_dir=tmp_path)
+    assert [h.identifier for h in doc.content] == ["x", "y"]
+    assert len(list((tmp_path / "ast").glob("*.json"))) == 3
+
+
+@pytest.mark.parametrize(
+    ("texts", "expected"),
+    [
+        (["# A\n\n[x][r]\n\n[r]: u\n", "# B\n\n[y][s]\n\n[s]: v\n"], True),
+        (["[x][r]\n", "[r]: u\n"], False),
+        (["[x][R  Q]\n", "[r q]: u\n"], False),
+        (["a[^1]\n\n[^1]: n\n", "b[^1]\n\n[^1]: m\n"], False),
+        (["a[^n]\n", "[^n]: n\n"], False),
+        (["# Intro\n", "See [Intro].\n"], False),
+        (["# Intro\n", "# Intro\n"], True),
+        (["(@) a\n", "(@) b\n"], False),
+        (["(@a) a\n", "See (@a).\n"], False),
+        (["(@) a\n", "b\n"], True),
+        (["- a\n- b\n", "- c\n"], False),
+        (["1. a\n", "b\n"], False),
+        (["- a\n\n  b\n", "c\n"], False),
+        (["```\na\n", "b\n```\n"], False),
+        (["~~~~\n~~~\n", "~~~~\n"], False),
+        (["```\na\n```\n", "b\n"], True),
+        (["::: x\na\n", "b\n:::\n"], False),
+        (["::: x\na\n:::\n", "b\n"], True),
+        (["a\n", "    b\n"], False),
+        (["\\newcommand{\\R}{\\mathbb{R}}\n", "$\\R$\n"], False),
+        (["\\def\\x{y}\n", "$x$\n"], False),
+        (["$x$\n", "$y$\n"], True),
+    ],
+)
+def test_is_self_contained(texts: list[str], expected: bool):  # noqa: FBT001
+    from panpdf.main import is_self_contained
+
+    assert is_self_contained(texts) is expected
+
+
+@pytest.mark.parametrize(
+    "texts",
+    [
+        ["- a\n- b\n", "- c\n"],
+        ["```\na\n", "b\n```\n"],
+        ["::: x\na\n", "b\n:::\n"],
+        ["- a\n", "    b\n"],
+        ["\\newcommand{\\R}{\\mathbb{R}}\n", "$\\R$\n"],
+    ],
+)
+def test_parse_files_open_blocks(tmp_path: Path, texts: list[str]):
+    from panpdf.main import get_text, parse_files, parse_text
+
+    files = []
+    for k, text in enumerate(texts):
+        files.append(tmp_path / f"{k}.md")
+        files[-1].write_text(text, encoding="utf8")
+
+    doc = parse_text(get_text(files), [])
+    x = parse_files(files, [], jobs=2, cache_dir=tmp_path)
+    assert x.to_json() == doc.to_json()
+
+
+@pytest.mark.parametrize("use_defaults", [False, True])
+def test_parse_files_stateful_filter(tmp_path: Path, use_defaults: bool):  # noqa: FBT001
+    from panpdf.main import get_text, parse_files, parse_text
+
+    lua = tmp_path / "count.lua"
+    code = "local n = 0\nfunction Str(s) n = n + 1 return pandoc.Str(s.text .. n) end\n"
+    lua.write_text(code, encoding="utf8")
+    defaults = tmp_path / "defaults.yaml"
+    defaults.write_text(f"filters:\n- {lua.as_posix()}\n", encoding="utf8")
+    args, defaults_path = ["-L", lua.as_posix()], None
+    if use_defaults:
+        args, defaults_path = ["--defaults", defaults.as_posix()], defaults
+
+    files = [tmp_path / "a.md", tmp_path / "b.md"]
+    files[0].write_text("A\n", encoding="utf8")
+    files[1].write_text("B\n", encoding="utf8")
+
+    doc = parse_text(get_text(files), args, None, defaults_path)
+    x = parse_files(files, args, None, defaults_path, jobs=2, cache_dir=tmp_path)
+    assert x.to_json() == doc.to_json()
+    assert x.to_json()["blocks"][1]["c"][0]["c"] == "B2"
+
+
+def test_parse_files_filter_changed(tmp_path: Path):
+    from panpdf.main import parse_files
+
+    a = tmp_path / "a.md"
+    a.write_text("a\n", encoding="utf8")
+    lua = tmp_path / "f.lua"
+    defaults = tmp_path / "defaults.yaml"
+    defaults.write_text(f"filters:\n- {lua.as_posix()}\n", encoding="utf8")
+    args = ["--defaults", defaults.as_posix()]
+
+    for text in ["b", "c"]:
+        code = f'function Str(s) return pandoc.Str("{text}") end\n'
+        lua.write_text(code, encoding="utf8")
+        doc = parse_files([a], args, None, defaults, cache_dir=tmp_path)
+        assert doc.to_json()["blocks"][0]["c"][0]["c"] == text
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("Hello World!", "hello-world"),
+        ("1. Intro *x* `a b`", "intro-x-a-b"),
+        ("A_b-c.d", "a_b-c.d"),
+        ("Sec $x^2$", "sec-x2"),
+        ("123", "section"),
+    ],
+)
+def test_get_identifier(text: str, expected: str):
+    import panflute as pf
+
+    from panpdf.main import get_identifier
+
+    header = pf.convert_text(f"# {text}")[0]  # type: ignore
+    assert header.identifier == expected
+    assert get_identifier(header.to_json()["c"][2]) == expected
+
+
+def test_profile(tmp_path: Path):
+    import json
+
+    path = tmp_path / "profile.json"
+    text = "# a {#sec:a}\n\n![a](pgf.ipynb){#fig:pgf}\n\n[@fig:pgf]\n"
+    args = ["-n", "tests/notebooks", "--profile-json", path.as_posix()]
+    result = runner.invoke(app, args, input=text)
+    assert "\\ref{fig:pgf}" in result.stdout
+    stages = [x["stage"] for x in json.loads(path.read_text(encoding="utf8"))]
+    assert stages[0] == "parse"
+    assert "filters/Jupyter" in stages
+    assert stages[-1] == "convert"
+
+
 def test_output_format():
     from panpdf.main import OutputFormat, get_output_format
 
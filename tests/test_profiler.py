@@ -0,0 +1,49 @@
+import json
+from pathlib import Path
+
+import panflute as pf
+
+from panpdf.profiler import PROFILER, profile
+
+
+def test_stage_disabled():
+    PROFILER.reset()
+    with PROFILER.stage("a"):
+        pass
+
+    assert not PROFILER.stages
+
+
+def test_profile(tmp_path: Path):
+    with profile() as profiler:
+        with profiler.stage("a"):
+            pf.convert_text("a")
+            with profiler.stage("b"):
+                profiler.add(subprocesses=2, nbytes=10)
+
+        with profiler.stage("a"):
+            pass
+
+    assert not PROFILER.enabled
+    a, b = profiler.stages.values()
+    assert a.name == "a"
+    assert a.calls == 2
+    assert a.subprocesses == 3
+    assert a.bytes > 10
+    assert b.depth == 1
+    assert b.subprocesses == 2
+    assert b.bytes == 10
+    assert a.time >= b.time
+
+    path = tmp_path / "profile.json"
+    profiler.write_json(path)
+    data = json.loads(path.read_text(encoding="utf8"))
+    assert [x["stage"] for x in data] == ["a", "a/b"]
+
+
+def test_create_table():
+    with profile() as profiler, profiler.stage("a"):
+        pass
+
+    table = profiler.create_table()
+    assert table.row_count == 1
@@ -0,0 +1,175 @@
+import io
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from panpdf.server import (
+    can_forward,
+    create_server,
+    environ,
+    filter_env,
+    forward,
+    get_socket_path,
+    is_private,
+    is_running,
+)
+
+
+@pytest.fixture(scope="module")
+def socket_path(tmp_path_factory: pytest.TempPathFactory):
+    path = tmp_path_factory.mktemp("server") / "panpdf.sock"
+    tmpdir = path.parent / "tmp"
+    tmpdir.mkdir()
+    env = {**os.environ, "TMPDIR": str(tmpdir)}
+    code = (
+        "import sys, pathlib, tempfile, panpdf.server as s; "
+        "tempfile.gettempdir(); s.serve(pathlib.Path(sys.argv[1]))"
+    )
+    proc = subprocess.Popen([sys.executable, "-c", code, str(path)], env=env)
+
+    for _ in range(100):
+        if is_running(path):
+            break
+        time.sleep(0.1)
+
+    yield path
+
+    proc.terminate()
+    proc.wait()
+
+
+@pytest.mark.parametrize(
+    ("args", "expected"),
+    [
+        (["a.md"], True),
+        (["zotero", "sync"], True),
+        (["serve"], False),
+        (["a.md", "--watch"], False),
+        (["a.md", "-w"], False),
+        (["a.md", "--", "-w"], True),
+    ],
+)
+def test_can_forward(args, expected):
+    assert can_forward(args) is expected
+
+
+def test_forward_no_server(tmp_path: Path):
+    assert forward(["--version"], tmp_path / "panpdf.sock") is None
+
+
+def test_forward_version(socket_path: Path, capsys: pytest.CaptureFixture):
+    assert forward(["--version"], socket_path) == 0
+    assert "panpdf 0." in capsys.readouterr().out
+
+
+def test_forward_file(
+    socket_path: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+):
+    monkeypatch.chdir(tmp_path)
+    Path("a.md").write_text("# Section\n\nあ *x*\n", encoding="utf8")
+
+    for _ in range(2):
+        assert forward(["a.md"], socket_path) == 0
+        out = capsys.readouterr().out
+        assert "\\section{Section}" in out
+        assert "あ \\emph{x}" in out
+
+
+def test_forward_temp_paths(
+    socket_path: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+):
+    monkeypatch.chdir(tmp_path)
+    Path("a.md").write_text("---\nrhead: あ\n---\n\n# a\n", encoding="utf8")
+    assert forward(["a.md", "-s"], socket_path) == 0
+    assert "あ" in capsys.readouterr().out
+    assert list((socket_path.parent / "tmp").iterdir()) == []
+
+
+def test_forward_stdin(
+    socket_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+):
+    monkeypatch.setattr(sys, "stdin", io.StringIO("*x*"))
+    assert forward(["--", "--wrap=none"], socket_path) == 0
+    assert "\\emph{x}" in capsys.readouterr().out
+
+
+def test_forward_error(socket_path: Path, capsys: pytest.CaptureFixture):
+    assert forward(["--unknown"], socket_path) == 2
+    assert "--unknown" in capsys.readouterr().err
+
+
+def test_create_server_running(socket_path: Path):
+    with pytest.raises(FileExistsError):
+        create_server(socket_path)
+
+
+def test_create_server_stale(tmp_path: Path):
+    path = tmp_path / "panpdf.sock"
+    path.touch()
+    server = create_server(path)
+    assert is_running(path)
+    server.server_close()
+
+
+def test_create_server_not_private(tmp_path: Path):
+    tmp_path.chmod(0o777)
+    path = tmp_path / "panpdf.sock"
+
+    with pytest.raises(PermissionError):
+        create_server(path)
+
+    assert not path.exists()
+
+
+def test_forward_not_private(socket_path: Path):
+    socket_path.parent.chmod(0o770)
+
+    try:
+        assert not is_private(socket_path)
+        assert forward(["--version"], socket_path) is None
+    finally:
+        socket_path.parent.chmod(0o700)
+
+    assert is_private(socket_path)
+
+
+def test_get_socket_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.delenv("PANPDF_SOCKET", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert get_socket_path() == tmp_path / "panpdf" / "panpdf.sock"
+
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    path = get_socket_path()
+    assert path.name == "panpdf.sock"
+    assert path.parent.name.startswith("panpdf-")
+
+
+def test_filter_env():
+    env = {"PATH": "a", "ZOTERO_API_KEY": "b", "TEXINPUTS": "c", "AWS_SECRET": "d"}
+    assert filter_env(env) == {"PATH": "a", "ZOTERO_API_KEY": "b", "TEXINPUTS": "c"}
+
+
+def test_environ(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("ZOTERO_API_KEY", "server")
+    monkeypatch.setenv("SERVER_ONLY", "x")
+
+    with environ(str(tmp_path), {"PANPDF_X": "client"}):
+        assert Path.cwd() == tmp_path
+        assert os.environ["PANPDF_X"] == "client"
+        assert os.environ["SERVER_ONLY"] == "x"
+        assert "ZOTERO_API_KEY" not in os.environ
+
+    assert os.environ["ZOTERO_API_KEY"] == "server"
+    assert "PANPDF_X" not in os.environ
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Import time budget in seconds, summed over all modules imported at startup.
+# Slow runners can relax it: PANPDF_STARTUP_BUDGET=1.5 pytest tests/test_startup.py
+BUDGET = float(os.getenv("PANPDF_STARTUP_BUDGET", "0.6"))
+
+LAZY_MODULES = [
+    "aiohttp",
+    "nbstore",
+    "rich.progress",
+    "sqlite3",
+    "panpdf.filters.jupyter",
+    "panpdf.filters.zotero",
+]
+
+
+def importtime(args: list[str], text: str = "") -> dict[str, int]:
+    code = "import sys; from panpdf.server import main; sys.argv[0] = 'panpdf'; main()"
+    env = {**os.environ, "PANPDF_SOCKET": "/nonexistent/panpdf.sock"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *args],
+        input=text,
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            self, _, name = line.removeprefix("import time:").split("|")
+            if self.strip().isdigit():
+                times[name.strip()] = int(self)
+
+    return times
+
+
+STARTUP_ARGS = [(["--version"], ""), (["--to", "latex"], "# Title\n\nText [@a].\n")]
+
+
+@pytest.mark.parametrize(("args", "text"), STARTUP_ARGS)
+def test_startup(args: list[str], text: str):
+    times = importtime(args, text)
+    assert "panpdf.main" in times
+
+    for name in LAZY_MODULES:
+        assert name not in times
+
+
+@pytest.mark.parametrize(("args", "text"), STARTUP_ARGS)
+def test_startup_budget(args: list[str], text: str):
+    times = importtime(args, text)
+    assert sum(times.values()) / 1e6 < BUDGET
@@ -1,7 +1,10 @@
 import asyncio
 import atexit
+import io
 import os
+import platform
 import shutil
+import sys
 import tempfile
 import uuid
 from pathlib import Path
@@ -63,6 +66,63 @@ def test_create_temp_dir(tmp_path):
     assert path.parent == tmp_path
 
 
+def test_prune_cache(tmp_path: Path):
+    from panpdf.tools import prune_cache
+
+    paths = [tmp_path / f"{k}.pgf" for k in range(4)]
+    for k, path in enumerate(paths):
+        path.write_bytes(b"x" * 10)
+        os.utime(path, (k, k))
+
+    prune_cache(tmp_path, 25, keep=[paths[0]])
+    assert [path.exists() for path in paths] == [True, False, False, True]
+
+    prune_cache(tmp_path, 0)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_temp_paths(tmp_path):
+    from panpdf.tools import create_temp_dir, create_temp_file, temp_paths
+
+    outer = create_temp_file("a", dir=tmp_path)
+
+    with temp_paths():
+        path = create_temp_file("b", dir=tmp_path)
+        directory = create_temp_dir(dir=tmp_path)
+        (directory / "c.txt").touch()
+
+    assert not path.exists()
+    assert not directory.exists()
+    assert outer.exists()
+
+
+def test_get_cache_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    from panpdf.tools import get_cache_dir
+
+    monkeypatch.setenv("PANPDF_CACHE_DIR", tmp_path.as_posix())
+    assert get_cache_dir() == tmp_path
+
+    monkeypatch.delenv("PANPDF_CACHE_DIR")
+    monkeypatch.setenv("XDG_CACHE_HOME", tmp_path.as_posix())
+    assert get_cache_dir() == tmp_path / "panpdf"
+
+
+def test_get_hash():
+    from panpdf.tools import get_hash
+
+    assert get_hash("a", b"b") == get_hash(b"a", "b")
+    assert get_hash("ab") != get_hash("a", "b")
+
+
+def test_write_cache(tmp_path: Path):
+    from panpdf.tools import write_cache
+
+    path = tmp_path / "a" / "b.pdf"
+    write_cache(path, b"%PDF")
+    assert path.read_bytes() == b"%PDF"
+    assert list(path.parent.iterdir()) == [path]
+
+
 def test_get_file_path():
     from panpdf.tools import get_file_path
 
@@ -136,6 +196,319 @@ def test_progress():
     assert not progress(args)
 
 
+def test_progress_doc(tmp_path: Path):
+    from panpdf.tools import progress
+
+    path = tmp_path / "a.json"
+    code = f"import sys;open({path.as_posix()!r},'wb').write(sys.stdin.buffer.read())"
+    doc = pf.convert_text("# a\n\nb", standalone=True)
+    assert isinstance(doc, Doc)
+    assert progress(["python", f"-c{code}"], doc=doc) == 0
+    assert pf.load(path.open(encoding="utf8")).to_json() == doc.to_json()
+
+
+def test_progress_doc_broken_pipe():
+    from panpdf.tools import progress
+
+    doc = Doc(*(Para(Str("a" * 1000)) for _ in range(1000)))
+    assert progress(["python", "-c1/0"], doc=doc) == 1
+
+
+@pytest.mark.parametrize("text", ["", "a", "---\ntitle: x\n---\n\n# a\n\nb $c$"])
+def test_iter_json(text: str):
+    from panflute.io import dump
+
+    from panpdf.tools import iter_json
+
+    doc = pf.convert_text(text, standalone=True)
+    assert isinstance(doc, Doc)
+
+    with io.StringIO() as f:
+        dump(doc, f)
+        expected = f.getvalue()
+
+    assert "".join(iter_json(doc)) == expected
+
+
+def test_create_pdf_args():
+    from panpdf.tools import create_pdf_args
+
+    args = create_pdf_args(extra_args=["-o", "a.pdf"], quiet=True)
+    assert args[1:3] == ["-o", "a.pdf"]
+    assert args[-1] == "--quiet"
+    assert not any(arg.endswith(".json") for arg in args)
+
+
+def test_progress_all():
+    from panpdf.tools import progress_all
+
+    args_list = [
+        ["python", "-cimport time;time.sleep(0.2)"],
+        ["python", "-c1/0"],
+        ["python", "--version"],
+    ]
+    assert progress_all(args_list, jobs=2) == [0, 1, 0]
+
+
+FAKE_ENGINE = """\
+import os
+import re
+import sys
+from pathlib import Path
+
+path = Path(sys.argv[-1])
+runs = path.with_suffix(".runs")
+runs.write_text(runs.read_text() + "x" if runs.exists() else "x")
+text = path.read_text()
+aux = [line for line in text.splitlines() if line.startswith("\\\\section")]
+path.with_suffix(".aux").write_text("\\n".join(aux))
+path.with_suffix(".pdf").write_bytes(b"%PDF")
+fls = [f"PWD {Path.cwd()}", f"INPUT {path}", f"OUTPUT {path.with_suffix('.pdf')}"]
+for name in re.findall(r"includegraphics[^{]*[{]([^}]+)[}]", text):
+    for directory in os.environ.get("TEXINPUTS", ".").split(os.pathsep):
+        if directory and (Path(directory) / name).exists():
+            fls.append(f"INPUT {Path(directory) / name}")
+            break
+path.with_suffix(".fls").write_text("\\n".join(fls))
+"""
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="shebang script")
+def test_build_pdf(tmp_path: Path):
+    from panpdf.tools import build_pdf
+
+    engine = tmp_path / "engine"
+    engine.write_text(f"#!{sys.executable}\n{FAKE_ENGINE}")
+    engine.chmod(0o755)
+
+    output = tmp_path / "a.pdf"
+    build_dir = tmp_path / "build"
+    args = ["--output", output.as_posix(), f"--pdf-engine={engine}"]
+    runs = build_dir / "a.runs"
+
+    def build(text: str) -> int:
+        doc = pf.convert_text(text, standalone=True)
+        assert build_pdf(doc, build_dir, extra_args=args) == 0  # type: ignore
+        return len(runs.read_text())
+
+    assert build("# A\n\nabc") == 2
+    assert output.read_bytes() == b"%PDF"
+    assert build("# A\n\nabc") == 2
+    assert build("# A\n\ndef") == 3
+    assert build("# A\n\ndef\n\n# B") == 5
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="shebang script")
+def test_build_pdf_resource_path(tmp_path: Path):
+    from panpdf.tools import build_pdf
+
+    engine = tmp_path / "engine"
+    engine.write_text(f"#!{sys.executable}\n{FAKE_ENGINE}")
+    engine.chmod(0o755)
+
+    image = tmp_path / "images" / "a.png"
+    image.parent.mkdir()
+    image.write_bytes(b"png")
+
+    output = tmp_path / "a.pdf"
+    build_dir = tmp_path / "build"
+    args = ["--output", output.as_posix(), f"--pdf-engine={engine}"]
+    args.append(f"--resource-path={image.parent.as_posix()}")
+    runs = build_dir / "a.runs"
+    doc = pf.convert_text("![](a.png)", standalone=True)
+
+    def build() -> int:
+        assert build_pdf(doc, build_dir, extra_args=args) == 0  # type: ignore
+        return len(runs.read_text())
+
+    n = build()
+    assert build() == n
+    mtime = build_dir.joinpath("a.pdf").stat().st_mtime_ns + 10**9
+    os.utime(image, ns=(mtime, mtime))
+    assert build() > n
+
+
+FAKE_BIBTEX = """\
+import os
+import sys
+from pathlib import Path
+
+log = Path(sys.argv[0]).with_suffix(".log")
+log.write_text(" ".join(sys.argv[1:]) + "\\n" + os.environ["TEXMFOUTPUT"])
+"""
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="shebang script")
+def test_build_pdf_natbib(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from panpdf.tools import build_pdf
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, script in [("engine", FAKE_ENGINE), ("bibtex", FAKE_BIBTEX)]:
+        path = bin_dir / name
+        path.write_text(f"#!{sys.executable}\n{script}")
+        path.chmod(0o755)
+
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    output = tmp_path / "a.pdf"
+    build_dir = tmp_path / "build"
+    args = ["--output", output.as_posix(), "--pdf-engine=engine", "--natbib"]
+    doc = pf.convert_text("# A\n\n[@a]", standalone=True)
+    assert build_pdf(doc, build_dir, extra_args=args) == 0  # type: ignore
+    aux, texmfoutput = bin_dir.joinpath("bibtex.log").read_text().splitlines()
+    assert aux == (build_dir / "a.aux").as_posix()
+    assert texmfoutput == build_dir.as_posix()
+    assert len(build_dir.joinpath("a.runs").read_text()) == 2
+
+
+def test_get_bibliography_tool():
+    from panpdf.tools import get_bibliography_tool
+
+    assert get_bibliography_tool([]) is None
+    assert get_bibliography_tool(["--natbib"]) == "bibtex"
+    assert get_bibliography_tool(["--biblatex"]) == "biber"
+
+
+def test_create_latex_args(tmp_path: Path):
+    from panpdf.tools import create_latex_args
+
+    path = tmp_path / "a.tex"
+    args = create_latex_args(path, engine_opts=["-shell-escape"])
+    assert args[0] == "pdflatex"
+    assert args[-2:] == ["-shell-escape", path.as_posix()]
+    assert f"-output-directory={tmp_path.as_posix()}" in args
+    assert not any(arg.startswith("-fmt") for arg in args)
+
+    args = create_latex_args(path, fmt=tmp_path / "x.fmt")
+    assert f"-fmt={(tmp_path / 'x').as_posix()}" in args
+
+
+TEX = """\\documentclass{article}
+\\usepackage{pgf}
+\\begin{document}
+A
+\\end{document}
+"""
+
+
+def test_get_format(fake_latex: Path, tmp_path: Path):
+    from panpdf.tools import get_format
+
+    log = fake_latex.with_suffix(".log")
+    path = get_format(TEX, engine=fake_latex.as_posix(), cache_dir=tmp_path)
+    assert path
+    assert path.parent == tmp_path / "formats"
+    assert "\\usepackage{pgf}" in path.read_text()
+    assert "&pdflatex mylatexformat.ltx" in log.read_text()
+
+    tex = TEX.replace("A", "B")
+    assert get_format(tex, engine=fake_latex.as_posix(), cache_dir=tmp_path) == path
+    assert len(log.read_text().splitlines()) == 1
+
+    tex = TEX.replace("pgf", "tikz")
+    assert get_format(tex, engine=fake_latex.as_posix(), cache_dir=tmp_path) != path
+    assert len(log.read_text().splitlines()) == 2
+
+    opts = ["-shell-escape"]
+    fmt = get_format(
+        TEX,
+        engine=fake_latex.as_posix(),
+        engine_opts=opts,
+        cache_dir=tmp_path,
+    )
+    assert fmt != path
+    assert len(log.read_text().splitlines()) == 3
+
+
+def test_get_engine_version(fake_latex: Path):
+    from panpdf.tools import get_engine_version
+
+    assert "Fake" in get_engine_version(fake_latex.as_posix())
+    assert get_engine_version("panpdf-no-such-engine") == ""
+
+
+def test_get_format_unsupported(tmp_path: Path):
+    from panpdf.tools import get_format
+
+    assert not get_format(TEX, engine="lualatex", cache_dir=tmp_path)
+    assert not get_format("abc", cache_dir=tmp_path)
+
+
+def test_build_pdf_precompile(
+    fake_latex: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    from panpdf.tools import build_pdf
+
+    monkeypatch.setenv("PANPDF_CACHE_DIR", tmp_path.as_posix())
+
+    output = tmp_path / "a.pdf"
+    args = ["--output", output.as_posix(), f"--pdf-engine={fake_latex}"]
+    doc = pf.convert_text("# A\n\nabc", standalone=True)
+    assert build_pdf(doc, tmp_path / "build", extra_args=args, precompile=True) == 0  # type: ignore
+    assert output.read_bytes() == b"%PDF"
+
+    ini, run = fake_latex.with_suffix(".log").read_text().splitlines()
+    assert "-ini" in ini
+    assert "-fmt=" in run
+    assert len(list((tmp_path / "formats").glob("*.fmt"))) == 1
+
+
+def test_build_pdf_precompile_cache_dir(fake_latex: Path, tmp_path: Path):
+    from panpdf.tools import build_pdf
+
+    output = tmp_path / "a.pdf"
+    args = ["--output", output.as_posix(), f"--pdf-engine={fake_latex}"]
+    doc = pf.convert_text("# A\n\nabc", standalone=True)
+    cache_dir = tmp_path / "cache"
+    kwargs = {"extra_args": args, "precompile": True, "cache_dir": cache_dir}
+    assert build_pdf(doc, tmp_path / "build", **kwargs) == 0  # type: ignore
+    assert len(list((cache_dir / "formats").glob("*.fmt"))) == 1
+
+
+def test_build_pdf_precompile_stale_format(fake_latex: Path, tmp_path: Path):
+    from panpdf.tools import build_pdf
+
+    output = tmp_path / "a.pdf"
+    args = ["--output", output.as_posix(), f"--pdf-engine={fake_latex}"]
+    kwargs = {"extra_args": args, "precompile": True, "cache_dir": tmp_path}
+    doc = pf.convert_text("# A\n\nabc", standalone=True)
+    assert build_pdf(doc, tmp_path / "build", **kwargs) == 0  # type: ignore
+    fmt = next((tmp_path / "formats").glob("*.fmt"))
+    fmt.write_text("stale")
+
+    doc = pf.convert_text("# A\n\ndef", standalone=True)
+    assert build_pdf(doc, tmp_path / "build", **kwargs) == 0  # type: ignore
+    assert not fmt.exists()
+
+    *_, failed, rerun = fake_latex.with_suffix(".log").read_text().splitlines()
+    assert "-fmt=" in failed
+    assert "-fmt=" not in rerun
+
+
+def test_pop_option():
+    from panpdf.tools import pop_option
+
+    args = ["--output", "a.pdf", "-s", "--output=b.pdf"]
+    assert pop_option(args, "--output") == ["a.pdf", "b.pdf"]
+    assert args == ["-s"]
+
+
+def test_get_pdf_engine():
+    from panpdf.tools import get_pdf_engine
+
+    assert get_pdf_engine([]) == ("pdflatex", [])
+    args = ["--defaults", "tests/examples/defaults.yaml"]
+    engine, opts = get_pdf_engine(args)
+    assert engine == "lualatex"
+    assert opts
+    assert args == ["--defaults", "tests/examples/defaults.yaml"]
+    args = [*args, "--pdf-engine", "xelatex", "--pdf-engine-opt=-a"]
+    assert get_pdf_engine(args) == ("xelatex", ["-a"])
+    assert args == ["--defaults", "tests/examples/defaults.yaml"]
+
+
 @pytest.mark.parametrize(
     ("text", "color"),
     [("Error", "red"), ("Warning", "yellow"), ("INFO", "gray50")],
@@ -0,0 +1,94 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from panpdf.watch import Watcher, iter_files, wait, watch_files
+
+
+def test_iter_files(tmp_path: Path):
+    (tmp_path / "a.md").touch()
+    (tmp_path / "b.txt").touch()
+    (tmp_path / ".c").mkdir()
+    (tmp_path / ".c" / "c.ipynb").touch()
+    (tmp_path / "d").mkdir()
+    (tmp_path / "d" / "d.py").touch()
+    paths = sorted(iter_files([tmp_path], [".md", ".py"]))
+    assert paths == [tmp_path / "a.md", tmp_path / "d" / "d.py"]
+
+
+def test_watcher(tmp_path: Path):
+    path = tmp_path / "a.md"
+    path.touch()
+    watcher = Watcher([tmp_path])
+    assert watcher.poll() == []
+
+    mtime = path.stat().st_mtime + 1
+    os.utime(path, (mtime, mtime))
+    assert watcher.poll() == [path]
+    assert watcher.poll() == []
+
+    (tmp_path / "b.md").touch()
+    path.unlink()
+    assert watcher.poll() == [path, tmp_path / "b.md"]
+
+
+def test_watcher_missing_file(tmp_path: Path):
+    path = tmp_path / "a.yaml"
+    watcher = Watcher([path])
+    assert watcher.mtimes == {}
+    path.touch()
+    assert watcher.poll() == [path]
+
+
+def test_wait(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    paths = [tmp_path / f"{k}.md" for k in range(3)]
+    watcher = Watcher([tmp_path])
+    it = iter(paths[1:])
+
+    def sleep(seconds: float) -> None:
+        if path := next(it, None):
+            path.touch()
+
+    monkeypatch.setattr(time, "sleep", sleep)
+    paths[0].touch()
+    assert wait(watcher, 0.1) == paths
+
+
+def test_watcher_ignore(tmp_path: Path):
+    paths = [tmp_path / "a.md", tmp_path / "b.ipynb"]
+    for path in paths:
+        path.touch()
+    watcher = Watcher([tmp_path])
+    for path in paths:
+        mtime = path.stat().st_mtime + 1
+        os.utime(path, (mtime, mtime))
+    watcher.ignore([paths[1]])
+    assert watcher.poll() == [paths[0]]
+
+
+def test_watch_files_edit_during_build(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    source = tmp_path / "a.md"
+    notebook = tmp_path / "a.ipynb"
+    source.touch()
+    notebook.touch()
+    builds = []
+
+    def build() -> list[Path]:
+        builds.append(len(builds))
+        for path in [source, notebook] if len(builds) == 1 else [notebook]:
+            mtime = path.stat().st_mtime + 1
+            os.utime(path, (mtime, mtime))
+        return [notebook]
+
+    def sleep(seconds: float) -> None:
+        if len(builds) > 1:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(time, "sleep", sleep)
+    watch_files(build, Watcher([tmp_path]), interval=0, debounce=0)
+    assert builds == [0, 1]